@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+
+from server import parse_file_core, grade_text_core_async, grade_and_feedback_core_async
+from rubric import compile_rubric
+from extraction import process_pool
+from results_store import get_results_store, result_record
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+# Graded submissions written to the results store per transaction
+RESULTS_BATCH_SIZE = 50
+
+# Submission discovery
+
+def collect_submissions(source: str) -> list:
+    """Returns the submissions found in a directory or listed in a manifest file.
+
+    A manifest can be .jsonl/.json (objects with "file_path" and optional "id"
+    and "student"), .csv (columns file_path[,id][,student]) or a plain text file
+    with one path per line.
+    Relative paths in a manifest are resolved against the manifest's folder.
+    """
+    if os.path.isdir(source):
+        submissions = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    submissions.append({"id": os.path.relpath(path, source), "file_path": path})
+        return sorted(submissions, key=lambda s: s["id"])
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    entries = []
+    with open(source, newline="", encoding="utf-8") as f:
+        if source.endswith(".jsonl"):
+            entries = [json.loads(line) for line in f if line.strip()]
+        elif source.endswith(".json"):
+            entries = json.load(f)
+        elif source.endswith(".csv"):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = [{"file_path": line.strip()} for line in f if line.strip()]
+
+    submissions = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"file_path": entry}
+        path = entry["file_path"]
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir, path)
+        submissions.append({"id": str(entry.get("id") or entry["file_path"]), "file_path": path,
+                            "student": entry.get("student")})
+    return submissions
+
+def load_completed_ids(output_path: str) -> set:
+    """Returns the ids that already have a successful result in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partially written last line behind
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+            else:
+                completed.discard(record.get("id"))
+    return completed
+
+def open_for_append(output_path: str):
+    """Opens the results file for appending, terminating any truncated last line."""
+    needs_newline = False
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    out = open(output_path, "a", encoding="utf-8")
+    if needs_newline:
+        out.write("\n")
+    return out
+
+def stage_error(stage: str, result):
+    """Returns an error message if a core function result signals failure."""
+    if isinstance(result, dict) and "error" in result:
+        return f"{stage}: {result['error']}"
+    if isinstance(result, str) and (result.startswith("Error") or result.startswith("Feedback generation failed")):
+        return f"{stage}: {result}"
+    return None
+
+# Pipeline
+
+async def grade_batch_async(source: str, rubric: str, output_path: str, concurrency: int = 8,
+                            parse_workers: int = None, include_feedback: bool = True,
+                            assignment: str = None, save_results: bool = True,
+                            index_plagiarism: bool = False, index_semantic: bool = False) -> dict:
+    """Parses submissions in a process pool and grades them over a bounded pool of async workers.
+
+    Each finished submission is appended to `output_path` as one JSON line, so an
+    interrupted run can be restarted and will skip submissions already graded.
+    Successful grades are also written to the results store under `assignment`
+    (by default the name of the source), RESULTS_BATCH_SIZE per transaction.
+    With `index_plagiarism` / `index_semantic` each graded submission is also added
+    to the plagiarism / semantic similarity index.
+    """
+    started = time.perf_counter()
+    submissions = collect_submissions(source)
+    completed = load_completed_ids(output_path)
+    pending = [s for s in submissions if s["id"] not in completed]
+    summary = {
+        "output_path": output_path,
+        "total": len(submissions),
+        "skipped": len(submissions) - len(pending),
+        "succeeded": 0,
+        "failed": 0,
+    }
+    if not pending:
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+
+    assignment = assignment or os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+    rubric_id = compile_rubric(rubric)["id"]
+    unsaved = []
+
+    async def save(force: bool = False):
+        if not save_results or not unsaved or (len(unsaved) < RESULTS_BATCH_SIZE and not force):
+            return
+        records = unsaved[:]
+        unsaved.clear()
+        try:
+            await asyncio.to_thread(get_results_store().add_many, records)
+        except Exception as e:
+            # The output file still has these results; a store outage shouldn't stop grading
+            summary["unsaved"] = summary.get("unsaved", 0) + len(records)
+            summary["store_error"] = f"store: {str(e)}"
+
+    loop = asyncio.get_running_loop()
+    parse_workers = parse_workers or os.cpu_count() or 1
+    # Bounded hand-off between stages keeps at most a few parsed texts in memory
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    with process_pool(parse_workers) as pool, open_for_append(output_path) as out:
+
+        async def parse_worker(submissions):
+            # Each parser hands its text over before taking the next submission, so at most
+            # parse_workers texts wait on a full queue however large the batch is
+            for submission in submissions:
+                begin = time.perf_counter()
+                try:
+                    text = await loop.run_in_executor(pool, parse_file_core, submission["file_path"])
+                except Exception as e:
+                    text = f"Error parsing file: {str(e)}"
+                await queue.put((submission, text, time.perf_counter() - begin))
+
+        async def parse_all():
+            submissions = iter(pending)
+            await asyncio.gather(*(parse_worker(submissions) for _ in range(parse_workers)))
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def grade_item(submission, text, record):
+            error = stage_error("parse", text)
+            if error:
+                return error
+            stage = "grade"
+            try:
+                if include_feedback:
+                    # One completion returns both the grade and the feedback
+                    grade = await grade_and_feedback_core_async(text, rubric)
+                    if "feedback" in grade:
+                        record["feedback"] = grade.pop("feedback")
+                else:
+                    grade = await grade_text_core_async(text, rubric)
+                record["grade"] = grade
+                error = stage_error("grade", grade)
+                if error:
+                    return error
+                stage = "index"
+                if index_plagiarism:
+                    from plagiarism_index import get_plagiarism_index
+                    # Shingle every graded submission so later ones can be matched against it
+                    await asyncio.to_thread(get_plagiarism_index().add, submission["id"], text)
+                if index_semantic:
+                    from semantic_index import get_semantic_index
+                    await asyncio.to_thread(get_semantic_index().add, submission["id"], text)
+            except Exception as e:
+                return f"{stage}: {str(e)}"
+            return None
+
+        async def llm_worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                submission, text, parse_seconds = item
+                record = {"id": submission["id"], "file_path": submission["file_path"]}
+                begin = time.perf_counter()
+                error = await grade_item(submission, text, record)
+                record["status"] = "error" if error else "ok"
+                if error:
+                    record["error"] = error
+                    summary["failed"] += 1
+                else:
+                    summary["succeeded"] += 1
+                    unsaved.append(result_record(record["grade"], record.get("feedback"), assignment,
+                                                 submission.get("student") or submission["id"], rubric_id,
+                                                 submission["id"], source=submission["file_path"]))
+                record["timings"] = {
+                    "parse_seconds": round(parse_seconds, 3),
+                    "llm_seconds": round(time.perf_counter() - begin, 3),
+                }
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                await save()
+
+        # If either stage fails outright (e.g. the output file can't be written) the other is cancelled
+        # rather than left waiting on the bounded queue
+        try:
+            async with asyncio.TaskGroup() as stages:
+                stages.create_task(parse_all())
+                for _ in range(concurrency):
+                    stages.create_task(llm_worker())
+        except ExceptionGroup as group:
+            raise group.exceptions[0]
+        await save(force=True)
+
+    summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+def grade_batch_core(source: str, rubric: str, output_path: str, concurrency: int = 8,
+                     parse_workers: int = None, include_feedback: bool = True,
+                     assignment: str = None, save_results: bool = True, index_plagiarism: bool = False,
+                     index_semantic: bool = False) -> dict:
+    """Synchronous entry point for grade_batch_async."""
+    try:
+        return asyncio.run(grade_batch_async(source, rubric, output_path, concurrency, parse_workers,
+                                             include_feedback, assignment, save_results, index_plagiarism,
+                                             index_semantic))
+    except Exception as e:
+        return {"error": f"Batch grading failed: {str(e)}"}
+
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a directory or manifest of submissions.")
+    parser.add_argument("source", help="Directory of PDF/DOCX files or a manifest (.jsonl, .json, .csv, .txt)")
+    parser.add_argument("--rubric", required=True, help="Rubric text or path to a file containing it")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent LLM workers")
+    parser.add_argument("--parse-workers", type=int, default=None, help="Processes used for parsing")
+    parser.add_argument("--no-feedback", action="store_true", help="Only grade, skip feedback generation")
+    parser.add_argument("--assignment", default=None, help="Assignment name results are stored under")
+    parser.add_argument("--no-store", action="store_true", help="Do not write results to the results store")
+    parser.add_argument("--index-plagiarism", action="store_true",
+                        help="Add graded submissions to the plagiarism index")
+    parser.add_argument("--index-semantic", action="store_true",
+                        help="Add graded submissions to the semantic similarity index")
+    args = parser.parse_args()
+
+    rubric = args.rubric
+    if os.path.isfile(rubric):
+        with open(rubric, encoding="utf-8") as f:
+            rubric = f.read()
+
+    summary = grade_batch_core(args.source, rubric, args.output, args.concurrency,
+                               args.parse_workers, not args.no_feedback, args.assignment, not args.no_store,
+                               args.index_plagiarism, args.index_semantic)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
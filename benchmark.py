@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+RESULTS_DIR = os.getenv("GRADER_BENCHMARK_DIR", ".benchmarks")
+# Pages per generated document for each corpus size
+CORPUS_SIZES = {"small": 2, "medium": 20, "large": 120}
+# A stage whose p95 latency grows by more than this factor is flagged as a regression
+REGRESSION_FACTOR = 1.2
+# Seconds between resident-memory samples while a stage runs
+RSS_SAMPLE_SECONDS = 0.01
+
+BENCHMARK_RUBRIC = """Content (40%): The assignment should demonstrate a thorough understanding of the topic.
+Structure (20%): The assignment should be well-organized with a clear introduction, body, and conclusion.
+Analysis (30%): The assignment should include critical analysis backed by evidence.
+Grammar & Style (10%): The assignment should be free of grammatical errors and use appropriate academic tone."""
+
+_VOCABULARY = ("analysis evidence argument historical economic policy framework structure methodology "
+               "interpretation significant consequently furthermore theoretical perspective empirical "
+               "development society research conclusion introduction industrial revolution literature "
+               "the of and to in that is was for on with as by this which it from").split()
+
+# Corpus generation
+
+def _paragraph(rng: random.Random, sentences: int = 6) -> str:
+    return " ".join(
+        " ".join(rng.choice(_VOCABULARY) for _ in range(rng.randint(10, 22))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+def generate_pdf(path: str, pages: int, seed: int = 0):
+    import pymupdf
+
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 40), "HIST 210 Final Essay", fontsize=9)
+        page.insert_textbox(pymupdf.Rect(72, 72, 540, 740), "\n\n".join(_paragraph(rng) for _ in range(4)), fontsize=10)
+        page.insert_text((300, 780), f"Page {number + 1} of {pages}", fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def generate_docx(path: str, pages: int, seed: int = 0):
+    import docx
+
+    rng = random.Random(seed)
+    doc = docx.Document()
+    for _ in range(pages * 4):
+        doc.add_paragraph(_paragraph(rng))
+    doc.save(path)
+
+def generate_corpus(directory: str, sizes: list, per_size: int = 2) -> list:
+    """Writes PDF and DOCX documents of each size and returns their descriptions."""
+    corpus = []
+    for size in sizes:
+        for index in range(per_size):
+            for kind, generate in (("pdf", generate_pdf), ("docx", generate_docx)):
+                path = os.path.join(directory, f"{size}_{index}.{kind}")
+                generate(path, CORPUS_SIZES[size], seed=index)
+                corpus.append({"path": path, "size": size, "kind": kind, "bytes": os.path.getsize(path)})
+    return corpus
+
+# Measurement
+
+def process_peak_rss_mb() -> float:
+    """Peak resident memory of this process and its finished children so far (ru_maxrss is KiB on Linux).
+
+    This is a high-water mark for the whole run, so it never drops between stages.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(max(own, children) / scale, 1)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _tree_rss_bytes(pid: int) -> int:
+    """Current resident memory of a process and all its descendants, read from /proc."""
+    with open(f"/proc/{pid}/statm") as f:
+        total = int(f.read().split()[1]) * _PAGE_SIZE
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children = [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+        for child in children:
+            try:
+                total += _tree_rss_bytes(child)
+            except (OSError, ValueError, IndexError):
+                # Exited between listing and reading
+                pass
+    return total
+
+class RssSampler:
+    """Samples the resident memory of this process and its children from a thread while a stage runs.
+
+    peak_mb is the stage's own peak, or None where /proc is not available.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak_mb = None
+        self._peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        try:
+            self._peak = max(self._peak, _tree_rss_bytes(os.getpid()))
+        except (OSError, ValueError, IndexError):
+            pass
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if os.path.exists(f"/proc/{os.getpid()}/statm"):
+            self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            self.peak_mb = round(self._peak / (1024 * 1024), 1)
+
+def summarize(latencies: list, wall_seconds: float, errors: int) -> dict:
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+    }
+
+def run_stage(calls: list, concurrency: int, stubs: list) -> dict:
+    """Runs zero-argument callables with the given concurrency and summarizes their latencies."""
+    from server import _is_error
+
+    for stub in stubs:
+        stub.reset_counters()
+
+    def timed(call):
+        begin = time.perf_counter()
+        try:
+            failed = _is_error(call())
+        except Exception:
+            failed = True
+        return time.perf_counter() - begin, failed
+
+    begin = time.perf_counter()
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, calls))
+    wall = time.perf_counter() - begin
+
+    result = summarize([seconds for seconds, _ in outcomes], wall, sum(failed for _, failed in outcomes))
+    result["peak_rss_mb"] = rss.peak_mb
+    result["process_peak_rss_mb"] = process_peak_rss_mb()
+    upstream = {}
+    for stub in stubs:
+        for counter, value in stub.counters.items():
+            upstream[counter] = upstream.get(counter, 0) + value
+    result["upstream"] = upstream
+    return result
+
+def run_benchmark(sizes: list, per_size: int = 2, iterations: int = 3, concurrency: int = 4,
+                  latency_ms: float = 200, jitter_ms: float = 50, error_rate: float = 0.0, seed: int = 0) -> dict:
+    """Benchmarks start-up, parsing, plagiarism search, grading and feedback against local stand-in servers."""
+    from stubs import StubOpenAI, StubGoogleSearch
+
+    openai_stub = StubOpenAI(latency_ms, jitter_ms, error_rate, seed).start()
+    google_stub = StubGoogleSearch(latency_ms, jitter_ms, error_rate, seed + 1).start()
+    # server reads these at import time, so they are set before it is first imported
+    os.environ.update({
+        "OPENAI_BASE_URL": openai_stub.base_url,
+        "OPENAI_API_KEY": "benchmark",
+        "GOOGLE_API_KEY": "benchmark",
+        "GOOGLE_CX": "benchmark",
+        "GOOGLE_SEARCH_URL": google_stub.search_url,
+        # The client-side rate limit would otherwise dominate the plagiarism numbers
+        "GOOGLE_SEARCH_QPM": "1000000",
+        "GRADER_CACHE_DISABLED": "1",
+    })
+    from server import parse_file_core, check_plagiarism_core, grade_text_core, generate_feedback_core
+    from startup import import_profile
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = generate_corpus(directory, sizes, per_size)
+            texts = {}
+            # Cold start: a fresh interpreter importing the server
+            stages = {"startup/import": run_stage([lambda: import_profile("server")] * iterations, 1, [])}
+            for size in sizes:
+                documents = [d for d in corpus if d["size"] == size]
+                parse_calls = [lambda d=d: parse_file_core(d["path"], use_cache=False)
+                               for d in documents for _ in range(iterations)]
+                stages[f"parse/{size}"] = run_stage(parse_calls, concurrency, [])
+                texts[size] = [parse_file_core(d["path"], use_cache=False) for d in documents]
+
+            for size in sizes:
+                samples = texts[size] * iterations
+                stage_calls = {
+                    "plagiarism": ([lambda t=t: check_plagiarism_core(t, use_cache=False) for t in samples], [google_stub]),
+                    "grade": ([lambda t=t: grade_text_core(t, BENCHMARK_RUBRIC, use_cache=False) for t in samples], [openai_stub]),
+                    "feedback": ([lambda t=t: generate_feedback_core(t, BENCHMARK_RUBRIC, use_cache=False) for t in samples], [openai_stub]),
+                }
+                for stage, (calls, stubs) in stage_calls.items():
+                    stages[f"{stage}/{size}"] = run_stage(calls, concurrency, stubs)
+    finally:
+        openai_stub.stop()
+        google_stub.stop()
+
+    return {
+        "config": {"sizes": sizes, "per_size": per_size, "iterations": iterations, "concurrency": concurrency,
+                   "latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate, "seed": seed},
+        "stages": stages,
+    }
+
+# Result storage
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def save_results(results: dict, directory: str = RESULTS_DIR) -> str:
+    """Writes the run to <commit>.json and appends it to history.jsonl; returns the file path."""
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    results["commit"] = commit
+    results["dirty"] = bool(_git("status", "--porcelain", "--untracked-files=no"))
+    results["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{commit}{'-dirty' if results['dirty'] else ''}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    with open(os.path.join(directory, "history.jsonl"), "a") as f:
+        f.write(json.dumps(results) + "\n")
+    return path
+
+def load_baseline(results: dict, directory: str = RESULTS_DIR):
+    """Returns the most recent earlier run from another commit with the same configuration."""
+    path = os.path.join(directory, "history.jsonl")
+    if not os.path.exists(path):
+        return None
+    baseline = None
+    with open(path) as f:
+        for line in f:
+            run = json.loads(line)
+            if run.get("commit") != results.get("commit") and run.get("config") == results["config"]:
+                baseline = run
+    return baseline
+
+def compare(results: dict, baseline: dict) -> list:
+    """Returns (stage, previous p95, current p95, ratio) for stages that slowed beyond REGRESSION_FACTOR."""
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if not previous or not previous["p95_ms"]:
+            continue
+        ratio = current["p95_ms"] / previous["p95_ms"]
+        if ratio > REGRESSION_FACTOR:
+            regressions.append((stage, previous["p95_ms"], current["p95_ms"], round(ratio, 2)))
+    return regressions
+
+def print_report(results: dict, baseline: dict = None):
+    header = f"{'stage':<18}{'calls':>6}{'err':>5}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'peak MB':>9}{'tok in':>9}{'tok out':>9}"
+    print(header)
+    print("-" * len(header))
+    for stage, r in results["stages"].items():
+        upstream = r["upstream"]
+        # Per-stage peak; without /proc only the process-wide high-water mark is known, marked with ^
+        peak = r["peak_rss_mb"] if r.get("peak_rss_mb") is not None else f"{r['process_peak_rss_mb']}^"
+        print(f"{stage:<18}{r['calls']:>6}{r['errors']:>5}{r['throughput_per_s']:>9}{r['p50_ms']:>9}"
+              f"{r['p95_ms']:>9}{r['p99_ms']:>9}{peak:>9}"
+              f"{upstream.get('prompt_tokens', 0):>9}{upstream.get('completion_tokens', 0):>9}")
+    if baseline is None:
+        print("\nNo earlier run with the same configuration to compare against.")
+        return
+    regressions = compare(results, baseline)
+    print(f"\nCompared with {baseline['commit']} ({baseline['timestamp']}):")
+    if not regressions:
+        print("No p95 regressions.")
+    for stage, before, after, ratio in regressions:
+        print(f"REGRESSION {stage}: p95 {before} ms -> {after} ms (x{ratio})")
+
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the grader core against local stand-in servers.")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(CORPUS_SIZES))
+    parser.add_argument("--per-size", type=int, default=2, help="Documents of each size and format")
+    parser.add_argument("--iterations", type=int, default=3, help="Times each document goes through each stage")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=200, help="Mean stand-in server latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stand-in requests answered with 429/500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true", help="Print results without storing them")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.per_size, args.iterations, args.concurrency,
+                            args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    if args.no_save:
+        print_report(results)
+        return
+    path = save_results(results)
+    baseline = load_baseline(results)
+    print_report(results, baseline)
+    print(f"\nSaved to {path}")
+    # A non-zero exit lets CI fail on regressions
+    if baseline and compare(results, baseline):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
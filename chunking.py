@@ -0,0 +1,123 @@
+import re
+import zlib
+from functools import lru_cache
+
+# Headings such as "1. Introduction", "## Methods" or an all-caps line start a new section
+_HEADING_RE = re.compile(r"^(#{1,6}\s+\S.*|\d+(\.\d+)*\.?\s+[A-Z].{0,80}|[A-Z][A-Z0-9 ,:&-]{2,80})$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# About one paragraph in this many ends a section in split_sections
+SECTION_BOUNDARY_EVERY = 4
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The BPE file is downloaded on first use; offline hosts fall back to estimates
+        return None
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Counts tokens with the model's local tokenizer, estimating if tiktoken is unavailable."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def _paragraphs(text: str) -> list:
+    """Splits text into paragraphs, keeping headings as their own paragraphs."""
+    paragraphs = []
+    for block in re.split(r"\n\s*\n", text):
+        current = []
+        for line in block.splitlines():
+            if _HEADING_RE.match(line.strip()) and current:
+                paragraphs.append("\n".join(current))
+                current = []
+            current.append(line)
+        if current:
+            paragraphs.append("\n".join(current))
+    return [p.strip() for p in paragraphs if p.strip()]
+
+def _split_oversized(paragraph: str, max_tokens: int, model: str) -> list:
+    """Splits a paragraph that exceeds the budget on sentences, then on words."""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(paragraph):
+        candidate = f"{current} {sentence}".strip()
+        if count_tokens(candidate, model) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if count_tokens(sentence, model) <= max_tokens:
+            current = sentence
+            continue
+        words = sentence.split()
+        # Rough words-per-token ratio keeps a single oversized sentence under budget
+        step = max(int(max_tokens * 0.7), 1)
+        pieces.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+        current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_text(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> list:
+    """Splits text into chunks of at most max_tokens, breaking on section and paragraph boundaries."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph in _paragraphs(text):
+        tokens = count_tokens(paragraph, model)
+        if tokens > max_tokens:
+            pieces = _split_oversized(paragraph, max_tokens, model)
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece, model)
+            starts_section = bool(_HEADING_RE.match(piece.splitlines()[0].strip()))
+            # Prefer breaking before a heading once the chunk is reasonably full
+            if current and (current_tokens + piece_tokens > max_tokens
+                            or (starts_section and current_tokens > max_tokens // 2)):
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def split_sections(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> list:
+    """Splits text into sections of at most max_tokens whose boundaries depend only on nearby content.
+
+    Once a section holds a quarter of the budget, it ends before a heading or
+    after a paragraph whose hash selects it as a boundary. Unlike split_text,
+    editing a paragraph changes only the sections around it; the boundaries of
+    the rest of the document stay where they were.
+    """
+    sections = []
+    current = []
+    current_tokens = 0
+    for paragraph in _paragraphs(text):
+        tokens = count_tokens(paragraph, model)
+        pieces = _split_oversized(paragraph, max_tokens, model) if tokens > max_tokens else [paragraph]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece, model)
+            starts_section = bool(_HEADING_RE.match(piece.splitlines()[0].strip()))
+            if current and (current_tokens + piece_tokens > max_tokens
+                            or (starts_section and current_tokens >= max_tokens // 4)):
+                sections.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+            if current_tokens >= max_tokens // 4 and zlib.crc32(piece.encode("utf-8")) % SECTION_BOUNDARY_EVERY == 0:
+                sections.append("\n\n".join(current))
+                current, current_tokens = [], 0
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
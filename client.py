@@ -1,8 +1,8 @@
 import streamlit as st
 import requests
 import json
+import io
 import os
-import tempfile
 import time
 
 # Set page config must be the first Streamlit command
@@ -15,13 +15,39 @@ st.set_page_config(
 # Sidebar - API Configuration (defined early to ensure keys are available)
 with st.sidebar.expander("API Configuration", expanded=True):
     st.write("Configure your API keys here.")
-    openai_key = st.text_input("OpenAI API Key", type="password", key="openai_api_key", help="Required for grading and feedback.")
+    openai_key = st.text_input("OpenAI API Key", type="password", key="openai_api_key", help="Used for grading and feedback.")
+    gemini_key = st.text_input("Gemini API Key", type="password", key="gemini_api_key", help="Optional; used for grading and feedback, or as a fallback when OpenAI fails.")
     google_key = st.text_input("Google API Key", type="password", key="google_api_key", help="Required for plagiarism check.")
     google_cx = st.text_input("Google Search Engine ID", type="password", key="google_cx", help="Required for plagiarism check.")
     
     if st.button("Save Settings"):
         st.success("Settings available for current session.")
 
+@st.cache_resource
+def load_core_functions():
+    """Imports the server module once per process and returns its core functions by tool name."""
+    import server
+
+    return {
+        "parse_file": server.parse_file_core,
+        "parse_document": server.parse_document_core,
+        "check_plagiarism": server.check_plagiarism_core,
+        "grade_text": server.grade_text_core,
+        "generate_feedback": server.generate_feedback_core,
+        "grade_and_feedback": server.grade_and_feedback_core,
+        "grade_submission": server.grade_submission_core,
+    }
+
+@st.cache_resource
+def start_prewarm():
+    """Imports the server and the libraries its tools load lazily on a background thread, once per process."""
+    from startup import prewarm, HEAVY_MODULES
+
+    return prewarm(("server",) + HEAVY_MODULES)
+
+if os.getenv("GRADER_PREWARM", "").lower() in ("1", "true", "yes"):
+    start_prewarm()
+
 # Function to call Server Core Functions directly
 def call_tool_direct(tool_name, arguments):
     """Calls a core function from the server module directly."""
@@ -29,30 +55,61 @@ def call_tool_direct(tool_name, arguments):
         # Set environment variables for the server tools to use
         if st.session_state.get("openai_api_key"):
             os.environ["OPENAI_API_KEY"] = st.session_state.get("openai_api_key")
+        if st.session_state.get("gemini_api_key"):
+            os.environ["GEMINI_API_KEY"] = st.session_state.get("gemini_api_key")
         if st.session_state.get("google_api_key"):
             os.environ["GOOGLE_API_KEY"] = st.session_state.get("google_api_key")
         if st.session_state.get("google_cx"):
             os.environ["GOOGLE_CX"] = st.session_state.get("google_cx")
 
-        # Import server core functions
-        from server import parse_file_core, check_plagiarism_core, grade_text_core, generate_feedback_core
-        
-        if tool_name == "parse_file":
-            return parse_file_core(**arguments)
-        elif tool_name == "check_plagiarism":
-            return check_plagiarism_core(**arguments)
-        elif tool_name == "grade_text":
-            return grade_text_core(**arguments)
-        elif tool_name == "generate_feedback":
-            return generate_feedback_core(**arguments)
-        else:
+        core_function = load_core_functions().get(tool_name)
+        if core_function is None:
             return f"Error: Tool '{tool_name}' not found."
+        return core_function(**arguments)
 
     except ImportError:
         return "Error: Could not import 'server.py'. Make sure it exists."
     except Exception as e:
         return f"Error calling tool '{tool_name}': {str(e)}"
 
+# Background workers shared by every session of this Streamlit server
+@st.cache_resource
+def ensure_workers():
+    """Starts the grading worker pool unless workers holding this server's job key are already running."""
+    from jobs import get_job_queue, start_workers
+    if get_job_queue().live_workers() == 0:
+        return start_workers()
+    return []
+
+@st.fragment(run_every=1.0)
+def show_job_progress():
+    """Polls the active grading job and shows progress per stage."""
+    from jobs import get_job_queue
+    job = get_job_queue().get(st.session_state['job_id'])
+    if job is None:
+        st.warning("Grading job not found.")
+        st.session_state.pop('job_id', None)
+        return
+
+    st.markdown("**Grading progress**")
+    icons = {"queued": "⏳", "running": "🔄", "done": "✅", "error": "❌"}
+    if not job['stages']:
+        st.write("⏳ Waiting for a worker...")
+    for stage, info in job['stages'].items():
+        seconds = f" ({info['seconds']}s)" if 'seconds' in info else ""
+        st.write(f"{icons.get(info.get('status'), '')} {stage.replace('_', ' ').title()}{seconds}")
+
+    if job['status'] in ("done", "failed"):
+        if job['status'] == "failed":
+            st.session_state['grade_results'] = {"error": job['error']}
+        else:
+            for key, value in job['result'].items():
+                st.session_state[key] = value
+        st.session_state['job_finished'] = job['status']
+        st.session_state.pop('job_id', None)
+        st.query_params.pop("job", None)
+        st.rerun()
+
 # Main title
 st.title("📝 Assignment Grader")
 st.markdown("Upload assignments and grade them automatically with AI")
@@ -64,6 +121,10 @@ Upload assignments in PDF or DOCX format, set your grading rubric,
 and get instant AI-powered grades with detailed feedback.
 """)
 
+# A reload loses session state; the job id in the URL lets the page pick its job up again
+if 'job_id' not in st.session_state and st.query_params.get("job"):
+    st.session_state['job_id'] = st.query_params["job"]
+
 # Create tabs
 tab1, tab2, tab3 = st.tabs(["Upload Assignment", "Grade Assignment", "Results"])
 
@@ -75,37 +136,42 @@ with tab1:
     uploaded_file = st.file_uploader("Choose a file", type=['pdf', 'docx'])
 
     if uploaded_file is not None:
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            file_path = tmp_file.name
-
-        st.session_state['file_path'] = file_path
-        st.session_state['file_name'] = uploaded_file.name
-
         # Parse the document
         if st.button("Process Document"):
             with st.spinner("Processing document..."):
-                result = call_tool_direct("parse_file", {"file_path": file_path})
-
-                if result is None:
-                    st.error("Failed to process document. Check server connection.")
-                elif isinstance(result, str) and result.startswith("Error"):
-                     st.error(result)
-                elif isinstance(result, str):
-                    # If result is a string, it's either the document text or an error message
-                    st.session_state['document_text'] = result
-                    st.success(f"Document processed successfully!")
-                    st.info(f"Document contains {len(result.split())} words.")
-
-                    # Show a preview
-                    with st.expander("Document Preview"):
-                        st.text(result[:1000] + ("..." if len(result) > 1000 else ""))
-                else:        
-                    # If result is a dict (unexpected for parse_file but possible if error dict)
-                    st.session_state['document_text'] = str(result)
-                    st.success(f"Document processed!")
-                    st.json(result)
+                # The upload is streamed into the document store; only its handle stays in the session
+                from documents import get_document_store
+                try:
+                    uploaded_file.seek(0)
+                    document_id = get_document_store().put(uploaded_file, os.path.splitext(uploaded_file.name)[1])
+                except Exception as e:
+                    document_id = None
+                    st.error(f"Error storing upload: {str(e)}")
+
+                if document_id:
+                    # Pages stream in from the extractor, so show how far it has got
+                    progress = st.empty()
+                    result = call_tool_direct("parse_document", {
+                        "document_id": document_id,
+                        "on_chunk": lambda chunk: progress.text(f"Extracted page {chunk['page']}...")
+                    })
+                    progress.empty()
+
+                    if result is None:
+                        st.error("Failed to process document. Check server connection.")
+                    elif isinstance(result, str):
+                        st.error(result)
+                    elif 'error' in result:
+                        st.error(result['error'])
+                    else:
+                        st.session_state['document_id'] = result['document_id']
+                        st.session_state['file_name'] = uploaded_file.name
+                        st.success(f"Document processed successfully!")
+                        st.info(f"Document contains {result['words']} words.")
+
+                        # Show a preview
+                        with st.expander("Document Preview"):
+                            st.text(result['preview'] + ("..." if result['characters'] > len(result['preview']) else ""))
 
 # Tab 2: Grade Assignment
 with tab2:
@@ -126,59 +192,64 @@ Grammar & Style (10%): The assignment should be free of grammatical errors and u
     # Plagiarism check option
     check_plagiarism_option = st.checkbox("Check for plagiarism", value=True)
 
-    if 'document_text' in st.session_state and st.button("Grade Assignment"):
+    # Grade and feedback in a single model call unless the user opts out
+    combined_option = st.checkbox("Generate grade and feedback in one request", value=True,
+                                  help="Sends the assignment once instead of twice, halving token cost and latency.")
+
+    if 'document_id' in st.session_state and st.button("Grade Assignment"):
         # Store rubric in session
         st.session_state['rubric'] = rubric
         
         # Validation
-        if not st.session_state.get("openai_api_key"):
-            st.error("Please enter your OpenAI API Key in the sidebar.")
+        if not st.session_state.get("openai_api_key") and not st.session_state.get("gemini_api_key"):
+            st.error("Please enter your OpenAI or Gemini API Key in the sidebar.")
         else:
-            with st.spinner("Grading in progress..."):
-                # Optional plagiarism check
-                if check_plagiarism_option:
-                    if not st.session_state.get("google_api_key") or not st.session_state.get("google_cx"):
-                        st.warning("Skipping plagiarism check: Google API Key or Search Engine ID missing.")
-                        st.session_state['plagiarism_results'] = None
-                    else:
-                        st.info("Checking for plagiarism...")
-                        plagiarism_results = call_tool_direct("check_plagiarism", {"text": st.session_state['document_text']})
-                        st.session_state['plagiarism_results'] = plagiarism_results
-                        if plagiarism_results is None:
-                            st.warning("Plagiarism check failed or returned no results.")
-
-                # Generate grade
-                st.info("Generating grade...")
-                grade_results = call_tool_direct("grade_text", {
-                    "text": st.session_state['document_text'],
-                    "rubric": rubric
-                })        
-                st.session_state['grade_results'] = grade_results
-                
-                # Check for error in grade results
-                if isinstance(grade_results, dict) and 'error' in grade_results:
-                     st.error(f"Grading error: {grade_results['error']}")
-                elif grade_results is None:
-                    st.warning("Grade generation failed or returned no results.")
-
-                # Generate feedback
-                st.info("Generating feedback...")
-                feedback = call_tool_direct("generate_feedback", {
-                    "text": st.session_state['document_text'],
-                    "rubric": rubric
-                })    
-                st.session_state['feedback'] = feedback
-                
-                if isinstance(feedback, str) and feedback.startswith("Error"):
-                     st.error(feedback)
-                elif feedback is None:
-                    st.warning("Feedback generation failed or returned no results.")
+            # Optional plagiarism check
+            if check_plagiarism_option and (not st.session_state.get("google_api_key") or not st.session_state.get("google_cx")):
+                st.warning("Skipping plagiarism check: Google API Key or Search Engine ID missing.")
+                check_plagiarism_option = False
 
-                if (grade_results and 'error' not in grade_results) or (feedback and not feedback.startswith("Error")):
-                    st.success("Grading completed!")
-                    st.balloons()
+            # Grading runs in the shared worker pool so reruns and other users never wait on it
+            ensure_workers()
+            from jobs import get_job_queue
+            job_id = get_job_queue().submit("grade", {
+                "document_id": st.session_state['document_id'],
+                "rubric": rubric,
+                "file_name": st.session_state.get('file_name'),
+                "check_plagiarism": check_plagiarism_option,
+                "combined": combined_option,
+            }, credentials={
+                "OPENAI_API_KEY": st.session_state.get("openai_api_key"),
+                "GEMINI_API_KEY": st.session_state.get("gemini_api_key"),
+                "GOOGLE_API_KEY": st.session_state.get("google_api_key"),
+                "GOOGLE_CX": st.session_state.get("google_cx"),
+            })
+            for key in ('grade_results', 'feedback', 'plagiarism_results'):
+                st.session_state.pop(key, None)
+            st.session_state['job_id'] = job_id
+            st.query_params["job"] = job_id
 
-    elif 'document_text' not in st.session_state:
+    if st.session_state.get('job_id'):
+        show_job_progress()
+    elif st.session_state.pop('job_finished', None) == "done":
+        grade_results = st.session_state.get('grade_results')
+        feedback = st.session_state.get('feedback')
+
+        # Check for error in grade results
+        if isinstance(grade_results, dict) and 'error' in grade_results:
+             st.error(f"Grading error: {grade_results['error']}")
+        elif grade_results is None:
+            st.warning("Grade generation failed or returned no results.")
+
+        if isinstance(feedback, str) and feedback.startswith("Error"):
+             st.error(feedback)
+        elif feedback is None:
+            st.warning("Feedback generation failed or returned no results.")
+
+        if (grade_results and 'error' not in grade_results) or (feedback and not feedback.startswith("Error")):
+            st.success("Grading completed!")
+            st.balloons()
+    elif 'document_id' not in st.session_state and not st.session_state.get('job_id'):
         st.info("Please upload and process a document first in the 'Upload Assignment' tab.")
 
 # Tab 3: Results
@@ -238,10 +309,32 @@ with tab3:
 
         # Export options
         st.subheader("Export Options")
-        if st.button("Export to PDF"):
-            st.info("PDF export functionality would go here")
+        results = st.session_state.get('grade_results')
+        if isinstance(results, dict) and results and 'error' not in results:
+            from results_store import export_records, get_results_store, result_record
+            from rubric import compile_rubric
+
+            st.session_state.setdefault('student_name', os.path.splitext(st.session_state['file_name'])[0])
+            col1, col2 = st.columns(2)
+            assignment_name = col1.text_input("Assignment", key="assignment_name")
+            student_name = col2.text_input("Student", key="student_name")
+            rubric_id = compile_rubric(st.session_state['rubric'])["id"] if st.session_state.get('rubric') else None
+            record = result_record(results, st.session_state.get('feedback'), assignment_name, student_name,
+                                   rubric_id, st.session_state.get('document_id'),
+                                   st.session_state.get('plagiarism_results'), source=st.session_state['file_name'])
 
-        if st.button("Save to Database"):
-            st.info("Database save functionality would go here")
+            report = io.BytesIO()
+            export_records([record], report, "pdf")
+            st.download_button("Export to PDF", report.getvalue(), mime="application/pdf",
+                               file_name=f"{os.path.splitext(st.session_state['file_name'])[0]}_grade.pdf")
+
+            if st.button("Save to Database"):
+                if not assignment_name.strip() or not student_name.strip():
+                    st.error("Enter the assignment and student names to save this result.")
+                else:
+                    result_id = get_results_store().add(record)
+                    st.success(f"Saved as result #{result_id}.")
+        else:
+            st.info("Only successful grades can be exported or saved.")
     else:
         st.info("No grading results available. Please upload and grade an assignment first.")
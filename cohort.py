@@ -0,0 +1,110 @@
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from batch import collect_submissions
+from server import parse_file_core
+from extraction import process_pool
+
+NGRAM_SIZE = 3
+NUM_FEATURES = 1 << 20
+
+_WORD_RE = re.compile(r"\w+")
+
+def hashed_ngram_matrix(texts: list, ngram_size: int = NGRAM_SIZE, num_features: int = NUM_FEATURES):
+    """Builds an L2-normalized sparse TF-IDF matrix of hashed word n-grams, one row per text."""
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in texts:
+        words = _WORD_RE.findall(text.lower())
+        grams = Counter(
+            zlib.crc32(" ".join(words[i:i + ngram_size]).encode("utf-8")) % num_features
+            for i in range(max(len(words) - ngram_size + 1, 0))
+        )
+        indices.extend(grams.keys())
+        counts.extend(grams.values())
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+        shape=(len(texts), num_features),
+    )
+    matrix.sum_duplicates()
+
+    # Smoothed IDF as in scikit-learn, then sublinear TF to damp repeated phrases
+    doc_freq = np.bincount(matrix.indices, minlength=num_features)
+    idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+    matrix.data = np.log1p(matrix.data) * idf[matrix.indices]
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+def similar_pairs(matrix, threshold: float = 0.5, block_size: int = 256):
+    """Returns (rows, cols, scores) of all pairs i < j with cosine similarity >= threshold.
+
+    The similarity matrix is computed `block_size` rows at a time, so memory stays
+    at block_size x n no matter how large the cohort is.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    transposed = matrix.T.tocsc()
+    rows, cols, scores = [], [], []
+    for start in range(0, matrix.shape[0], block_size):
+        block = (matrix[start:start + block_size] @ transposed).toarray()
+        local_rows, block_cols = np.nonzero(block >= threshold)
+        block_rows = local_rows + start
+        upper = block_cols > block_rows
+        rows.append(block_rows[upper])
+        cols.append(block_cols[upper])
+        scores.append(block[local_rows[upper], block_cols[upper]])
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+def collusion_groups(count: int, rows, cols) -> list:
+    """Groups documents connected by suspicious pairs into clusters of two or more."""
+    graph = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(count, count))
+    _, labels = connected_components(graph, directed=False)
+    sizes = np.bincount(labels)
+    groups = [np.flatnonzero(labels == label).tolist() for label in np.flatnonzero(sizes > 1)]
+    return sorted(groups, key=len, reverse=True)
+
+def cohort_similarity_core(source: str, top_k: int = 20, threshold: float = 0.5,
+                           block_size: int = 256, parse_workers: int = None) -> dict:
+    """Compares every submission in a directory or manifest against every other one."""
+    try:
+        submissions = collect_submissions(source)
+        with process_pool(parse_workers) as pool:
+            texts = list(pool.map(parse_file_core, [s["file_path"] for s in submissions]))
+
+        failed = [s["id"] for s, text in zip(submissions, texts) if text.startswith("Error")]
+        kept = [(s, text) for s, text in zip(submissions, texts) if not text.startswith("Error")]
+        ids = [s["id"] for s, _ in kept]
+        if len(kept) < 2:
+            return {"submissions": len(kept), "failed": failed, "threshold": threshold, "suspicious_pairs": 0,
+                    "pairs": [], "clusters": []}
+
+        matrix = hashed_ngram_matrix([text for _, text in kept])
+        rows, cols, scores = similar_pairs(matrix, threshold, block_size)
+
+        order = np.argsort(-scores)[:top_k]
+        pairs = [
+            {"a": ids[rows[i]], "b": ids[cols[i]], "similarity": round(float(scores[i]), 4)}
+            for i in order
+        ]
+        clusters = [[ids[i] for i in group] for group in collusion_groups(len(ids), rows, cols)]
+        return {
+            "submissions": len(ids),
+            "failed": failed,
+            "threshold": threshold,
+            "suspicious_pairs": int(len(scores)),
+            "pairs": pairs,
+            "clusters": clusters,
+        }
+    except Exception as e:
+        return {"error": f"Cohort similarity failed: {str(e)}"}
@@ -0,0 +1,83 @@
+import math
+import re
+from collections import Counter
+
+from chunking import count_tokens
+
+# Lines this close to the top or bottom of a page are checked for running headers and footers
+PAGE_EDGE_LINES = 3
+# A page-edge line is boilerplate when it recurs on at least this share of pages
+BOILERPLATE_MIN_SHARE = 0.5
+BOILERPLATE_MAX_LENGTH = 100
+# A references heading is only trusted in the last part of the document
+REFERENCES_MIN_POSITION = 0.5
+
+PAGE_NUMBER_RE = re.compile(r"^(page\s*)?[-–—(\[]?\s*\d{1,4}\s*[-–—)\]]?(\s*(of|/)\s*\d{1,4})?$", re.IGNORECASE)
+_REFERENCES_RE = re.compile(r"^(references|bibliography|works cited|sources|reference list)\s*:?$", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"[ \t ]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+def line_signature(line: str) -> str:
+    """Normalizes a line so headers that differ only in their page number compare equal."""
+    return _DIGITS_RE.sub("#", line.lower())
+
+def _edge_indexes(lines: list) -> set:
+    """Returns the indexes of the first and last few non-empty lines of a page.
+
+    Short pages contribute fewer lines so that a page is never mostly edge.
+    """
+    filled = [i for i, line in enumerate(lines) if line]
+    depth = min(PAGE_EDGE_LINES, len(filled) // 4)
+    if not depth:
+        return set()
+    return set(filled[:depth] + filled[-depth:])
+
+def compact_text(text: str, trim_references: bool = False, model: str = "gpt-3.5-turbo") -> dict:
+    """Strips page furniture and redundant whitespace from extracted text before it is sent to a model.
+
+    Page breaks are the form feeds written by the PDF extractor. Page numbers and
+    short lines that recur at the top or bottom of most pages (running headers and
+    footers) are removed, whitespace is collapsed and, if asked, a trailing
+    references section is dropped. Returns the compacted text with token counts
+    before and after.
+    """
+    pages = [[_SPACES_RE.sub(" ", line).strip() for line in page.splitlines()] for page in text.split("\f")]
+    edges = [_edge_indexes(lines) for lines in pages]
+
+    boilerplate = set()
+    if len(pages) > 1:
+        repeats = Counter()
+        for lines, edge in zip(pages, edges):
+            repeats.update({line_signature(lines[i]) for i in edge if len(lines[i]) <= BOILERPLATE_MAX_LENGTH})
+        min_pages = max(2, math.ceil(len(pages) * BOILERPLATE_MIN_SHARE))
+        boilerplate = {signature for signature, count in repeats.items() if count >= min_pages}
+
+    kept = []
+    removed_lines = 0
+    for lines, edge in zip(pages, edges):
+        for index, line in enumerate(lines):
+            if len(pages) > 1 and index in edge and (PAGE_NUMBER_RE.match(line) or line_signature(line) in boilerplate):
+                removed_lines += 1
+                continue
+            kept.append(line)
+
+    references_removed = False
+    if trim_references:
+        for index in range(len(kept) - 1, int(len(kept) * REFERENCES_MIN_POSITION) - 1, -1):
+            if _REFERENCES_RE.match(kept[index]):
+                kept = kept[:index]
+                references_removed = True
+                break
+
+    compacted = _BLANK_LINES_RE.sub("\n\n", "\n".join(kept)).strip()
+    tokens_before = count_tokens(text, model)
+    tokens_after = count_tokens(compacted, model)
+    return {
+        "text": compacted,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "boilerplate_lines_removed": removed_lines,
+        "references_removed": references_removed,
+    }
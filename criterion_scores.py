@@ -0,0 +1,83 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCORES_DB_PATH = os.getenv("GRADER_SCORES_DB", ".grader_scores.sqlite")
+
+def criterion_hash(criterion: dict) -> str:
+    """Hashes what a criterion asks for; the weight is left out so reweighting reuses stored scores."""
+    text = f"{criterion['name'].strip().lower()}\0{' '.join(criterion['description'].split())}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def section_hash(section: str) -> str:
+    return hashlib.sha256(" ".join(section.split()).encode("utf-8")).hexdigest()[:32]
+
+class CriterionScoreStore:
+    """Scores of single rubric criteria against single document sections, kept in SQLite.
+
+    Scores are stored as a fraction of the criterion's maximum, keyed by the model
+    route that produced them and the hashes of the criterion and the section.
+    """
+
+    def __init__(self, path: str = SCORES_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS criterion_scores (
+                    route TEXT NOT NULL,
+                    criterion_hash TEXT NOT NULL,
+                    section_hash TEXT NOT NULL,
+                    fraction REAL NOT NULL,
+                    notes TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (route, criterion_hash, section_hash)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, route: str, section_hashes: list) -> dict:
+        """Returns {(criterion_hash, section_hash): (fraction, notes)} for the given sections."""
+        found = {}
+        unique = list(dict.fromkeys(section_hashes))
+        with self._connect() as conn:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT criterion_hash, section_hash, fraction, notes FROM criterion_scores "
+                    f"WHERE route = ? AND section_hash IN ({','.join('?' * len(batch))})", [route, *batch])
+                for criterion, section, fraction, notes in rows:
+                    found[(criterion, section)] = (fraction, notes)
+        return found
+
+    def put_many(self, route: str, scores: list):
+        """Stores (criterion_hash, section_hash, fraction, notes) rows, replacing earlier scores."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO criterion_scores "
+                "(route, criterion_hash, section_hash, fraction, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(route, criterion, section, fraction, notes, now) for criterion, section, fraction, notes in scores])
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_criterion_store():
+    """Returns the process-wide criterion score store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CriterionScoreStore()
+    return _store
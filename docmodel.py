@@ -0,0 +1,391 @@
+import mmap
+import os
+import re
+import struct
+from collections import Counter
+
+import numpy as np
+
+from compaction import PAGE_NUMBER_RE, line_signature
+from extraction import MAX_PAGES, MAX_FILE_MB
+
+# Element kinds, stored as their index in this tuple
+KINDS = ("paragraph", "heading", "list_item", "table", "footnote")
+PARAGRAPH, HEADING, LIST_ITEM, TABLE, FOOTNOTE = range(len(KINDS))
+
+ELEMENT_DTYPE = np.dtype([("kind", "u1"), ("level", "u1"), ("page", "u2"), ("section", "u4"),
+                          ("start", "u8"), ("end", "u8")])
+# heading is the element index of the section's heading, or -1 for text before the first heading
+SECTION_DTYPE = np.dtype([("heading", "i4"), ("first", "u4"), ("end", "u4"), ("level", "u4")])
+TABLE_DTYPE = np.dtype([("element", "u4"), ("rows", "u4"), ("columns", "u4"), ("pad", "u4")])
+
+MAGIC = b"GRDOC\x00\x01\x00"
+_HEADER = struct.Struct("<8sQQQQQ")
+ELEMENT_SEPARATOR = "\n\n"
+
+# A PDF block counts as a heading when its font is this much larger than body text
+HEADING_SIZE_RATIO = 1.15
+HEADING_MAX_CHARS = 200
+# Small-print blocks in the bottom part of a page are footnotes
+FOOTNOTE_SIZE_RATIO = 0.9
+FOOTNOTE_MIN_Y = 0.7
+# Blocks within this share of the page height from the top or bottom edge may be running headers or footers
+PAGE_MARGIN = 0.1
+
+_LIST_RE = re.compile(r"^\s*([•▪◦●■–\-*]|\(?\d{1,3}[.)]|\(?[a-z][.)])\s+")
+_DOCX_HEADING_RE = re.compile(r"^heading\s*(\d)$", re.IGNORECASE)
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+class StructuredDocument:
+    """Sections, paragraphs, tables and pages of a document, backed by flat arrays over one UTF-8 buffer.
+
+    Element text is stored once, joined by blank lines; elements hold byte offsets
+    into it. Saved documents are memory-mapped by load(), so slicing a section
+    reads only its bytes and copies nothing else.
+    """
+
+    def __init__(self, buffer, elements: np.ndarray, sections: np.ndarray, tables: np.ndarray,
+                 page_starts: np.ndarray, text_offset: int, text_bytes: int, mapping=None):
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self.elements = elements
+        self.sections = sections
+        self.tables = tables
+        self.page_starts = page_starts
+        self._text_offset = text_offset
+        self._text_bytes = text_bytes
+        self._mapping = mapping
+
+    # Serialization
+
+    @classmethod
+    def from_parts(cls, text: bytes, elements: np.ndarray, sections: np.ndarray, tables: np.ndarray,
+                   page_starts: np.ndarray) -> "StructuredDocument":
+        return cls.from_bytes(cls._pack(text, elements, sections, tables, page_starts))
+
+    @staticmethod
+    def _pack(text: bytes, elements, sections, tables, page_starts) -> bytes:
+        header = _HEADER.pack(MAGIC, len(elements), len(sections), len(tables), len(page_starts), len(text))
+        parts = [header]
+        offset = len(header)
+        for array in (elements, sections, tables, page_starts):
+            padding = _aligned(offset) - offset
+            parts.append(b"\0" * padding + array.tobytes())
+            offset += padding + array.nbytes
+        parts.append(text)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, buffer, mapping=None) -> "StructuredDocument":
+        magic, n_elements, n_sections, n_tables, n_pages, text_bytes = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a structured document file")
+        offset = _HEADER.size
+        arrays = []
+        for dtype, count in ((ELEMENT_DTYPE, n_elements), (SECTION_DTYPE, n_sections),
+                             (TABLE_DTYPE, n_tables), (np.dtype("<u8"), n_pages)):
+            offset = _aligned(offset)
+            arrays.append(np.frombuffer(buffer, dtype=dtype, count=count, offset=offset))
+            offset += dtype.itemsize * count
+        return cls(buffer, *arrays, text_offset=offset, text_bytes=text_bytes, mapping=mapping)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._view[:self._text_offset + self._text_bytes])
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self._view[:self._text_offset + self._text_bytes])
+
+    @classmethod
+    def load(cls, path: str) -> "StructuredDocument":
+        """Memory-maps a saved document; call close() (or use it as a context manager) when done."""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_bytes(mapping, mapping=mapping)
+
+    def close(self):
+        # The arrays and the view export the map's buffer, so they go first
+        self.elements = self.sections = self.tables = self.page_starts = None
+        self._view.release()
+        if self._mapping is not None:
+            self._mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Access
+
+    def _slice(self, start: int, end: int) -> str:
+        return str(self._view[self._text_offset + start:self._text_offset + end], "utf-8")
+
+    @property
+    def text(self) -> str:
+        return self._slice(0, self._text_bytes)
+
+    def element_text(self, index: int) -> str:
+        element = self.elements[index]
+        return self._slice(int(element["start"]), int(element["end"]))
+
+    def section_text(self, index: int) -> str:
+        """Returns a section's text, heading included, by slicing the buffer once."""
+        section = self.sections[index]
+        if section["first"] == section["end"]:
+            return ""
+        return self._slice(int(self.elements[section["first"]]["start"]),
+                           int(self.elements[section["end"] - 1]["end"]))
+
+    def section_title(self, index: int):
+        heading = int(self.sections[index]["heading"])
+        return self.element_text(heading) if heading >= 0 else None
+
+    def page_text(self, page: int) -> str:
+        """Returns the text of a 1-based page."""
+        start = int(self.page_starts[page - 1])
+        end = int(self.page_starts[page]) if page < len(self.page_starts) else self._text_bytes
+        return self._slice(start, end).strip("\n")
+
+    def table_rows(self, index: int) -> list:
+        return [row.split(" | ") for row in self.element_text(int(self.tables[index]["element"])).split("\n")]
+
+    def summary(self, max_sections: int = 50) -> dict:
+        kinds = Counter(int(kind) for kind in self.elements["kind"])
+        return {
+            "pages": len(self.page_starts),
+            "bytes": self._text_bytes,
+            "elements": {name: kinds.get(index, 0) for index, name in enumerate(KINDS)},
+            "sections": [{"index": i, "title": self.section_title(i), "level": int(section["level"]),
+                          "elements": int(section["end"] - section["first"]),
+                          "page": int(self.elements[section["first"]]["page"])}
+                         for i, section in enumerate(self.sections[:max_sections])],
+            "section_count": len(self.sections),
+        }
+
+class DocumentBuilder:
+    """Collects elements in reading order and lays them out as a StructuredDocument."""
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+        self._rows = []
+        self._sections = []
+        self._tables = []
+        self._page_starts = []
+
+    def start_page(self, page: int):
+        while len(self._page_starts) < page:
+            self._page_starts.append(self._offset + (len(ELEMENT_SEPARATOR.encode()) if self._parts else 0))
+
+    def add(self, kind: int, text: str, page: int, level: int = 0, table_shape: tuple = None):
+        # Table rows may end in empty cells, so only their outer line breaks are trimmed
+        text = text.strip("\n") if kind == TABLE else text.strip()
+        if not text.strip():
+            return
+        if self._parts:
+            self._parts.append(ELEMENT_SEPARATOR.encode())
+            self._offset += len(ELEMENT_SEPARATOR.encode())
+        data = text.encode("utf-8")
+        index = len(self._rows)
+        if kind == HEADING or not self._sections:
+            self._sections.append([index if kind == HEADING else -1, index, index, level if kind == HEADING else 0])
+        self._sections[-1][2] = index + 1
+        self._rows.append((kind, level, page, len(self._sections) - 1, self._offset, self._offset + len(data)))
+        if table_shape:
+            self._tables.append((index, table_shape[0], table_shape[1], 0))
+        self._parts.append(data)
+        self._offset += len(data)
+
+    def add_table(self, rows: list, page: int):
+        rows = [[" ".join((cell or "").split()) for cell in row] for row in rows]
+        rows = [row for row in rows if any(row)]
+        if rows:
+            self.add(TABLE, "\n".join(" | ".join(row) for row in rows), page,
+                     table_shape=(len(rows), max(len(row) for row in rows)))
+
+    def build(self) -> StructuredDocument:
+        return StructuredDocument.from_parts(
+            b"".join(self._parts),
+            np.array(self._rows, dtype=ELEMENT_DTYPE),
+            np.array([tuple(s) for s in self._sections], dtype=SECTION_DTYPE),
+            np.array(self._tables, dtype=TABLE_DTYPE),
+            np.array(self._page_starts, dtype="<u8"))
+
+# PDF
+
+def _pdf_blocks(page) -> tuple:
+    """Returns (blocks, tables) for a page.
+
+    Blocks are dicts of text, line count, font size, bold, y0, y1 and character count, skipping
+    text inside tables; tables are (top y, rows) pairs.
+    """
+    import pymupdf
+
+    table_areas = []
+    tables = []
+    try:
+        for table in page.find_tables().tables:
+            table_areas.append(pymupdf.Rect(table.bbox))
+            tables.append((table.bbox[1], table.extract()))
+    except Exception:
+        # Table detection is best effort; the text is still extracted as blocks
+        pass
+
+    blocks = []
+    for block in page.get_text("dict", flags=pymupdf.TEXTFLAGS_TEXT)["blocks"]:
+        if block.get("type") != 0:
+            continue
+        rect = pymupdf.Rect(block["bbox"])
+        if any(area.contains(rect.tl + (rect.br - rect.tl) * 0.5) for area in table_areas):
+            continue
+        lines = []
+        sizes = Counter()
+        bold = True
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"])
+            for span in line["spans"]:
+                if span["text"].strip():
+                    sizes[round(span["size"], 1)] += len(span["text"])
+                    bold = bold and bool(span["flags"] & 16)
+            if text.strip():
+                lines.append(text.strip())
+        if lines:
+            joined = ""
+            for line in lines:
+                # Rejoin words hyphenated across lines
+                joined = joined[:-1] + line if joined.endswith("-") else f"{joined} {line}".strip()
+            blocks.append({"text": joined, "lines": len(lines), "size": sizes.most_common(1)[0][0] if sizes else 0.0,
+                           "bold": bold and bool(sizes), "y0": rect.y0, "y1": rect.y1, "chars": sum(sizes.values())})
+    return blocks, tables
+
+def build_pdf(file_path: str, max_pages: int = MAX_PAGES) -> StructuredDocument:
+    import pymupdf
+
+    if hasattr(pymupdf, "no_recommend_layout"):
+        # find_tables otherwise prints a suggestion to stdout, which carries the MCP transport
+        pymupdf.no_recommend_layout()
+    pages = []
+    with pymupdf.open(file_path) as doc:
+        limit = min(doc.page_count, max_pages) if max_pages else doc.page_count
+        for number in range(limit):
+            page = doc[number]
+            blocks, tables = _pdf_blocks(page)
+            pages.append((page.rect.height, blocks, tables))
+
+    # Body text is the font size that most characters use
+    sizes = Counter()
+    for _, blocks, _ in pages:
+        for block in blocks:
+            sizes[block["size"]] += block["chars"]
+    body = sizes.most_common(1)[0][0] if sizes else 0.0
+    heading_sizes = sorted({b["size"] for _, blocks, _ in pages for b in blocks
+                            if b["size"] >= body * HEADING_SIZE_RATIO and len(b["text"]) <= HEADING_MAX_CHARS},
+                           reverse=True)
+    levels = {size: min(rank + 1, 6) for rank, size in enumerate(heading_sizes)}
+
+    # Short blocks near the page edges that recur on most pages are running headers and footers
+    edge_repeats = Counter()
+    for height, blocks, _ in pages:
+        edge_repeats.update({line_signature(b["text"]) for b in blocks
+                             if b["y1"] < height * PAGE_MARGIN or b["y0"] > height * (1 - PAGE_MARGIN)})
+    min_repeats = max(2, (len(pages) + 1) // 2)
+
+    builder = DocumentBuilder()
+    for number, (height, blocks, tables) in enumerate(pages, start=1):
+        builder.start_page(number)
+        items = [(b["y0"], "block", b) for b in blocks] + [(y0, "table", rows) for y0, rows in tables]
+        for _, item_kind, item in sorted(items, key=lambda entry: entry[0]):
+            if item_kind == "table":
+                builder.add_table(item, number)
+                continue
+            text = item["text"]
+            # A page's only block is content however it repeats
+            at_edge = len(blocks) > 1 and (item["y1"] < height * PAGE_MARGIN or item["y0"] > height * (1 - PAGE_MARGIN))
+            if at_edge and (PAGE_NUMBER_RE.match(text) or (len(pages) > 1 and edge_repeats[line_signature(text)] >= min_repeats)):
+                continue
+            if item["size"] in levels and item["lines"] <= 3:
+                builder.add(HEADING, text, number, levels[item["size"]])
+            elif item["bold"] and item["size"] >= body and len(text) <= HEADING_MAX_CHARS and not text.endswith("."):
+                builder.add(HEADING, text, number, min(len(levels) + 1, 6))
+            elif item["size"] and item["size"] <= body * FOOTNOTE_SIZE_RATIO and item["y0"] > height * FOOTNOTE_MIN_Y:
+                builder.add(FOOTNOTE, text, number)
+            elif _LIST_RE.match(text):
+                builder.add(LIST_ITEM, text, number)
+            else:
+                builder.add(PARAGRAPH, text, number)
+    return builder.build()
+
+# DOCX
+
+def _docx_footnotes(doc) -> list:
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import qn
+
+    for part in doc.part.package.iter_parts():
+        if str(part.partname) == "/word/footnotes.xml":
+            root = parse_xml(part.blob)
+            notes = []
+            for note in root.iter(qn("w:footnote")):
+                # Separator and continuation notices have a type; real footnotes do not
+                if note.get(qn("w:type")):
+                    continue
+                text = "".join(node.text or "" for node in note.iter(qn("w:t")))
+                if text.strip():
+                    notes.append(text)
+            return notes
+    return []
+
+def build_docx(file_path: str) -> StructuredDocument:
+    import docx
+    from docx.table import Table
+
+    doc = docx.Document(file_path)
+    builder = DocumentBuilder()
+    page = 1
+    builder.start_page(page)
+    for item in doc.iter_inner_content():
+        if isinstance(item, Table):
+            rows = []
+            for row in item.rows:
+                seen = set()
+                cells = []
+                for cell in row.cells:
+                    # Merged cells are returned once per grid column they span
+                    if id(cell._tc) not in seen:
+                        seen.add(id(cell._tc))
+                        cells.append(cell.text)
+                rows.append(cells)
+            builder.add_table(rows, page)
+            continue
+
+        style = (item.style.name if item.style is not None else "") or ""
+        heading = _DOCX_HEADING_RE.match(style)
+        if style == "Title":
+            builder.add(HEADING, item.text, page, 1)
+        elif heading:
+            builder.add(HEADING, item.text, page, int(heading.group(1)))
+        elif style.startswith("List") or item._p.pPr is not None and item._p.pPr.numPr is not None:
+            builder.add(LIST_ITEM, item.text, page)
+        else:
+            builder.add(PARAGRAPH, item.text, page)
+        # Word records where it broke pages when the file was last saved
+        breaks = len(item._p.xpath('.//w:lastRenderedPageBreak | .//w:br[@w:type="page"]'))
+        if breaks:
+            page += breaks
+            builder.start_page(page)
+    for note in _docx_footnotes(doc):
+        builder.add(FOOTNOTE, note, page)
+    return builder.build()
+
+def build_structured(file_path: str, max_pages: int = MAX_PAGES, max_mb: float = MAX_FILE_MB) -> StructuredDocument:
+    """Extracts a PDF or DOCX file into a StructuredDocument."""
+    if max_mb and os.path.getsize(file_path) > max_mb * 1024 * 1024:
+        raise ValueError(f"File exceeds the {max_mb:g} MB size limit")
+    if file_path.endswith(".pdf"):
+        return build_pdf(file_path, max_pages)
+    if file_path.endswith(".docx"):
+        return build_docx(file_path)
+    raise ValueError("Unsupported file format. Please upload PDF or DOCX.")
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+from extraction import iter_document, MAX_FILE_MB
+
+STORE_PATH = os.getenv("GRADER_DOCUMENT_STORE", ".grader_documents")
+# Stored files and their extracted text are removed after this many seconds without use
+STORE_TTL_SECONDS = float(os.getenv("GRADER_DOCUMENT_TTL", str(7 * 24 * 3600)))
+COPY_CHUNK_BYTES = 1024 * 1024
+SUPPORTED_SUFFIXES = (".pdf", ".docx")
+
+_HANDLE_RE = re.compile(r"^[0-9a-f]{64}$")
+
+class DocumentStore:
+    """Content-addressed store for uploaded files and their extracted text.
+
+    A document is identified by the SHA-256 of its bytes. Tools pass that handle
+    around instead of the document text, and the text is read from disk only where
+    it is needed.
+    """
+
+    def __init__(self, path: str = STORE_PATH, max_mb: float = MAX_FILE_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(path, "tmp"), exist_ok=True)
+
+    def _object_path(self, handle: str, suffix: str) -> str:
+        if not _HANDLE_RE.match(handle or ""):
+            raise ValueError(f"Invalid document handle '{handle}'")
+        return os.path.join(self.path, handle[:2], handle + suffix)
+
+    def file_path(self, handle: str) -> str:
+        """Returns the path of the stored original file."""
+        for suffix in SUPPORTED_SUFFIXES:
+            path = self._object_path(handle, suffix)
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"Unknown document '{handle}'")
+
+    def text_path(self, handle: str) -> str:
+        return self._object_path(handle, ".txt")
+
+    def structure_path(self, handle: str) -> str:
+        return self._object_path(handle, ".grdoc")
+
+    def put(self, source, suffix: str) -> str:
+        """Streams a file object into the store and returns its handle.
+
+        The copy is hashed as it is written, so only one chunk is held in memory, and
+        it is abandoned as soon as it exceeds the size limit.
+        """
+        suffix = suffix.lower()
+        if suffix not in SUPPORTED_SUFFIXES:
+            raise ValueError("Unsupported file format. Please upload PDF or DOCX.")
+
+        digest = hashlib.sha256()
+        size = 0
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.join(self.path, "tmp"), suffix=suffix, delete=False)
+        try:
+            with tmp:
+                for chunk in iter(lambda: source.read(COPY_CHUNK_BYTES), b""):
+                    size += len(chunk)
+                    if self.max_bytes and size > self.max_bytes:
+                        raise ValueError(f"File exceeds the {self.max_bytes / (1024 * 1024):g} MB size limit")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            handle = digest.hexdigest()
+            target = self._object_path(handle, suffix)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                os.utime(target)
+            else:
+                os.replace(tmp.name, target)
+            return handle
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    def put_path(self, file_path: str) -> str:
+        with open(file_path, "rb") as f:
+            return self.put(f, os.path.splitext(file_path)[1])
+
+    def extract(self, handle: str, on_chunk=None) -> dict:
+        """Extracts a stored document's text to disk once and returns a summary of it.
+
+        Chunks are written out as they stream from the extractor, so the full text is
+        never held in memory here.
+        """
+        text_path = self.text_path(handle)
+        if not os.path.exists(text_path):
+            file_path = self.file_path(handle)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.path, "tmp"), suffix=".txt")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as out:
+                    for chunk in iter_document(file_path):
+                        out.write(chunk["text"])
+                        if on_chunk:
+                            on_chunk(chunk)
+                os.replace(tmp_path, text_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return self.summary(handle)
+
+    def structure(self, handle: str) -> dict:
+        """Builds a stored document's structured model once, saves it beside the text and returns its outline."""
+        path = self.structure_path(handle)
+        if not os.path.exists(path):
+            from docmodel import build_structured
+
+            document = build_structured(self.file_path(handle))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.path, "tmp"), suffix=".grdoc")
+            os.close(fd)
+            try:
+                document.save(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        with self.open_structure(handle) as document:
+            return {"document_id": handle, **document.summary()}
+
+    def open_structure(self, handle: str):
+        """Memory-maps the structured model built by structure(); close it when done."""
+        from docmodel import StructuredDocument
+
+        path = self.structure_path(handle)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Document '{handle}' has no structured model")
+        os.utime(path)
+        return StructuredDocument.load(path)
+
+    def summary(self, handle: str, preview_chars: int = 1000) -> dict:
+        """Returns word and character counts and a short preview without loading the whole text."""
+        words = 0
+        characters = 0
+        preview = ""
+        with open(self.text_path(handle), encoding="utf-8") as f:
+            for line in f:
+                words += len(line.split())
+                characters += len(line)
+                if len(preview) < preview_chars:
+                    preview += line[:preview_chars - len(preview)]
+        os.utime(self.text_path(handle))
+        return {"document_id": handle, "words": words, "characters": characters, "preview": preview}
+
+    def read_text(self, handle: str) -> str:
+        path = self.text_path(handle)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Document '{handle}' has not been extracted")
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def prune(self, max_age: float = STORE_TTL_SECONDS) -> int:
+        """Deletes documents unused for max_age seconds and stale temporary files; returns files removed."""
+        cutoff = time.time() - max_age
+        removed = 0
+        with self._lock:
+            for root, _, files in os.walk(self.path):
+                # Temporary files left by an interrupted upload are stale after an hour
+                limit = time.time() - 3600 if os.path.basename(root) == "tmp" else cutoff
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        if os.path.getmtime(path) < limit:
+                            os.remove(path)
+                            removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_document_store():
+    """Returns the process-wide document store, pruning old documents when it is first opened."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+            _store.prune()
+    return _store
@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+JOBS_DB_PATH = os.getenv("GRADER_JOBS_DB", ".grader_jobs.sqlite")
+WORKER_PROCESSES = int(os.getenv("GRADER_WORKERS", "2"))
+POLL_INTERVAL = 0.5
+# A running job whose worker has not reported for this long is handed to another worker
+STALE_AFTER_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+CREDENTIAL_VARS = ("OPENAI_API_KEY", "GEMINI_API_KEY", "GOOGLE_API_KEY", "GOOGLE_CX")
+
+_pool_key = None
+
+def pool_key() -> bytes:
+    """Returns the key this process seals job credentials with, creating it on first use.
+
+    The key is never written anywhere: it stays in this process and is handed to the
+    workers start_workers spawns, so only they can read the credentials it seals.
+    """
+    global _pool_key
+    if _pool_key is None:
+        from cryptography.fernet import Fernet
+
+        _pool_key = Fernet.generate_key()
+    return _pool_key
+
+def _key_id(key: bytes) -> str:
+    return hashlib.sha256(key).hexdigest()[:16]
+
+class JobQueue:
+    """SQLite-backed job queue shared by every process that opens the same database.
+
+    With a key, the queue can submit and claim jobs that carry credentials; those are
+    stored encrypted and only workers holding the same key pick them up.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, key: bytes = None):
+        self.path = path
+        self.key = key
+        self.pool = _key_id(key) if key else None
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    stages TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    credentials BLOB,
+                    sealed_for TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    pid INTEGER,
+                    host TEXT,
+                    pool TEXT,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+            # Databases created before credentials were sealed lack these columns
+            for table, column, kind in (("jobs", "credentials", "BLOB"), ("jobs", "sealed_for", "TEXT"),
+                                        ("workers", "pool", "TEXT")):
+                columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    @contextmanager
+    def _connect(self):
+        # Payloads and results hold student work, so keep the database (and the WAL, which
+        # SQLite creates with the same mode) private to this user
+        if not os.path.exists(self.path):
+            os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, kind: str, payload: dict, credentials: dict = None) -> str:
+        """Queues a job; credentials are encrypted with the queue's key and never stored in the clear."""
+        credentials = {k: v for k, v in (credentials or {}).items() if k in CREDENTIAL_VARS and v}
+        sealed = None
+        if credentials:
+            if self.key is None:
+                raise ValueError("Jobs with credentials need a queue opened with a key")
+            from cryptography.fernet import Fernet
+
+            sealed = Fernet(self.key).encrypt(json.dumps(credentials).encode("utf-8"))
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, credentials, sealed_for, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), sealed, self.pool if sealed else None, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str):
+        """Returns a job with its per-stage progress, or None if the id is unknown."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "stages": json.loads(row["stages"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def claim(self, worker_id: str):
+        """Atomically takes the oldest queued job this queue can run; returns (job_id, kind, payload) or None.
+
+        Sealed credentials are decrypted into payload["credentials"], in memory only.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, kind, payload, credentials FROM jobs "
+                    "WHERE status = 'queued' AND (sealed_for IS NULL OR sealed_for = ?) ORDER BY created_at LIMIT 1",
+                    (self.pool,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, time.time(), row["id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        payload = json.loads(row["payload"])
+        if row["credentials"] is not None:
+            from cryptography.fernet import Fernet
+
+            payload["credentials"] = json.loads(Fernet(self.key).decrypt(row["credentials"]))
+        return row["id"], row["kind"], payload
+
+    def update_stage(self, job_id: str, stage: str, **fields):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stages = json.loads(row["stages"]) if row else {}
+            stages.setdefault(stage, {}).update(fields)
+            conn.execute("UPDATE jobs SET stages = ?, updated_at = ? WHERE id = ?",
+                         (json.dumps(stages), time.time(), job_id))
+            conn.execute("COMMIT")
+
+    def finish(self, job_id: str, result: dict = None, error: str = None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, credentials = NULL, updated_at = ? "
+                         "WHERE id = ?",
+                         ("failed" if error else "done", json.dumps(result) if result is not None else None,
+                          error, time.time(), job_id))
+
+    def requeue_stale(self, stale_after: float = STALE_AFTER_SECONDS) -> int:
+        """Returns jobs abandoned by crashed workers to the queue, failing them after MAX_ATTEMPTS.
+
+        Jobs sealed for a pool with no live worker are failed too: its key died with the
+        process that made it, so nothing can read their credentials any more.
+        """
+        cutoff = time.time() - stale_after
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', credentials = NULL "
+                         "WHERE status = 'running' AND updated_at < ? AND attempts >= ?", (cutoff, MAX_ATTEMPTS))
+            conn.execute("UPDATE jobs SET status = 'failed', credentials = NULL, "
+                         "error = 'No worker holds the key to this job''s credentials; submit it again' "
+                         "WHERE status IN ('queued', 'running') AND updated_at < ? AND sealed_for IS NOT NULL "
+                         "AND sealed_for NOT IN (SELECT pool FROM workers WHERE pool IS NOT NULL AND heartbeat_at > ?)",
+                         (cutoff, cutoff))
+            return conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND updated_at < ?",
+                                (cutoff,)).rowcount
+
+    def heartbeat(self, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (id, pid, host, pool, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+                         (worker_id, os.getpid(), socket.gethostname(), self.pool, time.time()))
+
+    def live_workers(self, max_age: float = 10.0) -> int:
+        """Counts recently seen workers that hold this queue's key."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM workers WHERE pool IS ? AND heartbeat_at > ?",
+                                (self.pool, time.time() - max_age)).fetchone()[0]
+
+# Job execution
+
+@contextmanager
+def job_credentials(credentials: dict):
+    """Sets a job's credentials in the environment for its duration, then restores the worker's own."""
+    saved = {name: os.environ.get(name) for name in CREDENTIAL_VARS}
+    try:
+        for name, value in (credentials or {}).items():
+            if name in CREDENTIAL_VARS and value:
+                os.environ[name] = value
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def run_job(queue: JobQueue, job_id: str, kind: str, payload: dict):
+    with job_credentials(payload.get("credentials")):
+        _run_job(queue, job_id, kind, payload)
+
+def _run_job(queue: JobQueue, job_id: str, kind: str, payload: dict):
+    from server import grade_submission_core, save_result_core
+
+    if kind != "grade":
+        queue.finish(job_id, error=f"Unknown job kind '{kind}'")
+        return
+
+    result = grade_submission_core(
+        payload.get("text", ""), payload.get("rubric", ""), payload.get("rubric_id"),
+        check_plagiarism=payload.get("check_plagiarism", False),
+        combined=payload.get("combined", True),
+        timeouts=payload.get("timeouts"),
+        on_stage=lambda stage, **fields: queue.update_stage(job_id, stage, **fields),
+        document_id=payload.get("document_id"),
+    )
+    if "error" in result:
+        queue.finish(job_id, error=result["error"])
+        return
+    result.pop("stages", None)
+    result["file_name"] = payload.get("file_name")
+    if payload.get("assignment"):
+        saved = save_result_core(result["grade_results"], payload["assignment"],
+                                 payload.get("student") or payload.get("file_name") or job_id, result.get("feedback"),
+                                 payload.get("rubric_id"), job_id, result.get("plagiarism_results"))
+        if "result_id" in saved:
+            result["result_id"] = saved["result_id"]
+    queue.finish(job_id, result=result)
+
+def worker_loop(path: str = JOBS_DB_PATH, poll_interval: float = POLL_INTERVAL, key: bytes = None):
+    """Claims and runs jobs until the process is stopped."""
+    queue = JobQueue(path, key)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    polls = 0
+    while True:
+        queue.heartbeat(worker_id)
+        if polls % 120 == 0:
+            queue.requeue_stale()
+        polls += 1
+        claimed = queue.claim(worker_id)
+        if claimed is None:
+            time.sleep(poll_interval)
+            continue
+        job_id, kind, payload = claimed
+        try:
+            run_job(queue, job_id, kind, payload)
+        except Exception as e:
+            queue.finish(job_id, error=f"Job failed: {str(e)}")
+
+def start_workers(count: int = WORKER_PROCESSES, path: str = JOBS_DB_PATH) -> list:
+    """Starts worker processes that exit together with the calling process.
+
+    They receive this process's pool key through the spawn pipe, so they can run the
+    credentialed jobs it submits.
+    """
+    # spawn avoids forking a parent that may be running threads (e.g. Streamlit)
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(count):
+        process = context.Process(target=worker_loop, args=(path, POLL_INTERVAL, pool_key()), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+_queue = None
+
+def get_job_queue():
+    """Returns the process-wide job queue."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(key=pool_key())
+    return _queue
+
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Run grading job workers.")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Number of worker processes")
+    args = parser.parse_args()
+
+    processes = start_workers(args.processes)
+    print(f"Started {len(processes)} workers on {JOBS_DB_PATH}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
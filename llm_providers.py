@@ -0,0 +1,319 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+import httpx
+
+from chunking import count_tokens
+from llm_scheduler import get_scheduler, is_quota_error, EXPECTED_COMPLETION_TOKENS
+from telemetry import annotate, registry, httpx_response_hook, async_httpx_response_hook
+
+# Providers tried for every stage, in fallback order; ones without credentials are skipped
+PROVIDER_ORDER = [p.strip() for p in os.getenv("GRADER_LLM_PROVIDERS", "openai,gemini,local").split(",") if p.strip()]
+DEFAULT_MODELS = {
+    "openai": os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+    "gemini": os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+    "local": os.getenv("LOCAL_LLM_MODEL", "local"),
+}
+# A stage's route can be set with GRADER_<STAGE>_MODELS, e.g. GRADER_CHUNK_MODELS="openai:gpt-4o-mini,gemini";
+# the stages are grade, feedback, grade_and_feedback and chunk (the parts of a long submission)
+# Seconds a call may take before the next provider is tried instead (GRADER_<STAGE>_SLO overrides per stage)
+LATENCY_SLO = float(os.getenv("GRADER_LLM_SLO", "45"))
+# A provider that failed or breached its SLO is tried last for this many seconds
+FAILURE_COOLDOWN = float(os.getenv("GRADER_LLM_COOLDOWN", "30"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+NO_PROVIDER_MESSAGE = "No LLM provider configured (set OPENAI_API_KEY, GEMINI_API_KEY or LOCAL_LLM_BASE_URL)"
+
+class Completion(namedtuple("Completion", "text provider model prompt_tokens completion_tokens")):
+    """Text of a model response with the provider that produced it and its token usage."""
+
+    @property
+    def total_tokens(self):
+        if self.prompt_tokens is None:
+            return None
+        return self.prompt_tokens + (self.completion_tokens or 0)
+
+class LatencySLOExceeded(Exception):
+    """A provider did not answer within the stage's latency SLO."""
+
+class AllProvidersFailed(Exception):
+    """Every provider on a stage's route failed; errors holds (provider, exception) pairs."""
+
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {exc}" for name, exc in errors))
+
+def is_quota_failure(exc: BaseException) -> bool:
+    """True when a request failed because every provider tried is out of credit."""
+    if isinstance(exc, AllProvidersFailed):
+        return all(is_quota_error(e) for _, e in exc.errors)
+    return is_quota_error(exc)
+
+# Providers
+
+class OpenAIProvider:
+    """Chat completions through the OpenAI SDK; with a base_url it serves any OpenAI-compatible endpoint."""
+
+    def __init__(self, name: str, api_key_var: str, base_url_var: str = None, default_key: str = None):
+        self.name = name
+        self.api_key_var = api_key_var
+        self.base_url_var = base_url_var
+        self.default_key = default_key
+        self._client = None
+        self._client_key = None
+        # One async client per event loop, dropped together with the loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._closing = set()
+        self._lock = threading.Lock()
+
+    def _settings(self):
+        base_url = os.getenv(self.base_url_var) if self.base_url_var else None
+        if self.base_url_var and not base_url:
+            return None
+        api_key = os.getenv(self.api_key_var) or self.default_key
+        if not api_key:
+            return None
+        return api_key, base_url
+
+    def available(self) -> bool:
+        return self._settings() is not None
+
+    def _limits(self):
+        return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+
+    def client(self):
+        """Returns a shared client so HTTP keep-alive and TLS sessions are reused."""
+        from openai import OpenAI, DefaultHttpxClient
+
+        settings = self._settings()
+        if settings is None:
+            return None
+        with self._lock:
+            if self._client is None or self._client_key != settings:
+                if self._client is not None:
+                    self._client.close()
+                # Retries are left to the shared scheduler so they respect its budgets
+                self._client = OpenAI(api_key=settings[0], base_url=settings[1], max_retries=0,
+                                      http_client=DefaultHttpxClient(
+                                          limits=self._limits(),
+                                          event_hooks={"response": [httpx_response_hook(self.name)]}))
+                self._client_key = settings
+            return self._client
+
+    def async_client(self):
+        """Returns an AsyncOpenAI client shared by all coroutines on the running event loop."""
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        settings = self._settings()
+        if settings is None:
+            return None
+        # The pooled transport is bound to the loop it was created on
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            current = self._async_clients.get(loop)
+            if current is None or current[0] != settings:
+                if current is not None:
+                    # Replaced on the loop it belongs to, so its connections can be closed there
+                    closing = loop.create_task(current[1].close())
+                    self._closing.add(closing)
+                    closing.add_done_callback(self._closing.discard)
+                current = (settings, AsyncOpenAI(api_key=settings[0], base_url=settings[1], max_retries=0,
+                                                 http_client=DefaultAsyncHttpxClient(
+                                                     limits=self._limits(),
+                                                     event_hooks={"response": [async_httpx_response_hook(self.name)]})))
+                self._async_clients[loop] = current
+            return current[1]
+
+    def _request(self, model, messages, json_mode, timeout):
+        request = {"model": model, "messages": messages}
+        if json_mode:
+            request["response_format"] = {"type": "json_object"}
+        if timeout:
+            request["timeout"] = timeout
+        return request
+
+    def _completion(self, response, model):
+        usage = response.usage
+        return Completion(response.choices[0].message.content, self.name, model,
+                          usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None)
+
+    def complete(self, model: str, messages: list, json_mode: bool = False, timeout: float = None) -> Completion:
+        import openai
+
+        try:
+            response = self.client().chat.completions.create(**self._request(model, messages, json_mode, timeout))
+        except openai.APITimeoutError as e:
+            if timeout:
+                raise LatencySLOExceeded(f"{self.name} took longer than {timeout:g}s") from e
+            raise
+        return self._completion(response, model)
+
+    async def acomplete(self, model: str, messages: list, json_mode: bool = False, timeout: float = None) -> Completion:
+        import openai
+
+        try:
+            response = await self.async_client().chat.completions.create(
+                **self._request(model, messages, json_mode, timeout))
+        except openai.APITimeoutError as e:
+            if timeout:
+                raise LatencySLOExceeded(f"{self.name} took longer than {timeout:g}s") from e
+            raise
+        return self._completion(response, model)
+
+class GeminiProvider:
+    """Google Gemini through the google-generativeai SDK."""
+
+    name = "gemini"
+
+    def __init__(self, api_key_var: str = "GEMINI_API_KEY"):
+        self.api_key_var = api_key_var
+        self._configured_key = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return bool(os.getenv(self.api_key_var))
+
+    def _model(self, model: str, system: str):
+        import google.generativeai as genai
+
+        api_key = os.getenv(self.api_key_var)
+        with self._lock:
+            if self._configured_key != api_key:
+                genai.configure(api_key=api_key)
+                self._configured_key = api_key
+        return genai.GenerativeModel(model, system_instruction=system or None)
+
+    def complete(self, model: str, messages: list, json_mode: bool = False, timeout: float = None) -> Completion:
+        from google.api_core import exceptions
+
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [{"role": "model" if m["role"] == "assistant" else "user", "parts": [m["content"]]}
+                    for m in messages if m["role"] != "system"]
+        config = {"response_mime_type": "application/json"} if json_mode else None
+        try:
+            response = self._model(model, system).generate_content(
+                contents, generation_config=config, request_options={"timeout": timeout} if timeout else None)
+        except exceptions.DeadlineExceeded as e:
+            if timeout:
+                raise LatencySLOExceeded(f"{self.name} took longer than {timeout:g}s") from e
+            raise
+        usage = getattr(response, "usage_metadata", None)
+        return Completion(response.text, self.name, model, getattr(usage, "prompt_token_count", None),
+                          getattr(usage, "candidates_token_count", None))
+
+    async def acomplete(self, model: str, messages: list, json_mode: bool = False, timeout: float = None) -> Completion:
+        # The SDK's asyncio transport is tied to the first event loop, so calls run on a thread instead
+        return await asyncio.to_thread(self.complete, model, messages, json_mode, timeout)
+
+PROVIDERS = {
+    "openai": OpenAIProvider("openai", "OPENAI_API_KEY"),
+    "gemini": GeminiProvider(),
+    # llama.cpp and vLLM servers accept any key
+    "local": OpenAIProvider("local", "LOCAL_LLM_API_KEY", "LOCAL_LLM_BASE_URL", default_key="local"),
+}
+
+# Routing
+
+_last_failure = {}
+
+def _parse_route(value: str) -> list:
+    route = []
+    for entry in value.split(","):
+        name, _, model = entry.strip().partition(":")
+        if name:
+            route.append((name, model or DEFAULT_MODELS.get(name)))
+    return route
+
+def configured_route(stage: str) -> list:
+    """Returns the stage's (provider, model) pairs in configured order, skipping providers without credentials."""
+    configured = os.getenv(f"GRADER_{stage.upper()}_MODELS")
+    route = _parse_route(configured) if configured else [(name, DEFAULT_MODELS.get(name)) for name in PROVIDER_ORDER]
+    return [(name, model) for name, model in route if name in PROVIDERS and PROVIDERS[name].available()]
+
+def resolve_route(stage: str) -> list:
+    """Returns the (provider, model) pairs to try for a stage, recently failed providers last."""
+    now = time.monotonic()
+    # sorted is stable, so healthy providers keep their configured order
+    return sorted(configured_route(stage),
+                  key=lambda pair: now - _last_failure.get(pair[0], -FAILURE_COOLDOWN) < FAILURE_COOLDOWN)
+
+def describe_route(stage: str) -> str:
+    """Names the stage's configured providers and models, for cache keys and reports.
+
+    Uses the configured order, so keys stay the same while a failed provider cools down.
+    """
+    return ">".join(f"{name}:{model}" for name, model in configured_route(stage))
+
+def _slo(stage: str) -> float:
+    return float(os.getenv(f"GRADER_{stage.upper()}_SLO", LATENCY_SLO))
+
+def _estimate_tokens(messages: list) -> int:
+    """Tokens a request is expected to use, for the scheduler's tokens-per-minute budget."""
+    return sum(count_tokens(m["content"]) for m in messages) + EXPECTED_COMPLETION_TOKENS
+
+def _record(stage: str, completion: Completion):
+    annotate(prompt_tokens=completion.prompt_tokens or 0, completion_tokens=completion.completion_tokens or 0)
+    registry.count("grader_llm_requests_total", stage=stage, provider=completion.provider, model=completion.model)
+
+def _record_failure(stage: str, name: str, exc: BaseException, last: bool):
+    _last_failure[name] = time.monotonic()
+    if not last:
+        reason = "slo" if isinstance(exc, LatencySLOExceeded) else type(exc).__name__
+        registry.count("grader_llm_fallbacks_total", stage=stage, provider=name, reason=reason)
+        annotate(fallbacks=1)
+
+def complete(stage: str, messages: list, json_mode: bool = False) -> Completion:
+    """Sends messages to the first provider on the stage's route that answers, falling back on failure."""
+    route = resolve_route(stage)
+    if not route:
+        raise RuntimeError(NO_PROVIDER_MESSAGE)
+    estimated = _estimate_tokens(messages)
+    errors = []
+    for position, (name, model) in enumerate(route):
+        last = position == len(route) - 1
+        # The SLO only applies while there is another provider to fall back to
+        timeout = None if last else _slo(stage) or None
+        provider = PROVIDERS[name]
+        try:
+            completion = get_scheduler(name).call(
+                lambda: provider.complete(model, messages, json_mode, timeout), estimated)
+        except Exception as e:
+            _record_failure(stage, name, e, last)
+            errors.append((name, e))
+            continue
+        _record(stage, completion)
+        return completion
+    if len(errors) == 1:
+        raise errors[0][1]
+    raise AllProvidersFailed(errors)
+
+async def acomplete(stage: str, messages: list, json_mode: bool = False) -> Completion:
+    """Async variant of complete."""
+    route = resolve_route(stage)
+    if not route:
+        raise RuntimeError(NO_PROVIDER_MESSAGE)
+    estimated = _estimate_tokens(messages)
+    errors = []
+    for position, (name, model) in enumerate(route):
+        last = position == len(route) - 1
+        timeout = None if last else _slo(stage) or None
+        provider = PROVIDERS[name]
+        try:
+            completion = await get_scheduler(name).acall(
+                lambda: provider.acomplete(model, messages, json_mode, timeout), estimated)
+        except Exception as e:
+            _record_failure(stage, name, e, last)
+            errors.append((name, e))
+            continue
+        _record(stage, completion)
+        return completion
+    if len(errors) == 1:
+        raise errors[0][1]
+    raise AllProvidersFailed(errors)
+
+def has_provider(stage: str) -> bool:
+    return bool(resolve_route(stage))
\ No newline at end of file
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from telemetry import annotate, registry
+
+# Budgets are per process; divide the account limits between processes that share a key.
+# Other providers read the same settings under their own prefix (GEMINI_RPM, LOCAL_LLM_RPM...)
+REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_RPM", "500"))
+TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TPM", "200000"))
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+# Completion tokens assumed for a request until its actual usage is known
+EXPECTED_COMPLETION_TOKENS = 800
+MAX_BACKOFF_SECONDS = 60.0
+# Throttling within this window after a decrease counts as the same congestion event
+DECREASE_COOLDOWN_SECONDS = 2.0
+POLL_SECONDS = 0.05
+
+def is_quota_error(exc: BaseException) -> bool:
+    """True for the 429 OpenAI sends when the account is out of credit, which retrying cannot fix."""
+    if getattr(exc, "code", None) == "insufficient_quota":
+        return True
+    body = getattr(exc, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        return isinstance(body, dict) and body.get("code") == "insufficient_quota"
+    return False
+
+def _status(exc: BaseException):
+    """HTTP status of a failed request; Google API errors carry it as an integer code."""
+    status = getattr(exc, "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = int(exc.code)
+    return status
+
+def is_retryable(exc: BaseException) -> bool:
+    # Imported here so that loading the scheduler does not load the OpenAI SDK
+    import openai
+
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    status = _status(exc)
+    if status == 429:
+        return not is_quota_error(exc)
+    return status in (408, 409) or (status is not None and status >= 500)
+
+def retry_after(exc: BaseException):
+    """Seconds the server asked us to wait, from Retry-After or the retry-after-ms header."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return None
+
+class RequestScheduler:
+    """Admission control, retries and adaptive concurrency shared by every LLM call in the process.
+
+    A request is admitted when a concurrency slot, one request from the
+    requests-per-minute bucket and its estimated tokens from the tokens-per-minute
+    bucket are all available; otherwise it waits. The concurrency limit grows by
+    about one slot per limit's worth of successes and halves on throttling (AIMD).
+    """
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES):
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.request_capacity = max(requests_per_minute / 60.0 * 10, 1.0)
+        self.token_capacity = max(tokens_per_minute, 1.0)
+        self.request_tokens = self.request_capacity
+        self.token_budget = self.token_capacity
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.updated = time.monotonic()
+        self.stats = {"admitted": 0, "retries": 0, "throttled": 0, "failed": 0, "queued_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str = "OPENAI"):
+        """Builds a scheduler from <prefix>_RPM, _TPM, _MAX_CONCURRENCY and _MAX_RETRIES, defaulting to OpenAI's."""
+        return cls(float(os.getenv(f"{prefix}_RPM", REQUESTS_PER_MINUTE)),
+                   float(os.getenv(f"{prefix}_TPM", TOKENS_PER_MINUTE)),
+                   int(os.getenv(f"{prefix}_MAX_CONCURRENCY", MAX_CONCURRENCY)),
+                   int(os.getenv(f"{prefix}_MAX_RETRIES", MAX_RETRIES)))
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_tokens = min(self.request_capacity, self.request_tokens + elapsed * self.request_rate)
+        self.token_budget = min(self.token_capacity, self.token_budget + elapsed * self.token_rate)
+
+    def try_acquire(self, tokens: int) -> float:
+        """Admits a request and returns 0, or returns how long to wait before trying again."""
+        tokens = min(tokens, self.token_capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                return POLL_SECONDS
+            if self.request_tokens < 1:
+                return (1 - self.request_tokens) / self.request_rate
+            if self.token_budget < tokens:
+                return (tokens - self.token_budget) / self.token_rate
+            self.request_tokens -= 1
+            self.token_budget -= tokens
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return 0.0
+
+    def release(self, estimated: int, used: int = None, throttled: bool = False, delay: float = None,
+                succeeded: bool = True):
+        """Frees a slot, settles the token estimate against actual usage and adapts the limit."""
+        with self._lock:
+            self.in_flight -= 1
+            if used is not None:
+                self.token_budget = min(self.token_capacity, self.token_budget + estimated - used)
+            now = time.monotonic()
+            if throttled:
+                self.stats["throttled"] += 1
+                if delay:
+                    self.paused_until = max(self.paused_until, now + delay)
+                if now - self.last_decrease > DECREASE_COOLDOWN_SECONDS:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+            elif succeeded:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def _backoff(self, exc: BaseException, attempt: int) -> float:
+        requested = retry_after(exc)
+        if requested is not None:
+            return min(requested, MAX_BACKOFF_SECONDS)
+        # Full jitter keeps retries from many callers from arriving together
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt))
+
+    def _after_failure(self, exc: BaseException, attempt: int, estimated: int):
+        """Releases the slot for a failed attempt; returns the delay before retrying or re-raises."""
+        throttled = _status(exc) == 429 and not is_quota_error(exc)
+        delay = self._backoff(exc, attempt) if is_retryable(exc) else None
+        # A rejected request consumed no tokens, so its estimate is refunded
+        self.release(estimated, used=0, throttled=throttled, delay=delay if throttled else None, succeeded=False)
+        if delay is None or attempt >= self.max_retries:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise exc
+        with self._lock:
+            self.stats["retries"] += 1
+        annotate(retries=1)
+        registry.count("grader_llm_retries_total", reason=str(_status(exc) or type(exc).__name__))
+        return delay
+
+    def _record_wait(self, seconds: float):
+        if seconds:
+            with self._lock:
+                self.stats["queued_seconds"] += seconds
+            annotate(queued_seconds=seconds)
+
+    def call(self, request, estimated_tokens: int):
+        """Runs request() once admitted, retrying transient failures; for synchronous callers."""
+        for attempt in range(self.max_retries + 1):
+            begin = time.monotonic()
+            while (wait := self.try_acquire(estimated_tokens)) > 0:
+                time.sleep(min(wait, 1.0))
+            self._record_wait(time.monotonic() - begin)
+            try:
+                response = request()
+            except Exception as e:
+                time.sleep(self._after_failure(e, attempt, estimated_tokens))
+                continue
+            self.release(estimated_tokens, _total_tokens(response))
+            return response
+
+    async def acall(self, request, estimated_tokens: int):
+        """Async variant of call; request() must return an awaitable."""
+        for attempt in range(self.max_retries + 1):
+            begin = time.monotonic()
+            while (wait := self.try_acquire(estimated_tokens)) > 0:
+                await asyncio.sleep(min(wait, 1.0))
+            self._record_wait(time.monotonic() - begin)
+            try:
+                response = await request()
+            except asyncio.CancelledError:
+                self.release(estimated_tokens, used=0, succeeded=False)
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(e, attempt, estimated_tokens))
+                continue
+            self.release(estimated_tokens, _total_tokens(response))
+            return response
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "requests_available": round(self.request_tokens, 1),
+                "tokens_available": int(self.token_budget),
+                "paused_for": round(max(self.paused_until - time.monotonic(), 0.0), 2),
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+            }
+
+def _total_tokens(response):
+    usage = getattr(response, "usage", response)
+    return getattr(usage, "total_tokens", None)
+
+_ENV_PREFIXES = {"openai": "OPENAI", "local": "LOCAL_LLM"}
+_schedulers = {}
+_scheduler_lock = threading.Lock()
+
+def get_scheduler(provider: str = "openai"):
+    """Returns the process-wide scheduler for a provider's LLM requests; each provider has its own budgets."""
+    with _scheduler_lock:
+        if provider not in _schedulers:
+            _schedulers[provider] = RequestScheduler.from_env(_ENV_PREFIXES.get(provider, provider.upper()))
+        return _schedulers[provider]
+
+def scheduler_snapshots() -> dict:
+    """Returns snapshot() of every provider scheduler created so far."""
+    with _scheduler_lock:
+        schedulers = dict(_schedulers)
+    return {provider: scheduler.snapshot() for provider, scheduler in schedulers.items()}
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+INDEX_PATH = os.getenv("GRADER_PLAGIARISM_INDEX", ".grader_plagiarism.sqlite")
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# 64 bands of 2 rows: partial copies down to ~0.15 Jaccard still share a bucket,
+# while unrelated essays (Jaccard ~0.01) rarely do
+NUM_BANDS = 64
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(42)
+# Coefficients stay below 2**31 so a * h + b cannot overflow uint64 for 32-bit h
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> list:
+    """Returns (word, start, end) for every word of the text, lowercased."""
+    return [(m.group().lower(), m.start(), m.end()) for m in _WORD_RE.finditer(text)]
+
+def shingle_hashes(tokens: list, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Returns a 32-bit hash for every run of `size` consecutive words."""
+    words = [t[0] for t in tokens]
+    count = max(len(words) - size + 1, 1 if words else 0)
+    hashes = np.empty(count, dtype=np.uint64)
+    for i in range(count):
+        shingle = " ".join(words[i:i + size]).encode("utf-8")
+        hashes[i] = int.from_bytes(hashlib.blake2b(shingle, digest_size=4).digest(), "little")
+    return hashes
+
+def minhash_signature(hashes: np.ndarray, block: int = 4096) -> np.ndarray:
+    """Computes the MinHash signature of a set of shingle hashes."""
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    hashes = np.unique(hashes)
+    for start in range(0, len(hashes), block):
+        chunk = hashes[start:start + block, None]
+        permuted = ((chunk * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+        signature = np.minimum(signature, permuted.min(axis=0))
+    return signature
+
+def _band_buckets(signature: np.ndarray) -> list:
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        buckets.append(int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), "little", signed=True))
+    return buckets
+
+def overlapping_passages(text: str, other_text: str, max_passages: int = 5, size: int = SHINGLE_SIZE) -> list:
+    """Returns the longest passages of `text` whose shingles also occur in `other_text`."""
+    tokens = tokenize(text)
+    own = shingle_hashes(tokens, size)
+    shared = np.isin(own, shingle_hashes(tokenize(other_text), size))
+
+    passages = []
+    index = 0
+    while index < len(shared):
+        if not shared[index]:
+            index += 1
+            continue
+        run_start = index
+        while index < len(shared) and shared[index]:
+            index += 1
+        # A run of matching shingles covers words run_start .. index + size - 2
+        last_word = min(index + size - 2, len(tokens) - 1)
+        start, end = tokens[run_start][1], tokens[last_word][2]
+        passages.append({"start": start, "end": end, "text": text[start:end]})
+    passages.sort(key=lambda p: p["end"] - p["start"], reverse=True)
+    return passages[:max_passages]
+
+class PlagiarismIndex:
+    """Persistent MinHash/LSH index over submission texts.
+
+    Queries only look at documents that share an LSH bucket with the query,
+    so lookup cost grows with the number of near-duplicates, not the corpus size.
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, doc_id TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_lookup ON buckets (band, bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_doc ON buckets (doc_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, doc_id: str, text: str, signature: np.ndarray = None):
+        """Adds or replaces a document in the index."""
+        if signature is None:
+            signature = minhash_signature(shingle_hashes(tokenize(text)))
+        rows = [(band, bucket, doc_id) for band, bucket in enumerate(_band_buckets(signature))]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM buckets WHERE doc_id = ?", (doc_id,))
+            conn.execute("INSERT OR REPLACE INTO documents (id, text, signature, created_at) VALUES (?, ?, ?, ?)",
+                         (doc_id, text, signature.tobytes(), time.time()))
+            conn.executemany("INSERT INTO buckets (band, bucket, doc_id) VALUES (?, ?, ?)", rows)
+
+    def query(self, text: str, top_k: int = 5, min_similarity: float = 0.1, exclude_id: str = None,
+              signature: np.ndarray = None) -> list:
+        """Returns the most similar indexed documents with estimated Jaccard similarity."""
+        if signature is None:
+            signature = minhash_signature(shingle_hashes(tokenize(text)))
+        with self._connect() as conn:
+            candidates = set()
+            for band, bucket in enumerate(_band_buckets(signature)):
+                for (doc_id,) in conn.execute("SELECT doc_id FROM buckets WHERE band = ? AND bucket = ?",
+                                              (band, bucket)):
+                    candidates.add(doc_id)
+            candidates.discard(exclude_id)
+
+            scored = []
+            for doc_id in candidates:
+                row = conn.execute("SELECT signature FROM documents WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                other = np.frombuffer(row[0], dtype=np.uint64)
+                similarity = float(np.mean(signature == other))
+                if similarity >= min_similarity:
+                    scored.append((similarity, doc_id))
+            scored.sort(reverse=True)
+
+            matches = []
+            for similarity, doc_id in scored[:top_k]:
+                other_text = conn.execute("SELECT text FROM documents WHERE id = ?", (doc_id,)).fetchone()[0]
+                matches.append({
+                    "submission_id": doc_id,
+                    "similarity": round(similarity, 4),
+                    "passages": overlapping_passages(text, other_text),
+                })
+        return matches
+
+    def size(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_plagiarism_index():
+    """Returns the process-wide plagiarism index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PlagiarismIndex()
+    return _index
@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import time
+
+from batch import collect_submissions, load_completed_ids, open_for_append, stage_error, RESULTS_BATCH_SIZE
+from server import (parse_file_core, validate_grade_result, prompt_text, grading_messages, combined_messages,
+                    compile_rubric_text, cache_lookup, cache_store)
+from rubric import check_breakdown
+from extraction import process_pool
+from llm_providers import PROVIDERS, DEFAULT_MODELS, OpenAIProvider, describe_route, configured_route
+from llm_scheduler import get_scheduler
+from results_store import get_results_store, result_record
+from telemetry import registry
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = os.getenv("GRADER_BATCH_COMPLETION_WINDOW", "24h")
+# Seconds between status checks while waiting for a batch
+BATCH_POLL_INTERVAL = float(os.getenv("GRADER_BATCH_POLL_INTERVAL", "60"))
+# Provider limits for a single batch input file
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Manifest
+
+def manifest_path_for(requests_path: str) -> str:
+    return os.path.splitext(requests_path)[0] + ".manifest.json"
+
+def load_manifest(manifest_path: str) -> dict:
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_manifest(manifest_path: str, manifest: dict):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def _batch_target(stage: str, provider: str = None):
+    """Returns the first OpenAI-compatible (provider, model) on the stage's route; only those have a batch API."""
+    route = configured_route(stage)
+    if provider:
+        route = [(name, model) for name, model in route if name == provider]
+        if not route and provider in PROVIDERS and PROVIDERS[provider].available():
+            route = [(provider, DEFAULT_MODELS.get(provider))]
+    for name, model in route:
+        if isinstance(PROVIDERS[name], OpenAIProvider):
+            return name, model
+    raise RuntimeError("Batch mode needs an OpenAI-compatible provider (set OPENAI_API_KEY or LOCAL_LLM_BASE_URL)")
+
+def _parse_submission(file_path: str) -> str:
+    try:
+        return parse_file_core(file_path)
+    except Exception as e:
+        return f"Error parsing file: {str(e)}"
+
+# Pipeline
+
+def prepare_batch(source: str, rubric: str, requests_path: str, include_feedback: bool = True,
+                  parse_workers: int = None, provider: str = None, use_cache: bool = True) -> dict:
+    """Parses the submissions and writes one chat completion request per submission to a batch JSONL file.
+
+    Submissions whose result is already in the result cache are not sent again. The
+    manifest written next to the requests file maps request ids back to submissions
+    and is what submit_batch, batch_status and ingest_batch work from.
+    """
+    stage = "grade_and_feedback" if include_feedback else "grade"
+    name, model = _batch_target(stage, provider)
+    compiled = compile_rubric_text(rubric)
+    build_messages = combined_messages if include_feedback else grading_messages
+    route = describe_route(stage)
+    manifest = {
+        "source": source, "rubric": rubric, "rubric_id": compiled["id"], "stage": stage,
+        "provider": name, "model": model, "requests_path": requests_path, "requests": 0,
+        "batch_id": None, "status": "prepared", "created_at": time.time(), "submissions": {},
+    }
+    submissions = collect_submissions(source)
+    size = 0
+    with process_pool(parse_workers or os.cpu_count() or 1) as pool, \
+            open(requests_path, "w", encoding="utf-8") as out:
+        texts = pool.map(_parse_submission, [s["file_path"] for s in submissions])
+        for index, (submission, text) in enumerate(zip(submissions, texts)):
+            custom_id = f"s{index}"
+            entry = {"id": submission["id"], "file_path": submission["file_path"], "student": submission.get("student")}
+            manifest["submissions"][custom_id] = entry
+            error = stage_error("parse", text)
+            if error:
+                entry["error"] = error
+                continue
+            text = prompt_text(text)
+            entry["cache_key"], cached = cache_lookup(use_cache, stage, route, compiled["id"], text)
+            if cached is not None:
+                entry["cached"] = cached
+                continue
+            line = json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT,
+                               "body": {"model": model, "messages": build_messages(text, compiled),
+                                        "response_format": {"type": "json_object"}}}) + "\n"
+            size += len(line.encode("utf-8"))
+            manifest["requests"] += 1
+            if manifest["requests"] > MAX_BATCH_REQUESTS or size > MAX_BATCH_BYTES:
+                raise ValueError(f"More than {MAX_BATCH_REQUESTS} requests or {MAX_BATCH_BYTES >> 20} MB; "
+                                 f"split the submissions into several batches")
+            out.write(line)
+    manifest_path = manifest_path_for(requests_path)
+    _save_manifest(manifest_path, manifest)
+    return {"manifest_path": manifest_path, "requests": manifest["requests"], "total": len(submissions),
+            "cached": sum("cached" in e for e in manifest["submissions"].values()),
+            "failed": sum("error" in e for e in manifest["submissions"].values())}
+
+def _client(manifest: dict):
+    provider = PROVIDERS[manifest["provider"]]
+    client = provider.client()
+    if client is None:
+        raise RuntimeError(f"Provider '{manifest['provider']}' is not configured")
+    return client, get_scheduler(manifest["provider"])
+
+def _upload(client, path: str):
+    # Opened per attempt so a retried upload starts from the beginning of the file
+    with open(path, "rb") as f:
+        return client.files.create(file=(os.path.basename(path), f), purpose="batch")
+
+def submit_batch(manifest_path: str) -> dict:
+    """Uploads the requests file and starts the provider batch; a manifest already submitted is left alone."""
+    manifest = load_manifest(manifest_path)
+    if manifest["batch_id"] or not manifest["requests"]:
+        if not manifest["requests"]:
+            manifest["status"] = "completed"
+            _save_manifest(manifest_path, manifest)
+        return {"manifest_path": manifest_path, "batch_id": manifest["batch_id"], "status": manifest["status"]}
+    client, scheduler = _client(manifest)
+    file = scheduler.call(lambda: _upload(client, manifest["requests_path"]), 0)
+    batch = scheduler.call(lambda: client.batches.create(
+        input_file_id=file.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW,
+        metadata={"rubric_id": manifest["rubric_id"], "source": os.path.basename(os.path.normpath(manifest["source"]))},
+    ), 0)
+    manifest.update(batch_id=batch.id, input_file_id=file.id, status=batch.status, submitted_at=time.time())
+    _save_manifest(manifest_path, manifest)
+    return {"manifest_path": manifest_path, "batch_id": batch.id, "status": batch.status,
+            "requests": manifest["requests"]}
+
+def batch_status(manifest_path: str, wait: bool = False, poll_interval: float = BATCH_POLL_INTERVAL,
+                 timeout: float = None) -> dict:
+    """Returns the provider's status of a submitted batch; with wait=True polls until it finishes or times out."""
+    manifest = load_manifest(manifest_path)
+    result = {"manifest_path": manifest_path, "batch_id": manifest["batch_id"], "status": manifest["status"]}
+    if not manifest["batch_id"]:
+        return result
+    client, scheduler = _client(manifest)
+    started = time.monotonic()
+    while True:
+        batch = scheduler.call(lambda: client.batches.retrieve(manifest["batch_id"]), 0)
+        if batch.status in TERMINAL_STATUSES or not wait or (timeout and time.monotonic() - started >= timeout):
+            break
+        time.sleep(poll_interval)
+    manifest.update(status=batch.status, output_file_id=batch.output_file_id, error_file_id=batch.error_file_id)
+    _save_manifest(manifest_path, manifest)
+    counts = batch.request_counts
+    result.update(status=batch.status, request_counts=counts.model_dump() if counts else None)
+    return result
+
+def cancel_batch(manifest_path: str) -> dict:
+    manifest = load_manifest(manifest_path)
+    if not manifest["batch_id"]:
+        return {"manifest_path": manifest_path, "batch_id": None, "status": manifest["status"]}
+    client, scheduler = _client(manifest)
+    batch = scheduler.call(lambda: client.batches.cancel(manifest["batch_id"]), 0)
+    manifest["status"] = batch.status
+    _save_manifest(manifest_path, manifest)
+    return {"manifest_path": manifest_path, "batch_id": batch.id, "status": batch.status}
+
+def _download(client, file_id: str, path: str) -> str:
+    with client.files.with_streaming_response.content(file_id) as response:
+        response.stream_to_file(path)
+    return path
+
+def _read_result(line: dict, compiled: dict, include_feedback: bool):
+    """Returns (grade result, error) for one line of a batch output or error file."""
+    if line.get("error"):
+        return None, f"grade: {line['error'].get('message') or line['error'].get('code')}"
+    response = line["response"]
+    body = response.get("body") or {}
+    if response.get("status_code") != 200:
+        return None, f"grade: {(body.get('error') or {}).get('message') or 'HTTP ' + str(response.get('status_code'))}"
+    try:
+        result = json.loads(body["choices"][0]["message"]["content"])
+        if include_feedback:
+            result = validate_grade_result(result, require_feedback=True)
+        return check_breakdown(result, compiled), None
+    except Exception as e:
+        return None, f"grade: Grading failed: {str(e)}"
+
+def ingest_batch(manifest_path: str, output_path: str, assignment: str = None, save_results: bool = True) -> dict:
+    """Reads a finished batch's results into the JSONL format of grade_batch, the result cache and the results store.
+
+    Provider output and error files are streamed to disk next to the manifest and
+    read line by line. Ingesting again only adds submissions not yet in output_path.
+    """
+    manifest = load_manifest(manifest_path)
+    if manifest["batch_id"] and manifest["status"] not in TERMINAL_STATUSES:
+        manifest["status"] = batch_status(manifest_path)["status"]
+        if manifest["status"] not in TERMINAL_STATUSES:
+            raise RuntimeError(f"Batch {manifest['batch_id']} is still {manifest['status']}")
+        manifest = load_manifest(manifest_path)
+
+    compiled = compile_rubric_text(manifest["rubric"])
+    include_feedback = manifest["stage"] == "grade_and_feedback"
+    assignment = assignment or os.path.splitext(os.path.basename(os.path.normpath(manifest["source"])))[0]
+    completed = load_completed_ids(output_path)
+    summary = {"output_path": output_path, "batch_id": manifest["batch_id"], "status": manifest["status"],
+               "total": len(manifest["submissions"]), "succeeded": 0, "failed": 0, "skipped": 0, "cached": 0,
+               "prompt_tokens": 0, "completion_tokens": 0}
+    unsaved = []
+    answered = set()
+
+    with open_for_append(output_path) as out:
+
+        def write(entry, grade, error, cached=False):
+            if entry["id"] in completed:
+                summary["skipped"] += 1
+                return
+            record = {"id": entry["id"], "file_path": entry["file_path"], "batch_id": manifest["batch_id"]}
+            if grade is not None:
+                grade = dict(grade)
+                if include_feedback:
+                    record["feedback"] = grade.pop("feedback", None)
+                record["grade"] = grade
+            record["status"] = "error" if error else "ok"
+            if error:
+                record["error"] = error
+                summary["failed"] += 1
+            else:
+                summary["succeeded"] += 1
+                summary["cached"] += cached
+                unsaved.append(result_record(grade, record.get("feedback"), assignment,
+                                             entry.get("student") or entry["id"], manifest["rubric_id"],
+                                             entry["id"], source=entry["file_path"]))
+            out.write(json.dumps(record) + "\n")
+            if save_results and len(unsaved) >= RESULTS_BATCH_SIZE:
+                get_results_store().add_many(unsaved)
+                unsaved.clear()
+
+        client = None
+        for field in ("output_file_id", "error_file_id"):
+            if not manifest.get(field):
+                continue
+            if client is None:
+                client, scheduler = _client(manifest)
+            # e.g. batch_requests.output.jsonl next to batch_requests.jsonl
+            path = f"{os.path.splitext(manifest['requests_path'])[0]}.{field.split('_')[0]}.jsonl"
+            scheduler.call(lambda: _download(client, manifest[field], path), 0)
+            with open(path, encoding="utf-8") as f:
+                for raw in f:
+                    if not raw.strip():
+                        continue
+                    line = json.loads(raw)
+                    entry = manifest["submissions"].get(line.get("custom_id"))
+                    if entry is None:
+                        continue
+                    answered.add(line["custom_id"])
+                    usage = ((line.get("response") or {}).get("body") or {}).get("usage") or {}
+                    summary["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                    summary["completion_tokens"] += usage.get("completion_tokens", 0)
+                    grade, error = _read_result(line, compiled, include_feedback)
+                    registry.count("grader_llm_batch_requests_total", provider=manifest["provider"],
+                                   status="error" if error else "ok")
+                    if grade is not None:
+                        cache_store(entry.get("cache_key"), grade)
+                    write(entry, grade, error)
+
+        for custom_id, entry in manifest["submissions"].items():
+            if custom_id in answered:
+                continue
+            if "error" in entry:
+                write(entry, None, entry["error"])
+            elif "cached" in entry:
+                write(entry, entry["cached"], None, cached=True)
+            else:
+                write(entry, None, f"grade: No result in batch {manifest['batch_id']} ({manifest['status']})")
+        out.flush()
+
+    if save_results and unsaved:
+        get_results_store().add_many(unsaved)
+    manifest.update(ingested_at=time.time())
+    _save_manifest(manifest_path, manifest)
+    return summary
+
+def grade_provider_batch(source: str, rubric: str, output_path: str, requests_path: str = None,
+                         include_feedback: bool = True, poll_interval: float = BATCH_POLL_INTERVAL,
+                         assignment: str = None, save_results: bool = True, parse_workers: int = None,
+                         provider: str = None) -> dict:
+    """Prepares, submits, waits for and ingests a provider batch in one go."""
+    requests_path = requests_path or os.path.splitext(output_path)[0] + ".requests.jsonl"
+    prepared = prepare_batch(source, rubric, requests_path, include_feedback, parse_workers, provider)
+    submit_batch(prepared["manifest_path"])
+    batch_status(prepared["manifest_path"], wait=True, poll_interval=poll_interval)
+    return ingest_batch(prepared["manifest_path"], output_path, assignment, save_results)
+
+# CLI
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade submissions through a provider's batch API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_prepare_arguments(command):
+        command.add_argument("source", help="Directory of PDF/DOCX files or a manifest (.jsonl, .json, .csv, .txt)")
+        command.add_argument("--rubric", required=True, help="Rubric text or path to a file containing it")
+        command.add_argument("--no-feedback", action="store_true", help="Only grade, skip feedback generation")
+        command.add_argument("--parse-workers", type=int, default=None, help="Processes used for parsing")
+        command.add_argument("--provider", default=None, help="OpenAI-compatible provider to send the batch to")
+
+    def add_ingest_arguments(command):
+        command.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to")
+        command.add_argument("--assignment", default=None, help="Assignment name results are stored under")
+        command.add_argument("--no-store", action="store_true", help="Do not write results to the results store")
+
+    run = commands.add_parser("run", help="Prepare, submit, wait for and ingest a batch")
+    add_prepare_arguments(run)
+    add_ingest_arguments(run)
+    run.add_argument("--requests", default=None, help="Batch requests file to write")
+    run.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL, help="Seconds between status checks")
+    prepare = commands.add_parser("prepare", help="Write the batch requests file and its manifest")
+    add_prepare_arguments(prepare)
+    prepare.add_argument("--requests", default="batch_requests.jsonl", help="Batch requests file to write")
+    commands.add_parser("submit", help="Upload a prepared batch").add_argument("manifest")
+    status = commands.add_parser("status", help="Show a submitted batch's status")
+    status.add_argument("manifest")
+    status.add_argument("--wait", action="store_true", help="Poll until the batch has finished")
+    status.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL, help="Seconds between checks")
+    commands.add_parser("cancel", help="Cancel a submitted batch").add_argument("manifest")
+    ingest = commands.add_parser("ingest", help="Read a finished batch's results")
+    ingest.add_argument("manifest")
+    add_ingest_arguments(ingest)
+    args = parser.parse_args()
+
+    rubric = getattr(args, "rubric", None)
+    if rubric and os.path.isfile(rubric):
+        with open(rubric, encoding="utf-8") as f:
+            rubric = f.read()
+
+    if args.command == "run":
+        result = grade_provider_batch(args.source, rubric, args.output, args.requests, not args.no_feedback,
+                                      args.poll_interval, args.assignment, not args.no_store, args.parse_workers,
+                                      args.provider)
+    elif args.command == "prepare":
+        result = prepare_batch(args.source, rubric, args.requests, not args.no_feedback, args.parse_workers,
+                               args.provider)
+    elif args.command == "submit":
+        result = submit_batch(args.manifest)
+    elif args.command == "status":
+        result = batch_status(args.manifest, args.wait, args.poll_interval)
+    elif args.command == "cancel":
+        result = cancel_batch(args.manifest)
+    else:
+        result = ingest_batch(args.manifest, args.output, args.assignment, not args.no_store)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import csv
+import html
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from rubric import parse_fraction
+
+RESULTS_DB_PATH = os.getenv("GRADER_RESULTS_DB", ".grader_results.sqlite")
+# Rows fetched from SQLite at a time while exporting
+EXPORT_BATCH_ROWS = 500
+EXPORT_FORMATS = ("csv", "parquet", "pdf")
+PERCENTILES = (10, 25, 50, 75, 90)
+
+COLUMNS = ("id", "assignment", "student", "submission_id", "rubric_id", "grade", "score", "max_score", "percent",
+           "breakdown", "summary", "feedback", "plagiarism_max", "source", "graded_at")
+
+def _timestamp(value):
+    """Accepts epoch seconds or an ISO date/time string."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def result_record(grade_result: dict, feedback: str = None, assignment: str = None, student: str = None,
+                  rubric_id: str = None, submission_id: str = None, plagiarism: dict = None,
+                  source: str = None, graded_at: float = None) -> dict:
+    """Flattens a grading result into a results-store record."""
+    score, max_score = parse_fraction(grade_result.get("score") or "")
+    if score is not None and max_score is None:
+        max_score = 100.0
+    similarities = [value for value in (plagiarism or {}).values() if isinstance(value, (int, float))]
+    return {
+        "assignment": assignment or "",
+        "student": student or "",
+        "submission_id": submission_id,
+        "rubric_id": rubric_id,
+        "grade": grade_result.get("grade"),
+        "score": score,
+        "max_score": max_score,
+        "percent": round(100 * score / max_score, 2) if score is not None and max_score else None,
+        "breakdown": grade_result.get("breakdown") or {},
+        "summary": grade_result.get("summary"),
+        "feedback": feedback if isinstance(feedback, str) and not feedback.startswith("Error") else None,
+        "plagiarism_max": max(similarities) if similarities else None,
+        "source": source,
+        "graded_at": graded_at or time.time(),
+    }
+
+class ResultsStore:
+    """Grading results in SQLite, indexed for per-assignment, per-student and per-rubric queries over time.
+
+    Criterion scores from each breakdown are kept in their own table so averages
+    per criterion are computed by SQLite rather than by parsing JSON.
+    """
+
+    def __init__(self, path: str = RESULTS_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    assignment TEXT NOT NULL,
+                    student TEXT NOT NULL,
+                    submission_id TEXT,
+                    rubric_id TEXT,
+                    grade TEXT,
+                    score REAL,
+                    max_score REAL,
+                    percent REAL,
+                    breakdown TEXT,
+                    summary TEXT,
+                    feedback TEXT,
+                    plagiarism_max REAL,
+                    source TEXT,
+                    graded_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_criteria (
+                    result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+                    criterion TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    max_score REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_assignment ON results (assignment, graded_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_student ON results (student, graded_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_rubric ON results (rubric_id, graded_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_graded_at ON results (graded_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_result_criteria_result ON result_criteria (result_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_many(self, records: list) -> list:
+        """Inserts records from result_record() in one transaction and returns their ids."""
+        ids = []
+        with self._connect() as conn:
+            for record in records:
+                cursor = conn.execute(
+                    "INSERT INTO results (assignment, student, submission_id, rubric_id, grade, score, max_score, "
+                    "percent, breakdown, summary, feedback, plagiarism_max, source, graded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (record["assignment"], record["student"], record.get("submission_id"), record.get("rubric_id"),
+                     record.get("grade"), record.get("score"), record.get("max_score"), record.get("percent"),
+                     json.dumps(record.get("breakdown") or {}), record.get("summary"), record.get("feedback"),
+                     record.get("plagiarism_max"), record.get("source"), record["graded_at"]))
+                ids.append(cursor.lastrowid)
+                criteria = []
+                for criterion, value in (record.get("breakdown") or {}).items():
+                    score, max_score = parse_fraction(value)
+                    if score is not None:
+                        criteria.append((cursor.lastrowid, criterion, score, max_score))
+                conn.executemany("INSERT INTO result_criteria (result_id, criterion, score, max_score) "
+                                 "VALUES (?, ?, ?, ?)", criteria)
+        return ids
+
+    def add(self, record: dict) -> int:
+        return self.add_many([record])[0]
+
+    # Queries
+
+    @staticmethod
+    def _where(assignment=None, student=None, rubric_id=None, since=None, until=None, ids=None):
+        clauses = []
+        params = []
+        for column, value in (("assignment", assignment), ("student", student), ("rubric_id", rubric_id)):
+            if value:
+                clauses.append(f"r.{column} = ?")
+                params.append(value)
+        if since not in (None, ""):
+            clauses.append("r.graded_at >= ?")
+            params.append(_timestamp(since))
+        if until not in (None, ""):
+            clauses.append("r.graded_at < ?")
+            params.append(_timestamp(until))
+        if ids:
+            clauses.append(f"r.id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    @staticmethod
+    def _row(row) -> dict:
+        record = dict(zip(COLUMNS, row))
+        record["breakdown"] = json.loads(record["breakdown"] or "{}")
+        return record
+
+    def iter_results(self, batch_size: int = EXPORT_BATCH_ROWS, **filters):
+        """Yields matching results oldest first, fetching batch_size rows at a time."""
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM results r{where} ORDER BY r.graded_at, r.id",
+                                  params)
+            while rows := cursor.fetchmany(batch_size):
+                for row in rows:
+                    yield self._row(row)
+
+    def query(self, limit: int = 50, offset: int = 0, **filters) -> list:
+        """Returns matching results, newest first."""
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM results r{where} "
+                                f"ORDER BY r.graded_at DESC, r.id DESC LIMIT ? OFFSET ?",
+                                params + [limit, offset]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def stats(self, **filters) -> dict:
+        """Returns count, mean, spread and percentiles of percentage scores plus per-criterion averages."""
+        where, params = self._where(**filters)
+        scored = where + (" AND " if where else " WHERE ") + "r.percent IS NOT NULL"
+        with self._connect() as conn:
+            count, students, mean, low, high, mean_square = conn.execute(
+                f"SELECT COUNT(*), COUNT(DISTINCT r.student), AVG(r.percent), MIN(r.percent), MAX(r.percent), "
+                f"AVG(r.percent * r.percent) FROM results r{scored}", params).fetchone()
+            result = {"count": count, "students": students}
+            if not count:
+                return result
+            percentiles = {}
+            for p in PERCENTILES:
+                # Nearest-rank percentile; SQLite sorts, so only one value comes back
+                offset = max(math.ceil(p / 100 * count) - 1, 0)
+                percentiles[f"p{p}"] = round(conn.execute(
+                    f"SELECT r.percent FROM results r{scored} ORDER BY r.percent LIMIT 1 OFFSET ?",
+                    params + [offset]).fetchone()[0], 2)
+            criteria = conn.execute(
+                f"SELECT c.criterion, COUNT(*), AVG(c.score), AVG(c.max_score), AVG(100.0 * c.score / c.max_score) "
+                f"FROM result_criteria c JOIN results r ON r.id = c.result_id{where} "
+                f"GROUP BY c.criterion ORDER BY c.criterion", params).fetchall()
+        result.update({
+            "mean_percent": round(mean, 2),
+            "stdev_percent": round(math.sqrt(max(mean_square - mean * mean, 0.0)), 2),
+            "min_percent": round(low, 2),
+            "max_percent": round(high, 2),
+            "percentiles": percentiles,
+            "criteria": {name: {"count": n, "mean_score": round(score, 2),
+                                "max_score": round(max_score, 2) if max_score is not None else None,
+                                "mean_percent": round(percent, 2) if percent is not None else None}
+                         for name, n, score, max_score, percent in criteria},
+        })
+        return result
+
+    def distribution(self, bins: int = 10, **filters) -> dict:
+        """Returns counts per letter grade and a histogram of percentage scores in equal-width bins."""
+        bins = max(int(bins), 1)
+        width = 100.0 / bins
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            grades = conn.execute(f"SELECT COALESCE(r.grade, ''), COUNT(*) FROM results r{where} "
+                                  f"GROUP BY r.grade ORDER BY COUNT(*) DESC", params).fetchall()
+            scored = where + (" AND " if where else " WHERE ") + "r.percent IS NOT NULL"
+            counts = dict(conn.execute(
+                f"SELECT MIN(MAX(CAST(r.percent / ? AS INTEGER), 0), ?) AS bin, COUNT(*) FROM results r{scored} "
+                f"GROUP BY bin", [width, bins - 1] + params).fetchall())
+        histogram = [{"from": round(i * width, 2), "to": round((i + 1) * width, 2), "count": counts.get(i, 0)}
+                     for i in range(bins)]
+        return {"grades": {grade or "ungraded": n for grade, n in grades}, "histogram": histogram,
+                "count": sum(n for _, n in grades)}
+
+    def export(self, output, fmt: str = None, **filters) -> dict:
+        """Streams matching results to a path or binary file object as CSV, Parquet or PDF."""
+        if fmt is None and isinstance(output, str):
+            fmt = os.path.splitext(output)[1].lstrip(".").lower()
+        return {"rows": export_records(self.iter_results(**filters), output, fmt),
+                "format": fmt, **({"output_path": output} if isinstance(output, str) else {})}
+
+# Export
+
+def export_records(records, output, fmt: str) -> int:
+    """Writes an iterable of records to a path or binary file object, one record at a time; returns the count."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'; use one of {', '.join(EXPORT_FORMATS)}")
+    return {"csv": _export_csv, "parquet": _export_parquet, "pdf": _export_pdf}[fmt](records, output)
+
+def _flat(record: dict) -> dict:
+    row = {column: record.get(column) for column in COLUMNS}
+    row["breakdown"] = json.dumps(record.get("breakdown") or {})
+    row["graded_at"] = datetime.fromtimestamp(record["graded_at"]).isoformat(timespec="seconds")
+    return row
+
+@contextmanager
+def _binary(output):
+    if isinstance(output, str):
+        with open(output, "wb") as f:
+            yield f
+    else:
+        yield output
+
+def _export_csv(records, output) -> int:
+    import io
+
+    count = 0
+    with _binary(output) as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="", write_through=True)
+        writer = csv.DictWriter(text, fieldnames=COLUMNS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(_flat(record))
+            count += 1
+        # Leave a caller's file object open
+        text.detach()
+    return count
+
+def _export_parquet(records, output, batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError('Parquet export needs pyarrow; install the "parquet" extra')
+
+    schema = pa.schema([("id", pa.int64()), ("assignment", pa.string()), ("student", pa.string()),
+                        ("submission_id", pa.string()), ("rubric_id", pa.string()), ("grade", pa.string()),
+                        ("score", pa.float64()), ("max_score", pa.float64()), ("percent", pa.float64()),
+                        ("breakdown", pa.string()), ("summary", pa.string()), ("feedback", pa.string()),
+                        ("plagiarism_max", pa.float64()), ("source", pa.string()), ("graded_at", pa.string())])
+    count = 0
+    batch = []
+    with pq.ParquetWriter(output, schema) as writer:
+        for record in records:
+            batch.append(_flat(record))
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch or not count:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+def _record_html(record: dict) -> str:
+    e = lambda value: html.escape(f"{value:g}" if isinstance(value, float) else str(value)) \
+        if value not in (None, "") else "&ndash;"
+    rows = "".join(f"<tr><td>{e(name)}</td><td>{e(value)}</td></tr>" for name, value in record["breakdown"].items())
+    feedback = ""
+    for line in (record.get("feedback") or "").splitlines():
+        line = line.strip()
+        if line.startswith("#"):
+            feedback += f"<h3>{e(line.lstrip('#').strip())}</h3>"
+        elif line:
+            feedback += f"<p>{e(line)}</p>"
+    graded = datetime.fromtimestamp(record["graded_at"]).strftime("%Y-%m-%d %H:%M")
+    return (f"<h1>{e(record.get('student'))}</h1>"
+            f"<p><b>Assignment:</b> {e(record.get('assignment'))}<br/><b>Graded:</b> {graded}</p>"
+            f"<h2>Grade: {e(record.get('grade'))} ({e(record.get('score'))}/{e(record.get('max_score'))})</h2>"
+            + (f"<table><tr><th>Criterion</th><th>Score</th></tr>{rows}</table>" if rows else "")
+            + (f"<p>{e(record.get('summary'))}</p>" if record.get("summary") else "")
+            + feedback)
+
+def _export_pdf(records, output) -> int:
+    """One report per result, each starting on a new page; pages are written out as they are laid out."""
+    import pymupdf
+
+    page = pymupdf.paper_rect("a4")
+    area = page + (50, 50, -50, -50)
+    css = "body {font-family: sans-serif; font-size: 10pt;} table {border-collapse: collapse;} " \
+          "td, th {border: 1px solid #999; padding: 3px 6px;} h1 {font-size: 16pt;} h2 {font-size: 13pt;}"
+    count = 0
+    writer = pymupdf.DocumentWriter(output)
+    try:
+        for record in records:
+            story = pymupdf.Story(_record_html(record), user_css=css)
+            more = True
+            while more:
+                device = writer.begin_page(page)
+                more, _ = story.place(area)
+                story.draw(device)
+                writer.end_page()
+            count += 1
+        if not count:
+            writer.begin_page(page)
+            writer.end_page()
+    finally:
+        writer.close()
+    return count
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_results_store():
+    """Returns the process-wide results store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultsStore()
+    return _store
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+RUBRIC_DB_PATH = os.getenv("GRADER_RUBRIC_DB", ".grader_rubrics.sqlite")
+
+_UNIT = r"(?:%|pts?\.?|points?|marks?)"
+
+# Matches lines such as "Content (40%): description", "Analysis - 30 points: description"
+# or "Style (10): description", with the weight before the colon
+_CRITERION_RE = re.compile(
+    r"^\s*[-*\d.)]*\s*(?P<name>[^:(\n]+?)\s*[(\-–—]\s*(?P<weight>\d+(?:\.\d+)?)\s*" + _UNIT
+    + r"?\s*\)?\s*:?\s*(?P<description>.*)$",
+    re.IGNORECASE,
+)
+# Matches lines such as "Content: 40 points", "Style: 60 pts - description" or "Style: (10) description"
+_TRAILING_WEIGHT_RE = re.compile(
+    r"^\s*[-*\d.)]*\s*(?P<name>[^:(\n]+?)\s*:\s*(?:\(\s*(?P<weight>\d+(?:\.\d+)?)\s*" + _UNIT
+    + r"?\s*\)|(?P<points>\d+(?:\.\d+)?)\s*" + _UNIT + r")\s*[-–—:,.]?\s*(?P<description>.*)$",
+    re.IGNORECASE,
+)
+# Matches "Total: 100 points", "Sum = 100" and similar lines, which state the maximum rather than a criterion
+_TOTAL_RE = re.compile(
+    r"^\s*[-*]*\s*(?:total|sum|max(?:imum)?\s+(?:score|points|marks))(?:\s+(?:score|points|marks))?"
+    r"\s*[:=(\-–—]?\s*(?:(?P<total>\d+(?:\.\d+)?)\s*" + _UNIT + r"?)?\s*\)?\s*$",
+    re.IGNORECASE,
+)
+# Separates several criteria written on one line, as in "Content: 40 points / Style: 60 points"
+_INLINE_SEPARATOR_RE = re.compile(r"\s+[/;|]\s+")
+
+def _weighted_criterion(line: str):
+    match = _CRITERION_RE.match(line) or _TRAILING_WEIGHT_RE.match(line)
+    if not match:
+        return None
+    weight = match.groupdict().get("points") or match.group("weight")
+    return {"name": match.group("name").strip(), "weight": float(weight), "description": match.group("description").strip()}
+
+def parse_criteria(rubric: str) -> list:
+    """Splits a free-text rubric into criteria with name, weight and description.
+
+    Weights may be given as percentages, points or a bare number in parentheses.
+    A "Total"/"Sum" line states the maximum instead of adding a criterion; without
+    one the maximum is 100, or the sum of the weights when every line has one.
+    Lines without a weight share whatever remains of the maximum, and the weights
+    are then scaled so they add up to it. A rubric with no recognizable criteria
+    becomes a single "Overall" one.
+    """
+    criteria = []
+    stated_total = None
+    for line in rubric.splitlines():
+        if not line.strip():
+            continue
+        total = _TOTAL_RE.match(line)
+        if total:
+            if total.group("total"):
+                stated_total = float(total.group("total"))
+            continue
+        parts = _INLINE_SEPARATOR_RE.split(line)
+        inline = [_weighted_criterion(part) for part in parts] if len(parts) > 1 else []
+        if inline and all(inline):
+            criteria.extend(inline)
+            continue
+        criterion = _weighted_criterion(line)
+        if criterion:
+            criteria.append(criterion)
+        elif ":" in line:
+            name, description = line.split(":", 1)
+            criteria.append({"name": name.strip(" -*"), "weight": None, "description": description.strip()})
+        elif criteria:
+            # Continuation of the previous criterion's description
+            criteria[-1]["description"] = (criteria[-1]["description"] + " " + line.strip()).strip()
+
+    if not criteria:
+        return [{"name": "Overall", "weight": stated_total or 100.0, "description": rubric.strip()}]
+
+    weighted = [c["weight"] for c in criteria if c["weight"] is not None]
+    unweighted = [c for c in criteria if c["weight"] is None]
+    maximum = stated_total or (100.0 if unweighted or not sum(weighted) else sum(weighted))
+    if unweighted:
+        remaining = maximum - sum(weighted)
+        # With nothing left over, unweighted lines count as much as an average weighted one
+        share = remaining / len(unweighted) if remaining > 0 else sum(weighted) / len(weighted)
+        for criterion in unweighted:
+            criterion["weight"] = share
+    total = sum(c["weight"] for c in criteria)
+    if total and abs(total - maximum) > 1e-9:
+        for criterion in criteria:
+            criterion["weight"] = criterion["weight"] * maximum / total
+    return criteria
+
+def letter_grade(percent: float) -> str:
+    """Maps a percentage to a letter grade on the usual US scale."""
+    for cutoff, letter in ((93, "A"), (90, "A-"), (87, "B+"), (83, "B"), (80, "B-"),
+                           (77, "C+"), (73, "C"), (70, "C-"), (60, "D")):
+        if percent >= cutoff:
+            return letter
+    return "F"
+
+def compile_rubric(rubric: str) -> dict:
+    """Parses a rubric once into criteria, weights and a canonical prompt rendering.
+
+    The rendering only depends on the rubric's normalized text, so every prompt built
+    from the same rubric starts with a byte-identical prefix that provider-side
+    prompt caching can reuse. The id is a hash of that rendering.
+    """
+    normalized = "\n".join(line.strip() for line in rubric.strip().splitlines() if line.strip())
+    criteria = parse_criteria(normalized)
+    scoring = "\n".join(f"- {c['name']}: max {c['weight']:g} points" for c in criteria)
+    rendered = f"{normalized}\n\nMaximum points per criterion:\n{scoring}"
+    return {
+        "id": hashlib.sha256(rendered.encode("utf-8")).hexdigest()[:16],
+        "criteria": criteria,
+        "max_score": sum(c["weight"] for c in criteria),
+        "rendered": rendered,
+    }
+
+def parse_fraction(value):
+    """Reads "35/40", "35 / 40", "35" or 35 into (score, max or None)."""
+    if isinstance(value, (int, float)):
+        return float(value), None
+    match = re.match(r"^\s*(-?\d+(?:\.\d+)?)\s*(?:/\s*(\d+(?:\.\d+)?))?", str(value))
+    if not match:
+        return None, None
+    return float(match.group(1)), float(match.group(2)) if match.group(2) else None
+
+def _match_criterion(name: str, criteria: list):
+    key = name.strip().lower()
+    for criterion in criteria:
+        if criterion["name"].lower() == key:
+            return criterion
+    for criterion in criteria:
+        if key.startswith(criterion["name"].lower()) or criterion["name"].lower().startswith(key):
+            return criterion
+    return None
+
+def check_breakdown(result: dict, compiled: dict) -> dict:
+    """Recomputes score and grade from the breakdown using the compiled weights.
+
+    This is only done when every compiled criterion is matched by exactly one
+    breakdown entry and every entry has a readable score. Each entry is then
+    rescaled to its criterion's weight and clamped, so the total no longer depends
+    on the model's arithmetic; the model's own figures are kept under
+    "score_check" when they disagree. Otherwise the model's score and grade are
+    left as they are and "breakdown_mismatch" says which entries did not line up.
+    """
+    breakdown = result.get("breakdown")
+    if not isinstance(breakdown, dict) or not breakdown:
+        return result
+
+    matched = {}
+    unmatched = []
+    for name, value in breakdown.items():
+        criterion = _match_criterion(name, compiled["criteria"])
+        score, out_of = parse_fraction(value)
+        if criterion is None or score is None:
+            unmatched.append(name)
+        else:
+            matched.setdefault(criterion["name"], []).append((criterion, score, out_of))
+    missing = [c["name"] for c in compiled["criteria"] if c["name"] not in matched]
+    duplicated = [name for name, entries in matched.items() if len(entries) > 1]
+    if unmatched or missing or duplicated:
+        result["breakdown_mismatch"] = {"unmatched": unmatched, "missing": missing, "duplicated": duplicated}
+        return result
+
+    total = 0.0
+    checked = {}
+    for name, [(criterion, score, out_of)] in matched.items():
+        weight = criterion["weight"]
+        if out_of and out_of != weight:
+            score = score / out_of * weight
+        score = round(min(max(score, 0.0), weight), 1)
+        total += score
+        checked[name] = f"{score:g}/{weight:g}"
+
+    max_score = compiled["max_score"] or 100.0
+    percent = 100 * total / max_score
+    computed_score = f"{round(total, 1):g}/{max_score:g}"
+    computed_grade = letter_grade(percent)
+    if result.get("score") != computed_score or result.get("grade") != computed_grade:
+        result["score_check"] = {"model_score": result.get("score"), "model_grade": result.get("grade")}
+    result["breakdown"] = checked
+    result["score"] = computed_score
+    result["grade"] = computed_grade
+    return result
+
+class RubricRegistry:
+    """Stores compiled rubrics in SQLite so tools can refer to them by id."""
+
+    def __init__(self, path: str = RUBRIC_DB_PATH):
+        self.path = path
+        self._compiled = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rubrics (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    compiled TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, rubric: str) -> dict:
+        compiled = compile_rubric(rubric)
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO rubrics (id, source, compiled, created_at) VALUES (?, ?, ?, ?)",
+                         (compiled["id"], rubric, json.dumps(compiled), time.time()))
+        with self._lock:
+            self._compiled[compiled["id"]] = compiled
+        return compiled
+
+    def get(self, rubric_id: str):
+        """Returns the compiled rubric for an id, or None if it was never registered."""
+        with self._lock:
+            if rubric_id in self._compiled:
+                return self._compiled[rubric_id]
+        with self._connect() as conn:
+            row = conn.execute("SELECT compiled FROM rubrics WHERE id = ?", (rubric_id,)).fetchone()
+        if row is None:
+            return None
+        compiled = json.loads(row[0])
+        with self._lock:
+            self._compiled[rubric_id] = compiled
+        return compiled
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_rubric_registry():
+    """Returns the process-wide rubric registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = RubricRegistry()
+    return _registry
@@ -0,0 +1,320 @@
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+SEMANTIC_INDEX_DIR = os.getenv("GRADER_SEMANTIC_INDEX", ".grader_semantic")
+# A fastembed model (install the "semantic" extra); "hashing" selects the lexical embedder, which
+# needs no model files and is also used, with a warning, when the model can't be loaded
+EMBEDDING_MODEL = os.getenv("GRADER_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+EMBEDDING_THREADS = int(os.getenv("GRADER_EMBEDDING_THREADS", "0")) or None
+# Cosine similarity above which two paragraphs count as near-duplicates; defaults depend on the embedder
+SEMANTIC_THRESHOLD = float(os.getenv("GRADER_SEMANTIC_THRESHOLD", "0")) or None
+HASHING_DIM = 512
+# Paragraphs shorter than this are merged with the next one, longer ones are cut into windows
+MIN_PARAGRAPH_WORDS = 25
+MAX_PARAGRAPH_WORDS = 200
+# Indexed vectors dequantized per matrix product while scanning; small blocks stay in cache
+SCAN_BLOCK_ROWS = 4096
+
+_logger = logging.getLogger("grader.semantic")
+
+_WORD_RE = re.compile(r"\w+")
+_BLOCK_RE = re.compile(r"[^\n]*\S[^\n]*(?:\n[^\n]*\S[^\n]*)*")
+
+def paragraphs(text: str) -> list:
+    """Returns (start, end) offsets of the paragraphs of a text.
+
+    Short paragraphs (headings, list items) are joined to the next one and long
+    ones are cut into near-equal windows, so every span holds between
+    MIN_PARAGRAPH_WORDS and MAX_PARAGRAPH_WORDS words where the text allows.
+    """
+    spans = []
+    pending = None
+    for block in _BLOCK_RE.finditer(text):
+        words = list(_WORD_RE.finditer(block.group()))
+        if not words:
+            continue
+        if len(words) > MAX_PARAGRAPH_WORDS:
+            if pending:
+                spans.append(pending[:2])
+                pending = None
+            windows = math.ceil(len(words) / MAX_PARAGRAPH_WORDS)
+            size = math.ceil(len(words) / windows)
+            for i in range(0, len(words), size):
+                last = words[min(i + size, len(words)) - 1]
+                spans.append((block.start() + words[i].start(), block.start() + last.end()))
+            continue
+        start = pending[0] if pending else block.start()
+        count = (pending[2] if pending else 0) + len(words)
+        pending = (start, block.end(), count)
+        if count >= MIN_PARAGRAPH_WORDS:
+            spans.append(pending[:2])
+            pending = None
+    if pending:
+        if spans:
+            spans[-1] = (spans[-1][0], pending[1])
+        else:
+            spans.append(pending[:2])
+    return spans
+
+# Embedders
+
+_STOPWORDS = frozenset("a an and are as at be been but by can for from had has have in into is it its of on or "
+                       "so than that the their there these they this those to was were which while with".split())
+_SUFFIXES = ("ations", "ation", "ments", "ment", "ness", "ings", "ing", "ies", "ied", "ed", "ly", "es", "s")
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+class HashingEmbedder:
+    """Signed feature hashing of stemmed words, word pairs and character trigrams.
+
+    Needs no model files and is cheap enough to embed every paragraph of a
+    cohort on one core. Word order, inflection and light rewording barely move
+    the vector, but unlike a trained model it does not know synonyms.
+    """
+
+    backend = "hashing"
+    # Matches are lexical overlap, not paraphrase
+    kind = "lexical"
+    threshold = 0.6
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: list) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+            features = Counter(words)
+            features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+            trigrams = Counter(f"#{w[i:i + 3]}" for w in words for i in range(max(len(w) - 2, 1)))
+            for feature, count in features.items():
+                self._add(vectors[row], feature, 1 + math.log(count))
+            for feature, count in trigrams.items():
+                self._add(vectors[row], feature, 0.5 * (1 + math.log(count)))
+        return _normalized(vectors)
+
+    def _add(self, vector, feature: str, weight: float):
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % self.dim] += weight if h & 0x80000000 else -weight
+
+class FastEmbedEmbedder:
+    """A sentence-embedding model run locally on the CPU through fastembed's ONNX runtime."""
+
+    backend = "fastembed"
+    kind = "semantic"
+    threshold = 0.88
+
+    def __init__(self, model_name: str):
+        try:
+            from fastembed import TextEmbedding
+        except ImportError:
+            raise RuntimeError(f"Embedding model '{model_name}' needs the fastembed package")
+        self.name = model_name
+        self._model = TextEmbedding(model_name, threads=EMBEDDING_THREADS)
+
+    def embed(self, texts: list) -> np.ndarray:
+        return _normalized(np.asarray(list(self._model.embed(texts)), dtype=np.float32))
+
+def quantize(vectors: np.ndarray):
+    """Returns int8 codes and one float32 scale per row."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+# Index
+
+class SemanticIndex:
+    """Paragraph embeddings of every indexed submission, for near-duplicate search.
+
+    Vectors are quantized to int8 with one scale per row and appended to flat
+    files that queries scan through a memory map, so adding a submission writes
+    only its own rows and a query is a handful of matrix products over the whole
+    history. Paragraph offsets and texts are kept in SQLite alongside; each
+    embedding model gets its own directory since their vectors do not compare.
+    """
+
+    def __init__(self, embedder, directory: str = SEMANTIC_INDEX_DIR):
+        self.embedder = embedder
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]+", "_", embedder.name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.db_path = os.path.join(self.directory, "paragraphs.sqlite")
+        self.vectors_path = os.path.join(self.directory, "vectors.i8")
+        self.scales_path = os.path.join(self.directory, "scales.f4")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS paragraphs (
+                    row INTEGER PRIMARY KEY,
+                    submission_id TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_paragraphs_submission ON paragraphs (submission_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _meta(conn, key: str, default: int = 0) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _append(self, path: str, offset: int, data: bytes):
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            # Drop anything an interrupted add wrote past the last committed row
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+
+    def add(self, submission_id: str, text: str) -> int:
+        """Adds or replaces a submission's paragraphs and returns how many were indexed."""
+        spans = paragraphs(text)
+        if not spans:
+            return 0
+        codes, scales = quantize(self.embedder.embed([text[start:end] for start, end in spans]))
+        with self._connect() as conn:
+            # Take the write lock before reading the row count so concurrent adds append in turn
+            conn.execute("BEGIN IMMEDIATE")
+            rows = self._meta(conn, "rows")
+            dim = self._meta(conn, "dim", codes.shape[1])
+            if dim != codes.shape[1]:
+                raise ValueError(f"Index holds {dim}-dimensional vectors, embedder returned {codes.shape[1]}")
+            self._append(self.vectors_path, rows * dim, codes.tobytes())
+            self._append(self.scales_path, rows * 4, scales.tobytes())
+            now = time.time()
+            conn.execute("DELETE FROM paragraphs WHERE submission_id = ?", (submission_id,))
+            conn.executemany(
+                "INSERT INTO paragraphs (row, submission_id, start, end, text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(rows + i, submission_id, start, end, text[start:end], now) for i, (start, end) in enumerate(spans)])
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [("rows", rows + len(spans)), ("dim", dim)])
+        return len(spans)
+
+    def _scan(self, queries: np.ndarray, rows: int, dim: int, threshold: float) -> list:
+        """Returns (row, query, score) for every indexed vector within threshold of a query."""
+        if rows == 0:
+            return []
+        codes = np.memmap(self.vectors_path, dtype=np.int8, mode="r", shape=(rows, dim))
+        scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(rows,))
+        buffer = np.empty((min(rows, SCAN_BLOCK_ROWS), dim), dtype=np.float32)
+        hits = []
+        for start in range(0, rows, SCAN_BLOCK_ROWS):
+            count = min(SCAN_BLOCK_ROWS, rows - start)
+            buffer[:count] = codes[start:start + count]
+            block = buffer[:count] @ queries.T
+            block *= scales[start:start + count, None]
+            found_rows, found_queries = np.nonzero(block >= threshold)
+            hits.extend(zip((found_rows + start).tolist(), found_queries.tolist(),
+                            block[found_rows, found_queries].tolist()))
+        return hits
+
+    def query(self, text: str, top_k: int = 5, threshold: float = None, exclude_id: str = None,
+              max_passages: int = 5) -> dict:
+        """Matches every paragraph of the text against all indexed paragraphs.
+
+        Returns the submissions with the largest share of near-duplicate
+        paragraphs, each with its best matching passage pairs.
+        """
+        threshold = threshold or SEMANTIC_THRESHOLD or self.embedder.threshold
+        spans = paragraphs(text)
+        with self._connect() as conn:
+            rows, dim = self._meta(conn, "rows"), self._meta(conn, "dim")
+        result = {"paragraphs": len(spans), "indexed_paragraphs": rows, "threshold": threshold, "matches": []}
+        if not spans or not rows:
+            return result
+
+        hits = self._scan(self.embedder.embed([text[start:end] for start, end in spans]), rows, dim, threshold)
+        found = {}
+        with self._connect() as conn:
+            unique = list({row for row, _, _ in hits})
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                for row, submission_id, other_text in conn.execute(
+                        f"SELECT row, submission_id, text FROM paragraphs WHERE row IN ({','.join('?' * len(batch))})",
+                        batch):
+                    found[row] = (submission_id, other_text)
+
+        # Best match per submission and query paragraph; rows of replaced submissions are no longer found
+        best = {}
+        for row, paragraph, score in hits:
+            if row not in found or found[row][0] == exclude_id:
+                continue
+            key = (found[row][0], paragraph)
+            if key not in best or score > best[key][0]:
+                best[key] = (score, found[row][1])
+
+        submissions = {}
+        for (submission_id, paragraph), (score, other_text) in best.items():
+            start, end = spans[paragraph]
+            submissions.setdefault(submission_id, []).append({
+                "start": start, "end": end, "text": text[start:end],
+                "similarity": round(score, 4), "matched_text": other_text,
+            })
+        ranked = sorted(submissions.items(),
+                        key=lambda item: (len(item[1]), max(p["similarity"] for p in item[1])), reverse=True)
+        for submission_id, passages in ranked[:top_k]:
+            passages.sort(key=lambda p: p["similarity"], reverse=True)
+            result["matches"].append({
+                "submission_id": submission_id,
+                "coverage": round(len(passages) / len(spans), 4),
+                "similarity": passages[0]["similarity"],
+                "passages": passages[:max_passages],
+            })
+        return result
+
+    def size(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(DISTINCT submission_id) FROM paragraphs").fetchone()[0]
+
+def get_embedder(model: str = EMBEDDING_MODEL):
+    """Returns the embedder for a model name, falling back to HashingEmbedder if the model can't be loaded."""
+    if model == "hashing":
+        return HashingEmbedder()
+    try:
+        return FastEmbedEmbedder(model)
+    except Exception as e:
+        _logger.warning("Embedding model '%s' unavailable (%s); falling back to lexical hashing, "
+                        "which does not match paraphrases", model, e)
+        return HashingEmbedder()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_semantic_index():
+    """Returns the process-wide semantic index for the configured embedding model."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SemanticIndex(get_embedder())
+    return _index
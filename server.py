@@ -1,45 +1,208 @@
 from fastmcp import FastMCP
-import pymupdf
-import docx
 import os
 import json
-import requests
-from fuzzywuzzy import fuzz
-from openai import OpenAI
-import google.generativeai as genai
+import asyncio
+import contextvars
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from cache import get_cache, make_key, hash_file
+from extraction import extract_text, MAX_PAGES
+from documents import get_document_store
+from rubric import letter_grade, compile_rubric, check_breakdown, get_rubric_registry
+from chunking import count_tokens, split_text, split_sections
+from criterion_scores import get_criterion_store, criterion_hash, section_hash
+from compaction import compact_text
+from llm_scheduler import scheduler_snapshots
+from llm_providers import complete, acomplete, describe_route, has_provider, is_quota_failure, NO_PROVIDER_MESSAGE
+from telemetry import (traced, annotate, record_error, count_cache_lookup, registry, serve_metrics,
+                       METRICS_ENABLED, METRICS_PORT)
+from web_search import search, sample_passages
+from startup import prewarm, PREWARM
+from results_store import get_results_store, result_record
 
 # Initialize FastMCP server
 mcp = FastMCP("Assignment Grader")
 
-def get_openai_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return None
-    return OpenAI(api_key=api_key)
+if PREWARM:
+    prewarm()
+
+if METRICS_PORT:
+    try:
+        serve_metrics(METRICS_PORT)
+    except OSError:
+        # Another process on this host (e.g. a job worker) already serves the port
+        pass
+
+# Chunk sizes and compaction savings are measured with this model's tokenizer, whichever model grades
+TOKENIZER_MODEL = "gpt-3.5-turbo"
+PLAGIARISM_QUERIES = int(os.getenv("GRADER_PLAGIARISM_QUERIES", "5"))
+CHUNK_TOKENS = int(os.getenv("GRADER_CHUNK_TOKENS", "3000"))
+CHUNK_CONCURRENCY = int(os.getenv("GRADER_CHUNK_CONCURRENCY", "4"))
+# Page furniture and extra whitespace are stripped from text before it goes into a prompt
+COMPACT_INPUT = os.getenv("GRADER_COMPACT_INPUT", "1").lower() not in ("0", "false", "no")
+TRIM_REFERENCES = os.getenv("GRADER_TRIM_REFERENCES", "").lower() in ("1", "true", "yes")
+# Seconds each stage of grade_submission may take before it is reported as timed out
+STAGE_TIMEOUTS = {
+    "plagiarism": float(os.getenv("GRADER_PLAGIARISM_TIMEOUT", "60")),
+    "grade": float(os.getenv("GRADER_GRADE_TIMEOUT", "120")),
+    "feedback": float(os.getenv("GRADER_FEEDBACK_TIMEOUT", "120")),
+    "grade_and_feedback": float(os.getenv("GRADER_GRADE_TIMEOUT", "120")),
+}
+
+def _is_error(result) -> bool:
+    """Returns True if a core function result is an error report rather than a real result."""
+    if isinstance(result, dict):
+        return "error" in result
+    return isinstance(result, str) and (result.startswith("Error") or result.startswith("Feedback generation failed"))
+
+def _stage(name: str):
+    """Times a core function as a metrics span, counting error results as failures."""
+    return traced(name, is_error=_is_error)
+
+def cache_lookup(use_cache: bool, namespace: str, *parts):
+    """Returns (key, cached_result); key is None when the cache is bypassed or unavailable."""
+    cache = get_cache() if use_cache else None
+    if cache is None:
+        return None, None
+    key = make_key(namespace, *parts)
+    try:
+        cached = cache.get(key)
+    except Exception:
+        return None, None
+    count_cache_lookup(namespace, cached is not None)
+    return key, cached
+
+def cache_store(key, result):
+    """Stores a successful result under key and returns it unchanged."""
+    if key is not None and not _is_error(result):
+        try:
+            get_cache().set(key, result)
+        except Exception:
+            pass
+    return result
+
+async def cache_lookup_async(use_cache: bool, namespace: str, *parts):
+    """cache_lookup for coroutines; the SQLite read runs on a worker thread, off the event loop."""
+    if not use_cache:
+        return None, None
+    return await asyncio.to_thread(cache_lookup, use_cache, namespace, *parts)
+
+async def cache_store_async(key, result):
+    """cache_store for coroutines; the SQLite write runs on a worker thread, off the event loop."""
+    if key is None:
+        return result
+    return await asyncio.to_thread(cache_store, key, result)
 
 # Core Logic Functions
 
-def parse_file_core(file_path: str) -> str:
+@_stage("parse")
+def parse_file_core(file_path: str, use_cache: bool = True, on_chunk=None) -> str:
     """Parses a PDF or DOCX file and extracts text."""
     try:
-        if file_path.endswith(".pdf"):
-            doc = pymupdf.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            return text
-        elif file_path.endswith(".docx"):
-            doc = docx.Document(file_path)
-            text = "\n".join([para.text for para in doc.paragraphs])
-            return text
-        else:
+        if not (file_path.endswith(".pdf") or file_path.endswith(".docx")):
             return "Error: Unsupported file format. Please upload PDF or DOCX."
+
+        annotate(input_bytes=os.path.getsize(file_path))
+        key, cached = cache_lookup(use_cache, "parse", os.path.splitext(file_path)[1], MAX_PAGES, hash_file(file_path))
+        if cached is not None:
+            return cached
+
+        # on_chunk lets callers such as the Streamlit app report progress while pages stream in
+        text = extract_text(file_path, on_chunk=on_chunk)["text"]
+        return cache_store(key, text)
     except Exception as e:
+        record_error(e)
         return f"Error parsing file: {str(e)}"
 
-def check_plagiarism_core(text: str) -> dict:
+@_stage("parse")
+def parse_document_core(file_path: str = None, document_id: str = None, on_chunk=None) -> dict:
+    """Stores a file in the document store, extracts its text there and returns a handle with a preview.
+
+    Pass either the path of a new file or the document_id of one already stored.
+    """
+    try:
+        store = get_document_store()
+        if file_path:
+            document_id = store.put_path(file_path)
+        elif not document_id:
+            return {"error": "Either file_path or document_id is required"}
+        return store.extract(document_id, on_chunk=on_chunk)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Error parsing file: {str(e)}"}
+
+@_stage("parse")
+def parse_structured_core(file_path: str = None, document_id: str = None) -> dict:
+    """Extracts sections, paragraphs, tables and footnotes of a file into the document store's structured model.
+
+    Pass either the path of a new file or the document_id of one already stored.
+    Returns the document_id with an outline of the sections.
+    """
+    try:
+        store = get_document_store()
+        if file_path:
+            document_id = store.put_path(file_path)
+        elif not document_id:
+            return {"error": "Either file_path or document_id is required"}
+        return store.structure(document_id)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Error parsing file: {str(e)}"}
+
+def get_document_section_core(document_id: str, section: int = None, page: int = None) -> dict:
+    """Returns one section (0-based) or page (1-based) of a structured document without loading the rest."""
+    try:
+        with get_document_store().open_structure(document_id) as document:
+            if section is not None:
+                if not 0 <= section < len(document.sections):
+                    return {"error": f"Section {section} does not exist; the document has {len(document.sections)}"}
+                return {"document_id": document_id, "section": section, "title": document.section_title(section),
+                        "text": document.section_text(section)}
+            if page is not None:
+                if not 1 <= page <= len(document.page_starts):
+                    return {"error": f"Page {page} does not exist; the document has {len(document.page_starts)}"}
+                return {"document_id": document_id, "page": page, "text": document.page_text(page)}
+            return {"error": "Either section or page is required"}
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Could not read document: {str(e)}"}
+
+def _structured_sections(document_id: str, max_tokens: int):
+    """Returns a document's sections from its structured model, split to max_tokens, or None if it has none."""
+    try:
+        document = get_document_store().open_structure(document_id)
+    except FileNotFoundError:
+        return None
+    sections = []
+    with document:
+        for index in range(len(document.sections)):
+            text = document.section_text(index)
+            if count_tokens(text, TOKENIZER_MODEL) <= max_tokens:
+                sections.append(text)
+            else:
+                sections.extend(split_sections(text, max_tokens, TOKENIZER_MODEL))
+    return sections
+
+def _resolve_text(text: str, document_id: str = None) -> str:
+    """Returns the text itself, or the stored text of document_id when one is given."""
+    if document_id:
+        return get_document_store().read_text(document_id)
+    return text
+
+def parse_file_report_core(file_path: str, max_pages: int = MAX_PAGES) -> dict:
+    """Extracts text along with page count, per-page timings and truncation status."""
+    try:
+        return extract_text(file_path, max_pages=max_pages)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Error parsing file: {str(e)}"}
+
+@_stage("plagiarism")
+def check_plagiarism_core(text: str, use_cache: bool = True) -> dict:
     """Checks for plagiarism using Google Search API and returns similarity scores."""
     try:
+        if METRICS_ENABLED:
+            annotate(input_bytes=len(text.encode("utf-8")))
         # Use Google Custom Search API to find similar content
         # Note: This requires GOOGLE_API_KEY and GOOGLE_CX in environment variables
         api_key = os.getenv("GOOGLE_API_KEY")
@@ -48,133 +211,916 @@ def check_plagiarism_core(text: str) -> dict:
         if not api_key or not cse_id:
             return {"error": "Google API configuration missing (GOOGLE_API_KEY or GOOGLE_CX)"}
 
-        # Extract a snippet to search query (first 100 characters or key extraction)
-        # Using a simple heuristic for now
-        search_query = text[:100].replace("\n", " ") 
-        
-        url = "https://www.googleapis.com/customsearch/v1"
-        params = {
-            'key': api_key,
-            'cx': cse_id,
-            'q': search_query
-        }
-        
-        response = requests.get(url, params=params)
-        results = response.json()
-        
+        key, cached = cache_lookup(use_cache, "plagiarism", cse_id, PLAGIARISM_QUERIES, text)
+        if cached is not None:
+            return cached
+
+        # Search several distinctive passages from across the document at once
+        passages = sample_passages(text, PLAGIARISM_QUERIES)
+        if not passages:
+            return {}
+        from fuzzywuzzy import fuzz
+
+        def search_passage(passage):
+            return passage, search(passage, api_key, cse_id)
+
         similarity_scores = {}
-        
-        if 'items' in results:
-            for item in results['items']:
-                link = item.get('link')
-                snippet = item.get('snippet', '')
-                # Compare extracted text against snippet for a rough estimate
-                similarity = fuzz.ratio(text[:500], snippet) 
-                similarity_scores[link] = similarity
-                
-        return similarity_scores
+        failures = []
+        with ThreadPoolExecutor(max_workers=len(passages)) as pool:
+            # Pool threads start with an empty context; each search runs in a copy of this one so
+            # the retries web_search counts land on the plagiarism span
+            futures = [pool.submit(contextvars.copy_context().run, search_passage, p) for p in passages]
+            for future in futures:
+                try:
+                    passage, results = future.result()
+                except Exception as e:
+                    failures.append(str(e))
+                    continue
+                for item in results.get('items', []):
+                    link = item.get('link')
+                    snippet = item.get('snippet', '')
+                    # Compare the searched passage against the snippet; keep the best match per link
+                    similarity = fuzz.partial_ratio(passage, snippet)
+                    similarity_scores[link] = max(similarity, similarity_scores.get(link, 0))
+
+        if failures and len(failures) == len(passages):
+            return {"error": f"Plagiarism check failed: {failures[0]}"}
+
+        return cache_store(key, similarity_scores)
 
     except Exception as e:
+        record_error(e)
         return {"error": f"Plagiarism check failed: {str(e)}"}
 
-def grade_text_core(text: str, rubric: str) -> dict:
-    """Grades the text based on the provided rubric using OpenAI."""
+@_stage("local_plagiarism")
+def check_local_plagiarism_core(text: str, submission_id: str = None, top_k: int = 5,
+                                min_similarity: float = 0.1, add_to_index: bool = True) -> dict:
+    """Compares the text against previously indexed submissions using MinHash/LSH."""
+    from plagiarism_index import get_plagiarism_index
     try:
-        client = get_openai_client()
-        if not client:
-             return {"error": "OpenAI API key missing"}
+        index = get_plagiarism_index()
+        submission_id = submission_id or make_key("submission", text)
+        matches = index.query(text, top_k=top_k, min_similarity=min_similarity, exclude_id=submission_id)
+        if add_to_index:
+            index.add(submission_id, text)
+        return {"submission_id": submission_id, "matches": matches, "corpus_size": index.size()}
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Local plagiarism check failed: {str(e)}"}
 
-        prompt = f"""
-        You are an AI grader. Grade the following assignment based on the rubric provided.
-        
-        Rubric:
-        {rubric}
-        
-        Assignment:
-        {text}
-        
-        Return the response in valid JSON format with the following structure:
-        {{
-            "grade": "Letter Grade (e.g., A, B+)",
-            "score": "Numeric Score (e.g., 85/100)",
-            "breakdown": {{
-                "criteria_name": "score/max"
-            }},
-            "summary": "Brief summary of the grading"
-        }}
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that grades assignments. Always return valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        content = response.choices[0].message.content
-        result = json.loads(content)
-        return result
+@_stage("semantic_similarity")
+def check_semantic_similarity_core(text: str, submission_id: str = None, top_k: int = 5, threshold: float = None,
+                                   add_to_index: bool = True) -> dict:
+    """Matches each paragraph of the text against every indexed paragraph by embedding similarity.
+
+    "kind" in the result says whether a sentence-embedding model was used ("semantic") or
+    the hashing fallback, which only catches reuse of the same words ("lexical").
+    """
+    from semantic_index import get_semantic_index
+    try:
+        index = get_semantic_index()
+        submission_id = submission_id or make_key("submission", text)
+        result = index.query(text, top_k=top_k, threshold=threshold, exclude_id=submission_id)
+        if add_to_index:
+            index.add(submission_id, text)
+        return {"submission_id": submission_id, "kind": index.embedder.kind, "backend": index.embedder.backend,
+                "model": index.embedder.name, **result}
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Semantic similarity check failed: {str(e)}"}
+
+# Prompts put the instructions and the compiled rubric first and the submission last,
+# so consecutive calls with the same rubric share a byte-identical prefix
+
+_GRADING_INSTRUCTIONS = """You are an AI grader. Grade the assignment at the end of this message based on the rubric provided.
+
+Return the response in valid JSON format with the following structure:
+{
+    "grade": "Letter Grade (e.g., A, B+)",
+    "score": "Numeric Score (e.g., 85/100)",
+    "breakdown": {
+        "criteria_name": "score/max"
+    },
+    "summary": "Brief summary of the grading"
+}"""
+
+_FEEDBACK_INSTRUCTIONS = """Provide detailed, constructive feedback for the assignment at the end of this message based on the rubric.
+
+Format the output in Markdown."""
+
+_COMBINED_INSTRUCTIONS = """You are an AI grader. Grade the assignment at the end of this message based on the rubric provided
+and write detailed, constructive feedback for the student.
+
+Return the response in valid JSON format with the following structure:
+{
+    "grade": "Letter Grade (e.g., A, B+)",
+    "score": "Numeric Score (e.g., 85/100)",
+    "breakdown": {
+        "criteria_name": "score/max"
+    },
+    "summary": "Brief summary of the grading",
+    "feedback": "Detailed feedback formatted in Markdown"
+}"""
+
+_CHUNK_INSTRUCTIONS = """You are an AI grader. The message ends with one part of a long assignment.
+Score how well this part meets each rubric criterion, judging only the evidence in this part.
+
+Return the response in valid JSON format with the following structure:
+{
+    "criteria": {
+        "criteria_name": {"score": "number between 0 and max", "notes": "One sentence on the evidence"}
+    }
+}"""
+
+def _rubric_prompt(instructions: str, compiled: dict, assignment_heading: str, text: str) -> str:
+    return f"{instructions}\n\nRubric:\n{compiled['rendered']}\n\n{assignment_heading}:\n{text}"
+
+def grading_messages(text: str, compiled: dict) -> list:
+    """Builds the chat messages that ask for a JSON grade of `text` against a compiled rubric."""
+    return [
+        {"role": "system", "content": "You are a helpful assistant that grades assignments. Always return valid JSON."},
+        {"role": "user", "content": _rubric_prompt(_GRADING_INSTRUCTIONS, compiled, "Assignment", text)}
+    ]
+
+def feedback_messages(text: str, compiled: dict) -> list:
+    """Builds the chat messages that ask for Markdown feedback on `text`."""
+    return [
+        {"role": "system", "content": "You are a helpful assistant that provides educational feedback."},
+        {"role": "user", "content": _rubric_prompt(_FEEDBACK_INSTRUCTIONS, compiled, "Assignment", text)}
+    ]
+
+def combined_messages(text: str, compiled: dict) -> list:
+    """Builds the chat messages that ask for the grade and the feedback in one JSON reply."""
+    return [
+        {"role": "system", "content": "You are a helpful assistant that grades assignments and provides educational feedback. Always return valid JSON."},
+        {"role": "user", "content": _rubric_prompt(_COMBINED_INSTRUCTIONS, compiled, "Assignment", text)}
+    ]
+
+def _chunk_grading_messages(chunk: str, index: int, total: int, compiled: dict) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant that grades assignments. Always return valid JSON."},
+        {"role": "user", "content": _rubric_prompt(_CHUNK_INSTRUCTIONS, compiled, f"Assignment (part {index} of {total})", chunk)}
+    ]
+
+@lru_cache(maxsize=32)
+def _compacted(text: str) -> dict:
+    return compact_text(text, TRIM_REFERENCES, TOKENIZER_MODEL)
+
+def prompt_text(text: str) -> str:
+    """Returns the text to put in a prompt; plagiarism checks keep using the original."""
+    if METRICS_ENABLED:
+        annotate(input_bytes=len(text.encode("utf-8")))
+    return _compacted(text)["text"] if COMPACT_INPUT else text
+
+def compact_input_core(text: str, trim_references: bool = TRIM_REFERENCES) -> dict:
+    """Reports how much of the text the prompt compaction removes, with the compacted text."""
+    try:
+        return compact_text(text, trim_references, TOKENIZER_MODEL)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Compaction failed: {str(e)}"}
+
+@lru_cache(maxsize=64)
+def compile_rubric_text(rubric: str) -> dict:
+    """Compiles rubric text, reusing the result for rubrics seen recently."""
+    return compile_rubric(rubric)
+
+def _resolve_rubric(rubric: str, rubric_id: str = None) -> dict:
+    """Returns the compiled rubric for a registered id, or compiles the given rubric text."""
+    if rubric_id:
+        compiled = get_rubric_registry().get(rubric_id)
+        if compiled is None:
+            raise ValueError(f"Unknown rubric id '{rubric_id}'. Register it with register_rubric first.")
+        return compiled
+    return compile_rubric_text(rubric)
+
+def register_rubric_core(rubric: str) -> dict:
+    """Compiles a rubric into weighted criteria and stores it for reuse by id."""
+    try:
+        compiled = get_rubric_registry().register(rubric)
+        return {"rubric_id": compiled["id"], "criteria": compiled["criteria"], "max_score": compiled["max_score"]}
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Rubric registration failed: {str(e)}"}
+
+@_stage("grade")
+def grade_text_core(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> dict:
+    """Grades the text based on the provided rubric using the configured LLM providers."""
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = prompt_text(text)
+        key, cached = cache_lookup(use_cache, "grade", describe_route("grade"), compiled["id"], text)
+        if cached is not None:
+            return cached
+
+        if not has_provider("grade"):
+             return {"error": NO_PROVIDER_MESSAGE}
+
+        messages = grading_messages(text, compiled)
+        response = complete("grade", messages, json_mode=True)
+        content = response.text
+        result = check_breakdown(json.loads(content), compiled)
+        return cache_store(key, result)
         
     except Exception as e:
-        # Check if the error is related to quota
-        if "quota" in str(e).lower():
-             return {"error": "OpenAI API quota exceeded. Please check your billing details."}
+        record_error(e)
+        if is_quota_failure(e):
+             return {"error": "LLM provider quota exceeded. Please check your billing details."}
         return {"error": f"Grading failed: {str(e)}"}
 
-def generate_feedback_core(text: str, rubric: str) -> str:
-    """Generates detailed feedback for the assignment using OpenAI."""
+@_stage("grade")
+async def grade_text_core_async(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> dict:
+    """Async variant of grade_text_core."""
     try:
-        client = get_openai_client()
-        if not client:
-             return "Error: OpenAI API key missing"
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = await asyncio.to_thread(prompt_text, text)
+        key, cached = await cache_lookup_async(use_cache, "grade", describe_route("grade"), compiled["id"], text)
+        if cached is not None:
+            return cached
 
-        prompt = f"""
-        Provide detailed, constructive feedback for this assignment based on the rubric.
-        
-        Rubric:
-        {rubric}
+        if not has_provider("grade"):
+             return {"error": NO_PROVIDER_MESSAGE}
+
+        messages = grading_messages(text, compiled)
+        response = await acomplete("grade", messages, json_mode=True)
+        content = response.text
+        return await cache_store_async(key, check_breakdown(json.loads(content), compiled))
         
-        Assignment:
-        {text}
+    except Exception as e:
+        record_error(e)
+        if is_quota_failure(e):
+             return {"error": "LLM provider quota exceeded. Please check your billing details."}
+        return {"error": f"Grading failed: {str(e)}"}
+
+@_stage("feedback")
+def generate_feedback_core(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> str:
+    """Generates detailed feedback for the assignment using the configured LLM providers."""
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = prompt_text(text)
+        key, cached = cache_lookup(use_cache, "feedback", describe_route("feedback"), compiled["id"], text)
+        if cached is not None:
+            return cached
+
+        if not has_provider("feedback"):
+             return f"Error: {NO_PROVIDER_MESSAGE}"
+
+        messages = feedback_messages(text, compiled)
+        response = complete("feedback", messages)
+        return cache_store(key, response.text)
         
-        Format the output in Markdown.
-        """
+    except Exception as e:
+        record_error(e)
+        if is_quota_failure(e):
+             return "Error: LLM provider quota exceeded. Please check your billing details."
+        return f"Feedback generation failed: {str(e)}"
+
+@_stage("feedback")
+async def generate_feedback_core_async(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> str:
+    """Async variant of generate_feedback_core."""
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = await asyncio.to_thread(prompt_text, text)
+        key, cached = await cache_lookup_async(use_cache, "feedback", describe_route("feedback"), compiled["id"], text)
+        if cached is not None:
+            return cached
+
+        if not has_provider("feedback"):
+             return f"Error: {NO_PROVIDER_MESSAGE}"
+
+        messages = feedback_messages(text, compiled)
+        response = await acomplete("feedback", messages)
+        return await cache_store_async(key, response.text)
         
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides educational feedback."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+    except Exception as e:
+        record_error(e)
+        if is_quota_failure(e):
+             return "Error: LLM provider quota exceeded. Please check your billing details."
+        return f"Feedback generation failed: {str(e)}"
+
+def validate_grade_result(result, require_feedback: bool = False) -> dict:
+    """Checks a model response against the grade schema and normalizes field types.
+
+    Raises ValueError if a required field is missing or has the wrong shape.
+    """
+    if not isinstance(result, dict):
+        raise ValueError("response is not a JSON object")
+    required = ["grade", "score", "breakdown", "summary"] + (["feedback"] if require_feedback else [])
+    missing = [key for key in required if key not in result]
+    if missing:
+        raise ValueError(f"response is missing {', '.join(missing)}")
+    if not isinstance(result["breakdown"], dict):
+        raise ValueError("breakdown must be an object")
+    for key in ("grade", "score", "summary", "feedback"):
+        if key in result:
+            if isinstance(result[key], (dict, list)):
+                raise ValueError(f"{key} must be a string")
+            result[key] = str(result[key])
+    result["breakdown"] = {str(name): str(value) for name, value in result["breakdown"].items()}
+    return result
+
+@_stage("grade_and_feedback")
+def grade_and_feedback_core(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> dict:
+    """Grades the text and writes feedback in a single model completion."""
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = prompt_text(text)
+        key, cached = cache_lookup(use_cache, "grade_and_feedback", describe_route("grade_and_feedback"), compiled["id"], text)
+        if cached is not None:
+            return cached
+
+        if not has_provider("grade_and_feedback"):
+             return {"error": NO_PROVIDER_MESSAGE}
+
+        messages = combined_messages(text, compiled)
+        response = complete("grade_and_feedback", messages, json_mode=True)
+        content = response.text
+        result = validate_grade_result(json.loads(content), require_feedback=True)
+        return cache_store(key, check_breakdown(result, compiled))
         
-        return response.choices[0].message.content
+    except Exception as e:
+        record_error(e)
+        if is_quota_failure(e):
+             return {"error": "LLM provider quota exceeded. Please check your billing details."}
+        return {"error": f"Grading failed: {str(e)}"}
+
+@_stage("grade_and_feedback")
+async def grade_and_feedback_core_async(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> dict:
+    """Async variant of grade_and_feedback_core."""
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = await asyncio.to_thread(prompt_text, text)
+        key, cached = await cache_lookup_async(use_cache, "grade_and_feedback", describe_route("grade_and_feedback"), compiled["id"], text)
+        if cached is not None:
+            return cached
+
+        if not has_provider("grade_and_feedback"):
+             return {"error": NO_PROVIDER_MESSAGE}
+
+        messages = combined_messages(text, compiled)
+        response = await acomplete("grade_and_feedback", messages, json_mode=True)
+        content = response.text
+        result = validate_grade_result(json.loads(content), require_feedback=True)
+        return await cache_store_async(key, check_breakdown(result, compiled))
         
     except Exception as e:
-        if "quota" in str(e).lower():
-             return "Error: OpenAI API quota exceeded. Please check your billing details."
-        return f"Feedback generation failed: {str(e)}"
+        record_error(e)
+        if is_quota_failure(e):
+             return {"error": "LLM provider quota exceeded. Please check your billing details."}
+        return {"error": f"Grading failed: {str(e)}"}
+
+def reduce_chunk_scores(criteria: list, chunk_results: list, chunk_weights: list) -> dict:
+    """Combines per-chunk criterion scores into the grade/score/breakdown/summary shape.
+
+    Each criterion's score is the average of its chunk scores weighted by chunk length.
+    """
+    breakdown = {}
+    notes = []
+    total = 0.0
+    max_total = sum(c["weight"] for c in criteria)
+    for criterion in criteria:
+        weighted, weight_sum = 0.0, 0.0
+        criterion_note = None
+        for result, weight in zip(chunk_results, chunk_weights):
+            entry = result.get(criterion["name"])
+            if not isinstance(entry, dict):
+                continue
+            try:
+                score = float(entry.get("score"))
+            except (TypeError, ValueError):
+                continue
+            weighted += min(max(score, 0.0), criterion["weight"]) * weight
+            weight_sum += weight
+            if entry.get("notes") and not criterion_note:
+                criterion_note = f"{criterion['name']}: {entry['notes']}"
+        if criterion_note:
+            notes.append(criterion_note)
+        score = round(weighted / weight_sum, 1) if weight_sum else 0.0
+        total += score
+        breakdown[criterion["name"]] = f"{score:g}/{criterion['weight']:g}"
+
+    percent = 100 * total / max_total if max_total else 0.0
+    return {
+        "grade": letter_grade(percent),
+        "score": f"{round(percent, 1):g}/100",
+        "breakdown": breakdown,
+        "summary": f"Graded in {len(chunk_results)} parts. " + " ".join(notes),
+    }
+
+@_stage("grade_long")
+async def grade_long_text_core_async(text: str, rubric: str = "", chunk_tokens: int = CHUNK_TOKENS,
+                                     concurrency: int = CHUNK_CONCURRENCY, use_cache: bool = True,
+                                     rubric_id: str = None) -> dict:
+    """Grades a long submission by scoring token-bounded chunks concurrently and reducing the scores."""
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        text = await asyncio.to_thread(prompt_text, text)
+        key, cached = await cache_lookup_async(use_cache, "grade_long", describe_route("chunk"), chunk_tokens, compiled["id"], text)
+        if cached is not None:
+            return cached
+
+        if not has_provider("chunk"):
+             return {"error": NO_PROVIDER_MESSAGE}
+
+        criteria = compiled["criteria"]
+        chunks = await asyncio.to_thread(split_text, text, chunk_tokens, TOKENIZER_MODEL)
+        slots = asyncio.Semaphore(concurrency)
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        async def grade_chunk(index, chunk):
+            async with slots:
+                messages = _chunk_grading_messages(chunk, index + 1, len(chunks), compiled)
+                response = await acomplete("chunk", messages, json_mode=True)
+            usage["prompt_tokens"] += response.prompt_tokens or 0
+            usage["completion_tokens"] += response.completion_tokens or 0
+            return json.loads(response.text).get("criteria", {})
+
+        chunk_results = await asyncio.gather(*(grade_chunk(i, c) for i, c in enumerate(chunks)))
+        chunk_weights = [count_tokens(chunk, TOKENIZER_MODEL) for chunk in chunks]
+
+        result = reduce_chunk_scores(criteria, chunk_results, chunk_weights)
+        result["chunks"] = len(chunks)
+        result["tokens"] = {"document": sum(chunk_weights), **usage}
+        return await cache_store_async(key, result)
+
+    except Exception as e:
+        record_error(e)
+        if is_quota_failure(e):
+             return {"error": "LLM provider quota exceeded. Please check your billing details."}
+        return {"error": f"Grading failed: {str(e)}"}
+
+def grade_long_text_core(text: str, rubric: str = "", chunk_tokens: int = CHUNK_TOKENS,
+                         concurrency: int = CHUNK_CONCURRENCY, use_cache: bool = True,
+                         rubric_id: str = None) -> dict:
+    """Synchronous entry point for grade_long_text_core_async."""
+    return asyncio.run(grade_long_text_core_async(text, rubric, chunk_tokens, concurrency, use_cache, rubric_id))
+
+def _criteria_rubric(criteria: list) -> dict:
+    """Renders a rubric holding only some criteria, keeping their weights, in compile_rubric's layout."""
+    lines = "\n".join(f"{c['name']} ({c['weight']:g} points): {c['description']}" for c in criteria)
+    scoring = "\n".join(f"- {c['name']}: max {c['weight']:g} points" for c in criteria)
+    return {"criteria": criteria, "rendered": f"{lines}\n\nMaximum points per criterion:\n{scoring}"}
+
+@_stage("regrade")
+async def regrade_core_async(text: str = "", rubric: str = "", rubric_id: str = None, document_id: str = None,
+                             chunk_tokens: int = CHUNK_TOKENS, concurrency: int = CHUNK_CONCURRENCY) -> dict:
+    """Grades each rubric criterion against each section of the text, asking the model only about new pairs.
+
+    Scores are stored under hashes of the criterion text and the section text, so
+    after a rubric criterion is reworded or part of the submission is edited only
+    the affected criteria and sections are sent to the model again. The others are
+    merged in from the store. Changing only a weight rescales stored scores.
+    A document_id whose structured model was built is split along its own sections.
+    """
+    try:
+        compiled = _resolve_rubric(rubric, rubric_id)
+        criteria = compiled["criteria"]
+        # A structured model already knows the document's sections; otherwise they are found in the text
+        sections = _structured_sections(document_id, chunk_tokens) if document_id else None
+        if sections is None:
+            # Compaction and tokenizing are CPU-bound, so they stay off the event loop
+            text = await asyncio.to_thread(prompt_text, _resolve_text(text, document_id))
+            sections = await asyncio.to_thread(split_sections, text, chunk_tokens, TOKENIZER_MODEL)
+        if not sections:
+            return {"error": "Nothing to grade: the text is empty"}
+
+        route = describe_route("chunk")
+        store = get_criterion_store()
+        criterion_hashes = [criterion_hash(c) for c in criteria]
+        section_hashes = [section_hash(section) for section in sections]
+        stored = await asyncio.to_thread(store.get_many, route, section_hashes)
+        pending = {}
+        for index, section in enumerate(section_hashes):
+            missing = [c for c, h in zip(criteria, criterion_hashes) if (h, section) not in stored]
+            if missing:
+                pending[index] = missing
+        if pending and not has_provider("chunk"):
+             return {"error": NO_PROVIDER_MESSAGE}
+
+        slots = asyncio.Semaphore(concurrency)
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+        async def grade_section(index, subset):
+            async with slots:
+                messages = _chunk_grading_messages(sections[index], index + 1, len(sections), _criteria_rubric(subset))
+                response = await acomplete("chunk", messages, json_mode=True)
+            usage["prompt_tokens"] += response.prompt_tokens or 0
+            usage["completion_tokens"] += response.completion_tokens or 0
+            scores = {str(name).strip().lower(): entry
+                      for name, entry in json.loads(response.text).get("criteria", {}).items()}
+            rows = []
+            for criterion in subset:
+                entry = scores.get(criterion["name"].lower())
+                try:
+                    fraction = float(entry["score"]) / criterion["weight"]
+                except (TypeError, ValueError, KeyError, ZeroDivisionError):
+                    # Left unstored, so the next regrade asks again
+                    continue
+                rows.append((criterion_hash(criterion), section_hashes[index], min(max(fraction, 0.0), 1.0),
+                             entry.get("notes")))
+            return rows
+
+        new_rows = [row for rows in await asyncio.gather(*(grade_section(i, c) for i, c in pending.items()))
+                    for row in rows]
+        if new_rows:
+            await asyncio.to_thread(store.put_many, route, new_rows)
+        for criterion, section, fraction, notes in new_rows:
+            stored[(criterion, section)] = (fraction, notes)
+
+        section_results = []
+        for section in section_hashes:
+            section_result = {}
+            for criterion, h in zip(criteria, criterion_hashes):
+                if (h, section) in stored:
+                    fraction, notes = stored[(h, section)]
+                    section_result[criterion["name"]] = {"score": fraction * criterion["weight"], "notes": notes}
+            section_results.append(section_result)
+        section_weights = [count_tokens(section, TOKENIZER_MODEL) for section in sections]
+
+        evaluated = sum(len(subset) for subset in pending.values())
+        annotate(llm_calls_avoided=len(sections) - len(pending))
+        result = reduce_chunk_scores(criteria, section_results, section_weights)
+        result["sections"] = len(sections)
+        result["incremental"] = {
+            "llm_calls": len(pending),
+            "llm_calls_avoided": len(sections) - len(pending),
+            "evaluations_reused": len(criteria) * len(sections) - evaluated,
+            "evaluations_made": evaluated,
+            "regraded_criteria": sorted({c["name"] for subset in pending.values() for c in subset}),
+            "regraded_sections": [index + 1 for index in sorted(pending)],
+        }
+        result["tokens"] = {"document": sum(section_weights), **usage}
+        return result
+
+    except Exception as e:
+        record_error(e)
+        if is_quota_failure(e):
+             return {"error": "LLM provider quota exceeded. Please check your billing details."}
+        return {"error": f"Regrading failed: {str(e)}"}
+
+def regrade_core(text: str = "", rubric: str = "", rubric_id: str = None, document_id: str = None,
+                 chunk_tokens: int = CHUNK_TOKENS, concurrency: int = CHUNK_CONCURRENCY) -> dict:
+    """Synchronous entry point for regrade_core_async."""
+    return asyncio.run(regrade_core_async(text, rubric, rubric_id, document_id, chunk_tokens, concurrency))
+
+@_stage("submission")
+async def grade_submission_core_async(text: str, rubric: str = "", rubric_id: str = None,
+                                      check_plagiarism: bool = True, combined: bool = False,
+                                      use_cache: bool = True, timeouts: dict = None, on_stage=None,
+                                      document_id: str = None) -> dict:
+    """Runs the plagiarism check, grading and feedback for one submission concurrently.
+
+    Every stage has its own timeout. A stage that fails or times out is reported in
+    "stages" and in its own result slot without holding up the others. on_stage, if
+    given, is called as on_stage(stage, status=..., seconds=...) as stages progress.
+    With a document_id the text is read from the document store instead.
+    """
+    try:
+        text = _resolve_text(text, document_id)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Could not load document: {str(e)}"}
+    if COMPACT_INPUT:
+        # Compact once up front; the grading stages then reuse the cached result
+        await asyncio.to_thread(_compacted, text)
+
+    limits = {**STAGE_TIMEOUTS, **(timeouts or {})}
+    stages = {}
+    if check_plagiarism:
+        # The web search client is synchronous, so it runs on a worker thread
+        stages["plagiarism"] = lambda: asyncio.to_thread(check_plagiarism_core, text, use_cache)
+    if combined:
+        stages["grade_and_feedback"] = lambda: grade_and_feedback_core_async(text, rubric, use_cache, rubric_id)
+    else:
+        stages["grade"] = lambda: grade_text_core_async(text, rubric, use_cache, rubric_id)
+        stages["feedback"] = lambda: generate_feedback_core_async(text, rubric, use_cache, rubric_id)
+
+    def notify(stage, **fields):
+        if on_stage is not None:
+            try:
+                on_stage(stage, **fields)
+            except Exception:
+                pass
+
+    for name in stages:
+        notify(name, status="queued")
+
+    async def run_stage(name, start):
+        notify(name, status="running")
+        begin = asyncio.get_running_loop().time()
+        try:
+            output = await asyncio.wait_for(start(), limits[name])
+        except asyncio.TimeoutError:
+            output = {"error": f"{name.replace('_', ' ').capitalize()} timed out after {limits[name]:g}s"}
+        except Exception as e:
+            output = {"error": f"{name.replace('_', ' ').capitalize()} failed: {str(e)}"}
+        seconds = round(asyncio.get_running_loop().time() - begin, 3)
+        info = {"status": "error" if _is_error(output) else "done", "seconds": seconds}
+        if isinstance(output, dict) and "error" in output:
+            info["error"] = output["error"]
+        notify(name, **info)
+        return name, output, info
+
+    outputs = {}
+    report = {}
+    for name, output, info in await asyncio.gather(*(run_stage(n, s) for n, s in stages.items())):
+        outputs[name] = output
+        report[name] = info
+
+    result = {"plagiarism_results": outputs.get("plagiarism"), "stages": report}
+    if COMPACT_INPUT:
+        result["compaction"] = {k: v for k, v in _compacted(text).items() if k != "text"}
+    if combined:
+        grade = dict(outputs["grade_and_feedback"])
+        result["feedback"] = grade.pop("feedback", None)
+        result["grade_results"] = grade
+    else:
+        feedback = outputs["feedback"]
+        # Feedback is plain text everywhere else, so errors keep the "Error..." string form
+        if isinstance(feedback, dict):
+            feedback = f"Error: {feedback['error']}"
+        result["grade_results"] = outputs["grade"]
+        result["feedback"] = feedback
+    return result
+
+def grade_submission_core(text: str, rubric: str = "", rubric_id: str = None, check_plagiarism: bool = True,
+                          combined: bool = False, use_cache: bool = True, timeouts: dict = None,
+                          on_stage=None, document_id: str = None) -> dict:
+    """Synchronous entry point for grade_submission_core_async."""
+    return asyncio.run(grade_submission_core_async(text, rubric, rubric_id, check_plagiarism, combined,
+                                                   use_cache, timeouts, on_stage, document_id))
+
+def save_result_core(grade_results: dict, assignment: str, student: str, feedback: str = None,
+                     rubric_id: str = None, submission_id: str = None, plagiarism_results: dict = None) -> dict:
+    """Stores a grading result in the results store and returns its id."""
+    if not isinstance(grade_results, dict) or "error" in grade_results:
+        return {"error": "Only successful grading results can be saved"}
+    try:
+        record = result_record(grade_results, feedback, assignment, student, rubric_id, submission_id,
+                               plagiarism_results, source="tool")
+        return {"result_id": get_results_store().add(record)}
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Saving result failed: {str(e)}"}
+
+def query_results_core(assignment: str = None, student: str = None, rubric_id: str = None, since: str = None,
+                       until: str = None, limit: int = 50, offset: int = 0) -> dict:
+    """Returns stored results matching the filters, newest first."""
+    try:
+        results = get_results_store().query(limit, offset, assignment=assignment, student=student,
+                                            rubric_id=rubric_id, since=since, until=until)
+        return {"results": results, "count": len(results), "offset": offset}
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Results query failed: {str(e)}"}
+
+def cohort_stats_core(assignment: str = None, student: str = None, rubric_id: str = None, since: str = None,
+                      until: str = None) -> dict:
+    """Returns score statistics and per-criterion averages over the stored results matching the filters."""
+    try:
+        return get_results_store().stats(assignment=assignment, student=student, rubric_id=rubric_id,
+                                         since=since, until=until)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Results query failed: {str(e)}"}
+
+def grade_distribution_core(assignment: str = None, student: str = None, rubric_id: str = None, since: str = None,
+                            until: str = None, bins: int = 10) -> dict:
+    """Returns letter-grade counts and a score histogram over the stored results matching the filters."""
+    try:
+        return get_results_store().distribution(bins, assignment=assignment, student=student, rubric_id=rubric_id,
+                                                since=since, until=until)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Results query failed: {str(e)}"}
+
+@_stage("export")
+def export_results_core(output_path: str, format: str = None, assignment: str = None, student: str = None,
+                        rubric_id: str = None, since: str = None, until: str = None) -> dict:
+    """Streams stored results matching the filters to a CSV, Parquet or PDF file."""
+    try:
+        return get_results_store().export(output_path, format, assignment=assignment, student=student,
+                                          rubric_id=rubric_id, since=since, until=until)
+    except Exception as e:
+        record_error(e)
+        return {"error": f"Export failed: {str(e)}"}
 
 # MCP Tools Wrappers
 
 @mcp.tool()
-def parse_file(file_path: str) -> str:
+async def parse_file(file_path: str, use_cache: bool = True) -> str:
     """Parses a PDF or DOCX file and extracts text."""
-    return parse_file_core(file_path)
+    return await asyncio.to_thread(parse_file_core, file_path, use_cache)
+
+@mcp.tool()
+async def parse_document(file_path: str = None, document_id: str = None) -> dict:
+    """Stores and extracts a PDF or DOCX file, returning a document_id to pass to other tools instead of the text."""
+    return await asyncio.to_thread(parse_document_core, file_path, document_id)
+
+@mcp.tool()
+async def parse_structured(file_path: str = None, document_id: str = None) -> dict:
+    """Extracts a PDF or DOCX into sections, paragraphs, tables and footnotes and returns its outline and document_id."""
+    return await asyncio.to_thread(parse_structured_core, file_path, document_id)
+
+@mcp.tool()
+def get_document_section(document_id: str, section: int = None, page: int = None) -> dict:
+    """Returns the text of one section or page of a document prepared with parse_structured."""
+    return get_document_section_core(document_id, section, page)
+
+@mcp.tool()
+async def parse_file_report(file_path: str, max_pages: int = MAX_PAGES) -> dict:
+    """Extracts text from a PDF or DOCX file and reports page count and per-page timings."""
+    return await asyncio.to_thread(parse_file_report_core, file_path, max_pages)
 
 @mcp.tool()
-def check_plagiarism(text: str) -> dict:
+async def check_plagiarism(text: str, use_cache: bool = True) -> dict:
     """Checks for plagiarism using Google Search API and returns similarity scores."""
-    return check_plagiarism_core(text)
+    return await asyncio.to_thread(check_plagiarism_core, text, use_cache)
 
 @mcp.tool()
-def grade_text(text: str, rubric: str) -> dict:
-    """Grades the text based on the provided rubric using OpenAI."""
-    return grade_text_core(text, rubric)
+async def check_local_plagiarism(text: str, submission_id: str = None, top_k: int = 5,
+                                 min_similarity: float = 0.1, add_to_index: bool = True) -> dict:
+    """Finds prior submissions that share passages with the text using a local MinHash index."""
+    return await asyncio.to_thread(check_local_plagiarism_core, text, submission_id, top_k,
+                                   min_similarity, add_to_index)
+
+@mcp.tool()
+async def check_semantic_similarity(text: str, submission_id: str = None, top_k: int = 5, threshold: float = None,
+                                    add_to_index: bool = True) -> dict:
+    """Finds reworded paragraphs shared with earlier submissions using local embeddings.
+
+    Paraphrases are only caught with a sentence-embedding model (the "semantic" extra); without one
+    the result's "kind" is "lexical" and only reuse of the same words is found.
+    """
+    return await asyncio.to_thread(check_semantic_similarity_core, text, submission_id, top_k, threshold, add_to_index)
+
+@mcp.tool()
+async def compact_input(text: str, trim_references: bool = TRIM_REFERENCES) -> dict:
+    """Shows the compacted text that grading prompts would use and the tokens it saves."""
+    return await asyncio.to_thread(compact_input_core, text, trim_references)
+
+@mcp.tool()
+def register_rubric(rubric: str) -> dict:
+    """Compiles a rubric into weighted criteria and returns an id that grading tools accept as rubric_id."""
+    return register_rubric_core(rubric)
+
+@mcp.tool()
+async def grade_text(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> dict:
+    """Grades the text based on the provided rubric using the configured LLM providers."""
+    return await grade_text_core_async(text, rubric, use_cache, rubric_id)
+
+@mcp.tool()
+async def generate_feedback(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> str:
+    """Generates detailed feedback for the assignment using the configured LLM providers."""
+    return await generate_feedback_core_async(text, rubric, use_cache, rubric_id)
+
+@mcp.tool()
+async def grade_and_feedback(text: str, rubric: str = "", use_cache: bool = True, rubric_id: str = None) -> dict:
+    """Grades the text and generates feedback in one model call."""
+    return await grade_and_feedback_core_async(text, rubric, use_cache, rubric_id)
+
+@mcp.tool()
+async def grade_long_text(text: str, rubric: str = "", chunk_tokens: int = CHUNK_TOKENS,
+                          concurrency: int = CHUNK_CONCURRENCY, use_cache: bool = True,
+                          rubric_id: str = None) -> dict:
+    """Grades a long submission chunk by chunk and combines the scores per rubric criterion."""
+    return await grade_long_text_core_async(text, rubric, chunk_tokens, concurrency, use_cache, rubric_id)
+
+@mcp.tool()
+async def regrade(text: str = "", rubric: str = "", rubric_id: str = None, document_id: str = None,
+                  chunk_tokens: int = CHUNK_TOKENS) -> dict:
+    """Grades per criterion and section, re-evaluating only criteria or sections that changed since the last run."""
+    return await regrade_core_async(text, rubric, rubric_id, document_id, chunk_tokens)
+
+@mcp.tool()
+async def grade_submission(text: str = "", rubric: str = "", rubric_id: str = None, check_plagiarism: bool = True,
+                           combined: bool = False, use_cache: bool = True, document_id: str = None) -> dict:
+    """Checks plagiarism, grades and writes feedback for a submission in parallel, returning partial results on failure."""
+    return await grade_submission_core_async(text, rubric, rubric_id, check_plagiarism, combined, use_cache,
+                                             document_id=document_id)
+
+@mcp.tool()
+def save_result(grade_results: dict, assignment: str, student: str, feedback: str = None, rubric_id: str = None,
+                submission_id: str = None, plagiarism_results: dict = None) -> dict:
+    """Saves a grading result to the results store."""
+    return save_result_core(grade_results, assignment, student, feedback, rubric_id, submission_id, plagiarism_results)
+
+@mcp.tool()
+def query_results(assignment: str = None, student: str = None, rubric_id: str = None, since: str = None,
+                  until: str = None, limit: int = 50, offset: int = 0) -> dict:
+    """Lists stored results by assignment, student, rubric and time range (ISO dates), newest first."""
+    return query_results_core(assignment, student, rubric_id, since, until, limit, offset)
+
+@mcp.tool()
+def cohort_stats(assignment: str = None, student: str = None, rubric_id: str = None, since: str = None,
+                 until: str = None) -> dict:
+    """Returns mean, spread, percentiles and per-criterion averages of stored scores."""
+    return cohort_stats_core(assignment, student, rubric_id, since, until)
+
+@mcp.tool()
+def grade_distribution(assignment: str = None, student: str = None, rubric_id: str = None, since: str = None,
+                       until: str = None, bins: int = 10) -> dict:
+    """Returns letter-grade counts and a histogram of stored percentage scores."""
+    return grade_distribution_core(assignment, student, rubric_id, since, until, bins)
+
+@mcp.tool()
+async def export_results(output_path: str, format: str = None, assignment: str = None, student: str = None,
+                         rubric_id: str = None, since: str = None, until: str = None) -> dict:
+    """Exports stored results to CSV, Parquet or PDF without loading them all into memory."""
+    return await asyncio.to_thread(export_results_core, output_path, format, assignment, student,
+                                   rubric_id, since, until)
+
+@mcp.tool()
+def scheduler_stats() -> dict:
+    """Returns each LLM provider's concurrency limit, remaining budgets, queueing time and retry counts."""
+    return scheduler_snapshots()
+
+@mcp.tool()
+def cache_stats() -> dict:
+    """Returns size and hit/miss counters of the local result cache."""
+    cache = get_cache()
+    if cache is None:
+        return {"error": "Result cache is disabled"}
+    return cache.stats()
+
+@mcp.resource("metrics://grader", mime_type="text/plain")
+def metrics() -> str:
+    """Per-stage timings, token and byte counts, cache hits and retries in Prometheus text format."""
+    return registry.render()
+
+@mcp.tool()
+async def grade_batch(source: str, rubric: str, output_path: str = "batch_results.jsonl",
+                      concurrency: int = 8, include_feedback: bool = True, assignment: str = None,
+                      index_plagiarism: bool = False, index_semantic: bool = False) -> dict:
+    """Grades every submission in a directory or manifest, streams results to a JSONL file and the results store."""
+    from batch import grade_batch_async
+    try:
+        return await grade_batch_async(source, rubric, output_path, concurrency, include_feedback=include_feedback,
+                                       assignment=assignment, index_plagiarism=index_plagiarism,
+                                       index_semantic=index_semantic)
+    except Exception as e:
+        return {"error": f"Batch grading failed: {str(e)}"}
+
+@mcp.tool()
+async def submit_provider_batch(source: str, rubric: str, requests_path: str = "batch_requests.jsonl",
+                                include_feedback: bool = True) -> dict:
+    """Writes grading requests for a directory or manifest to a batch file and submits it to the provider's batch API."""
+    from provider_batch import prepare_batch, submit_batch
+    try:
+        prepared = await asyncio.to_thread(prepare_batch, source, rubric, requests_path, include_feedback)
+        return {**prepared, **await asyncio.to_thread(submit_batch, prepared["manifest_path"])}
+    except Exception as e:
+        return {"error": f"Batch submission failed: {str(e)}"}
+
+@mcp.tool()
+async def provider_batch_status(manifest_path: str) -> dict:
+    """Returns the provider's status and request counts for a submitted batch."""
+    from provider_batch import batch_status
+    try:
+        return await asyncio.to_thread(batch_status, manifest_path)
+    except Exception as e:
+        return {"error": f"Batch status failed: {str(e)}"}
+
+@mcp.tool()
+async def ingest_provider_batch(manifest_path: str, output_path: str = "batch_results.jsonl",
+                                assignment: str = None) -> dict:
+    """Reads a finished provider batch into the grade_batch JSONL format and the results store."""
+    from provider_batch import ingest_batch
+    try:
+        return await asyncio.to_thread(ingest_batch, manifest_path, output_path, assignment)
+    except Exception as e:
+        return {"error": f"Batch ingestion failed: {str(e)}"}
+
+@mcp.tool()
+async def cohort_similarity(source: str, top_k: int = 20, threshold: float = 0.5, block_size: int = 256) -> dict:
+    """Compares all submissions of a cohort pairwise and returns suspicious pairs and collusion groups."""
+    from cohort import cohort_similarity_core
+    return await asyncio.to_thread(cohort_similarity_core, source, top_k, threshold, block_size)
+
+@mcp.tool()
+def submit_grading_job(text: str = "", rubric: str = "", rubric_id: str = None, check_plagiarism: bool = False,
+                       combined: bool = True, document_id: str = None, assignment: str = None,
+                       student: str = None) -> dict:
+    """Queues a grading job for the background workers and returns its id.
+
+    With an assignment the finished result is also saved to the results store.
+    """
+    from jobs import get_job_queue
+    try:
+        job_id = get_job_queue().submit("grade", {
+            "text": text, "document_id": document_id, "rubric": rubric, "rubric_id": rubric_id,
+            "check_plagiarism": check_plagiarism, "combined": combined,
+            "assignment": assignment, "student": student,
+        })
+        return {"job_id": job_id, "status": "queued"}
+    except Exception as e:
+        return {"error": f"Job submission failed: {str(e)}"}
 
 @mcp.tool()
-def generate_feedback(text: str, rubric: str) -> str:
-    """Generates detailed feedback for the assignment using OpenAI."""
-    return generate_feedback_core(text, rubric)
+def get_job_status(job_id: str) -> dict:
+    """Returns a background job's status, per-stage progress and result once finished."""
+    from jobs import get_job_queue
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return {"error": f"Unknown job id '{job_id}'"}
+    return job
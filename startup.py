@@ -0,0 +1,92 @@
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Load the heavy dependencies in the background at startup instead of on the first request
+PREWARM = os.getenv("GRADER_PREWARM", "").lower() in ("1", "true", "yes")
+
+# Modules the tools import on first use, roughly from slowest to fastest to load
+HEAVY_MODULES = ("pymupdf", "openai", "docx", "plagiarism_index", "requests", "fuzzywuzzy.fuzz", "tiktoken")
+
+def prewarm(modules: tuple = HEAVY_MODULES, background: bool = True):
+    """Imports the modules tools load lazily and builds the tokenizer.
+
+    With background=True this runs on a daemon thread and returns the thread;
+    otherwise returns the seconds each module took to load.
+    """
+    def run():
+        timings = {}
+        for name in modules:
+            begin = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                continue
+            timings[name] = round(time.perf_counter() - begin, 4)
+        from chunking import count_tokens
+        begin = time.perf_counter()
+        # The BPE tables are loaded on the first count
+        count_tokens("warm up")
+        timings["tokenizer"] = round(time.perf_counter() - begin, 4)
+        return timings
+
+    if not background:
+        return run()
+    thread = threading.Thread(target=run, name="grader-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+def import_profile(module: str = "server", top: int = 15) -> dict:
+    """Imports a module in a fresh interpreter with -X importtime and reports where the time went.
+
+    Returns the total import time and the slowest top-level packages by the time
+    spent in their own modules, in seconds.
+    """
+    begin = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - begin
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed")
+
+    packages = {}
+    total = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == module:
+            total = int(cumulative)
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "import_seconds": round(total / 1e6, 4),
+        "process_seconds": round(wall, 4),
+        "packages": {name: round(micros / 1e6, 4) for name, micros in slowest},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile grader start-up and warm its lazy imports.")
+    parser.add_argument("--module", default="server", help="Module whose import is profiled")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    parser.add_argument("--prewarm", action="store_true", help="Also time loading the lazily imported modules")
+    args = parser.parse_args()
+
+    report = import_profile(args.module, args.top)
+    print(f"import {report['module']}: {report['import_seconds']:.3f}s "
+          f"(interpreter start and import: {report['process_seconds']:.3f}s)")
+    for name, seconds in report["packages"].items():
+        print(f"  {name:<28}{seconds * 1000:>9.1f} ms")
+    if args.prewarm:
+        print("\nLoaded on first use (prewarm):")
+        for name, seconds in prewarm(background=False).items():
+            print(f"  {name:<28}{seconds * 1000:>9.1f} ms")
+
+if __name__ == "__main__":
+    main()
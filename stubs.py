@@ -0,0 +1,293 @@
+import collections
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from chunking import count_tokens
+
+_CRITERION_RE = re.compile(r"^- (.+?): max ([\d.]+) points$", re.MULTILINE)
+
+class StubServer:
+    """Local stand-in for a remote API with configurable latency and error rate.
+
+    Runs a threading HTTP server on a free port in a daemon thread. Counters for
+    requests, errors and tokens can be read and reset between measurements.
+    """
+
+    def __init__(self, latency_ms: float = 200, jitter_ms: float = 50, error_rate: float = 0.0, seed: int = 0,
+                 max_concurrent: int = None, requests_per_minute: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        # Requests beyond these limits are throttled with 429, like a provider enforcing account limits
+        self.max_concurrent = max_concurrent
+        self.requests_per_minute = requests_per_minute
+        self._in_flight = 0
+        self._recent = collections.deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_counters()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {"requests": 0, "errors": 0, "throttled": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _throttle_delay(self, now: float):
+        """Returns seconds the client should wait if this request exceeds a limit, else None; holds the lock."""
+        while self._recent and self._recent[0] < now - 60:
+            self._recent.popleft()
+        if self.requests_per_minute and len(self._recent) >= self.requests_per_minute:
+            return self._recent[0] + 60 - now
+        if self.max_concurrent and self._in_flight >= self.max_concurrent:
+            return 0.2
+        self._recent.append(now)
+        return None
+
+    def _dispatch(self, request, method):
+        with self._lock:
+            throttle_for = self._throttle_delay(time.monotonic())
+            if throttle_for is None:
+                self._in_flight += 1
+            else:
+                self.counters["requests"] += 1
+                self.counters["throttled"] += 1
+        if throttle_for is not None:
+            # Drain the body so the keep-alive connection stays usable
+            request.rfile.read(int(request.headers.get("Content-Length") or 0))
+            self._send(request, 429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                                "code": "rate_limit_exceeded"}},
+                       {"Retry-After": f"{throttle_for:.2f}"})
+            return
+        try:
+            self._respond(request, method)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _respond(self, request, method):
+        with self._lock:
+            delay = max(self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000
+            fail = self._random.random() < self.error_rate
+            self.counters["requests"] += 1
+            self.counters["errors"] += fail
+            # Alternate between throttling and server errors, as real providers do
+            throttle = fail and self.counters["errors"] % 2
+        time.sleep(delay)
+        if fail:
+            if throttle:
+                self._send(request, 429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                           {"Retry-After": "0.1"})
+            else:
+                self._send(request, 500, {"error": {"message": "Internal error", "type": "server_error"}})
+            return
+        body = None
+        if method == "POST":
+            length = int(request.headers.get("Content-Length") or 0)
+            raw = request.rfile.read(length)
+            content_type = request.headers.get("Content-Type", "")
+            body = _form_fields(content_type, raw) if content_type.startswith("multipart/") else json.loads(raw or b"{}")
+        status, payload = self.handle(method, urlparse(request.path), body)
+        self._send(request, status, payload)
+
+    def _send(self, request, status, payload, headers=None):
+        # Bytes are sent as they are, for file downloads
+        is_bytes = isinstance(payload, bytes)
+        data = payload if is_bytes else json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/octet-stream" if is_bytes else "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def handle(self, method, url, body):
+        """Returns (status, JSON payload) for a request; overridden by each stub."""
+        return 404, {"error": {"message": f"No route for {url.path}"}}
+
+def _form_fields(content_type: str, raw: bytes) -> dict:
+    """Parses a multipart/form-data body into {name: bytes}."""
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + raw)
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+class StubOpenAI(StubServer):
+    """Answers /v1/chat/completions with well-formed grading JSON or Markdown feedback."""
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    def completion_content(self, body: dict) -> str:
+        prompt = body["messages"][-1]["content"]
+        criteria = _CRITERION_RE.findall(prompt)
+        if "(part " in prompt:
+            return json.dumps({"criteria": {name: {"score": float(points) * 0.8, "notes": "Adequate evidence."}
+                                            for name, points in criteria}})
+        if body.get("response_format"):
+            breakdown = {name: f"{float(points) * 0.8:g}/{float(points):g}" for name, points in criteria}
+            result = {"grade": "B-", "score": "80/100", "breakdown": breakdown,
+                      "summary": "Solid work with room to improve."}
+            if "feedback" in prompt.lower():
+                result["feedback"] = "## Feedback\n\nClear structure; strengthen the analysis."
+            return json.dumps(result)
+        return "## Feedback\n\n- Clear structure.\n- Strengthen the analysis with more evidence."
+
+    def handle(self, method, url, body):
+        if method != "POST" or not url.path.endswith("/chat/completions"):
+            return super().handle(method, url, body)
+        content = self.completion_content(body)
+        prompt_tokens = sum(count_tokens(m["content"]) for m in body["messages"])
+        completion_tokens = count_tokens(content)
+        self.count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return 200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+class StubOpenAIBatch(StubOpenAI):
+    """Adds the Files and Batches endpoints, running each batch's requests through the chat stub.
+
+    A batch reports in_progress until processing_seconds have passed after it was
+    created and completes on the next retrieve. failure_rate makes that share of
+    its requests fail into the error file; latency applies per HTTP call only.
+    """
+
+    def __init__(self, *args, processing_seconds: float = 0.5, failure_rate: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processing_seconds = processing_seconds
+        self.failure_rate = failure_rate
+        self.files = {}
+        self.batches = {}
+        self._ids = itertools.count(1)
+
+    def _add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file = {"id": f"file-{next(self._ids)}", "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        self.files[file["id"]] = (file, content)
+        return file
+
+    def _run_batch(self, batch: dict):
+        outputs, errors = [], []
+        for line in self.files[batch["input_file_id"]][1].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            with self._lock:
+                fail = self._random.random() < self.failure_rate
+            if fail:
+                errors.append({"id": f"batch_req_{next(self._ids)}", "custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "server_error", "message": "The request could not be processed."}})
+                continue
+            status, payload = super().handle("POST", urlparse(request["url"]), request["body"])
+            outputs.append({"id": f"batch_req_{next(self._ids)}", "custom_id": request["custom_id"],
+                            "response": {"status_code": status, "request_id": f"req_{next(self._ids)}", "body": payload},
+                            "error": None})
+        self.count(batch_requests=len(outputs) + len(errors))
+        for name, records in (("output_file_id", outputs), ("error_file_id", errors)):
+            if records:
+                content = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+                batch[name] = self._add_file(content, f"{batch['id']}_{name[:-8]}.jsonl", "batch_output")["id"]
+        batch.update(status="completed", completed_at=int(time.time()),
+                     request_counts={"total": len(outputs) + len(errors), "completed": len(outputs),
+                                     "failed": len(errors)})
+
+    def handle(self, method, url, body):
+        parts = url.path.rstrip("/").split("/")[2:]
+        if method == "POST" and parts == ["files"]:
+            return 200, self._add_file(body["file"], "batch_input.jsonl", body["purpose"].decode("utf-8"))
+        if method == "GET" and len(parts) >= 2 and parts[0] == "files":
+            if parts[1] not in self.files:
+                return 404, {"error": {"message": f"No such file: {parts[1]}"}}
+            file, content = self.files[parts[1]]
+            return 200, content if parts[2:] == ["content"] else file
+        if method == "POST" and parts == ["batches"]:
+            if body["input_file_id"] not in self.files:
+                return 400, {"error": {"message": f"No such file: {body['input_file_id']}"}}
+            batch = {"id": f"batch_{next(self._ids)}", "object": "batch", "endpoint": body["endpoint"],
+                     "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                     "status": "in_progress", "created_at": int(time.time()), "metadata": body.get("metadata"),
+                     "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+            self.batches[batch["id"]] = (batch, time.monotonic())
+            return 200, batch
+        if len(parts) >= 2 and parts[0] == "batches":
+            if parts[1] not in self.batches:
+                return 404, {"error": {"message": f"No such batch: {parts[1]}"}}
+            batch, created = self.batches[parts[1]]
+            if method == "POST" and parts[2:] == ["cancel"] and batch["status"] == "in_progress":
+                batch.update(status="cancelled", cancelled_at=int(time.time()))
+            elif batch["status"] == "in_progress" and time.monotonic() - created >= self.processing_seconds:
+                self._run_batch(batch)
+            return 200, batch
+        return super().handle(method, url, body)
+
+class StubGoogleSearch(StubServer):
+    """Answers Custom Search queries with a few results whose snippets partly echo the query."""
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.url}/customsearch/v1"
+
+    def handle(self, method, url, body):
+        if method != "GET" or not url.path.startswith("/customsearch"):
+            return super().handle(method, url, body)
+        words = parse_qs(url.query).get("q", [""])[0].split()
+        items = []
+        for rank in range(3):
+            keep = max(len(words) * (3 - rank) // 4, 1)
+            items.append({"link": f"https://example.com/{zlib.crc32(' '.join(words).encode('utf-8')) % 1000}/{rank}",
+                          "snippet": " ".join(words[:keep])})
+        return 200, {"items": items}
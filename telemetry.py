@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+METRICS_ENABLED = os.getenv("GRADER_METRICS", "1").lower() not in ("0", "false", "no")
+JSON_LOGS = os.getenv("GRADER_JSON_LOGS", "").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("GRADER_METRICS_PORT", "0"))
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_HELP = {
+    "grader_stage_seconds": ("histogram", "Time spent in each grader stage."),
+    "grader_stage_errors_total": ("counter", "Failed stage runs by error class."),
+    "grader_tokens_total": ("counter", "LLM tokens used, by stage and kind."),
+    "grader_input_bytes_total": ("counter", "Bytes of input handled, by stage."),
+    "grader_cache_requests_total": ("counter", "Result cache lookups by namespace and result."),
+    "grader_upstream_responses_total": ("counter", "Responses from remote APIs by service and status."),
+    "grader_retries_total": ("counter", "Web search requests retried after a throttled or failed attempt."),
+    "grader_llm_retries_total": ("counter", "LLM requests retried by the scheduler, by status or error."),
+    "grader_llm_requests_total": ("counter", "Answered LLM requests by stage, provider and model."),
+    "grader_llm_fallbacks_total": ("counter", "LLM requests passed to the next provider, by stage, provider and reason."),
+    "grader_llm_batch_requests_total": ("counter", "Requests read back from provider batch jobs, by provider and status."),
+}
+
+class MetricsRegistry:
+    """In-process counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        described = set()
+        def describe(name):
+            if name not in described:
+                kind, text = _HELP.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{label_text(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            describe(name)
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{name}_bucket{label_text(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{label_text(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{label_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+_logger = logging.getLogger("grader.trace")
+if JSON_LOGS:
+    # stdout carries the MCP stdio transport, so traces go to stderr
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+# Spans
+
+_current_span = contextvars.ContextVar("grader_span", default=None)
+# Threads running in a copy of a span's context (e.g. plagiarism searches) annotate it concurrently
+_span_lock = threading.Lock()
+
+def annotate(**amounts):
+    """Adds numeric amounts (tokens, bytes, retries...) to the span of the stage currently running."""
+    span = _current_span.get()
+    if span is not None:
+        with _span_lock:
+            for name, amount in amounts.items():
+                span[name] = span.get(name, 0) + amount
+
+def record_error(exc: BaseException):
+    """Notes the class of an exception a core function caught and turned into an error result."""
+    span = _current_span.get()
+    if span is not None:
+        span["error_class"] = type(exc).__name__
+
+def _finish_span(stage: str, span: dict, begin: float, result, exc, is_error):
+    seconds = time.perf_counter() - begin
+    if exc is not None:
+        span["error_class"] = type(exc).__name__
+    failed = exc is not None or "error_class" in span or (is_error is not None and is_error(result))
+    outcome = "error" if failed else "ok"
+    registry.observe("grader_stage_seconds", seconds, stage=stage, outcome=outcome)
+    if failed:
+        registry.count("grader_stage_errors_total", stage=stage, error_class=span.get("error_class", "ReportedError"))
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if span.get(kind):
+            registry.count("grader_tokens_total", span[kind], stage=stage, kind=kind.split("_")[0])
+    if span.get("input_bytes"):
+        registry.count("grader_input_bytes_total", span["input_bytes"], stage=stage)
+    if JSON_LOGS:
+        _logger.info(json.dumps({"ts": round(time.time(), 3), "stage": stage, "outcome": outcome,
+                                 "seconds": round(seconds, 4), **span}))
+
+def traced(stage: str, is_error=None):
+    """Decorates a sync or async core function so each call is timed as a span of `stage`.
+
+    is_error(result) decides whether a returned value counts as a failure. With
+    metrics disabled the function is returned unchanged.
+    """
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                span = {}
+                token = _current_span.set(span)
+                begin = time.perf_counter()
+                result = exc = None
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                except BaseException as e:
+                    exc = e
+                    raise
+                finally:
+                    _current_span.reset(token)
+                    _finish_span(stage, span, begin, result, exc, is_error)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            span = {}
+            token = _current_span.set(span)
+            begin = time.perf_counter()
+            result = exc = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except BaseException as e:
+                exc = e
+                raise
+            finally:
+                _current_span.reset(token)
+                _finish_span(stage, span, begin, result, exc, is_error)
+        return wrapper
+    return decorate
+
+# Remote API instrumentation
+
+def count_cache_lookup(namespace: str, hit: bool):
+    if METRICS_ENABLED:
+        registry.count("grader_cache_requests_total", namespace=namespace, result="hit" if hit else "miss")
+        if hit:
+            annotate(cache_hits=1)
+        else:
+            annotate(cache_misses=1)
+
+def count_response(service: str, status: int):
+    """Counts a remote API response.
+
+    Retries are counted by whoever decides to retry (the LLM scheduler, web_search),
+    not here, so a retried response is not counted twice.
+    """
+    if METRICS_ENABLED:
+        registry.count("grader_upstream_responses_total", service=service, status=str(status))
+
+def count_retry(service: str, status: str):
+    """Counts a retry decided outside the LLM scheduler and adds it to the current span."""
+    if METRICS_ENABLED:
+        registry.count("grader_retries_total", service=service, status=status)
+        annotate(retries=1)
+
+def httpx_response_hook(service: str):
+    """Returns an httpx response event hook that feeds count_response."""
+    def hook(response):
+        count_response(service, response.status_code)
+    return hook
+
+def async_httpx_response_hook(service: str):
+    async def hook(response):
+        count_response(service, response.status_code)
+    return hook
+
+# Export
+
+def serve_metrics(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """Serves /metrics for Prometheus scrapers from a daemon thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+import pytest
+
+# Stores are configured from the environment at import time, so point them at a
+# scratch directory before any module under test is imported
+_STATE_DIR = tempfile.mkdtemp(prefix="grader-tests-")
+for _name, _path in {
+    "GRADER_CACHE_PATH": "cache.sqlite",
+    "GRADER_RUBRIC_DB": "rubrics.sqlite",
+    "GRADER_JOBS_DB": "jobs.sqlite",
+    "GRADER_PLAGIARISM_INDEX": "plagiarism.sqlite",
+    "GRADER_SEMANTIC_INDEX": "semantic",
+    "GRADER_RESULTS_DB": "results.sqlite",
+    "GRADER_SCORES_DB": "scores.sqlite",
+    "GRADER_DOCUMENT_STORE": "documents",
+    "GRADER_BENCHMARK_DIR": "benchmarks",
+}.items():
+    os.environ[_name] = os.path.join(_STATE_DIR, _path)
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ["GRADER_LLM_PROVIDERS"] = "openai"
+os.environ["GRADER_PREWARM"] = ""
+# Loading a sentence-embedding model needs a download; tests use the lexical embedder
+os.environ["GRADER_EMBEDDING_MODEL"] = "hashing"
+
+RUBRIC = "Clarity (40%): clear writing\nArgument (60%): strong reasoning"
+
+
+@pytest.fixture(scope="session")
+def openai_stub():
+    """A local OpenAI-compatible server (chat, files and batches) shared by the whole session.
+
+    Provider clients are cached per API key, so the base URL is set once rather than per test.
+    """
+    import stubs
+
+    stub = stubs.StubOpenAIBatch(latency_ms=1, jitter_ms=0, processing_seconds=0).start()
+    os.environ["OPENAI_BASE_URL"] = stub.base_url
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def rubric():
+    return RUBRIC
+
+
+@pytest.fixture
+def make_docx(tmp_path):
+    """Writes a DOCX submission with the given paragraphs and returns its path."""
+    import docx
+
+    def make(name: str, *paragraphs: str) -> str:
+        document = docx.Document()
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+        path = tmp_path / name
+        document.save(path)
+        return str(path)
+
+    return make
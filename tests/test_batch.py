@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import batch
+import plagiarism_index
+import semantic_index
+
+GRADE = {"grade": "B-", "score": "80/100", "breakdown": {"Clarity": "32/40", "Argument": "48/60"},
+         "summary": "Solid work."}
+
+
+@pytest.fixture
+def submissions(tmp_path, make_docx):
+    folder = tmp_path / "essays"
+    folder.mkdir()
+    for name in ("a", "b", "c"):
+        make_docx(f"essays/{name}.docx", f"Essay {name} discusses the causes of the war at some length.")
+    make_docx("essays/broken.docx", "placeholder")
+    (folder / "broken.docx").write_bytes(b"not a docx")
+    return str(folder)
+
+
+@pytest.fixture
+def graded(monkeypatch):
+    """Replaces the LLM call with one that fails for ids listed in `fail`."""
+    calls = []
+    fail = set()
+
+    async def grade(text, rubric):
+        calls.append(text)
+        name = text.split()[1]
+        if name in fail:
+            raise RuntimeError(f"provider down for {name}")
+        return dict(GRADE, feedback="## Feedback")
+
+    monkeypatch.setattr(batch, "grade_and_feedback_core_async", grade)
+    return calls, fail
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def run(source, rubric, output, **kwargs):
+    return asyncio.run(batch.grade_batch_async(source, rubric, str(output), concurrency=2, parse_workers=2,
+                                               save_results=False, **kwargs))
+
+
+def test_batch_records_errors_and_resumes(submissions, graded, rubric, tmp_path):
+    calls, fail = graded
+    fail.add("b")
+    output = tmp_path / "out.jsonl"
+    summary = run(submissions, rubric, output)
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (2, 2, 0)
+    records = {r["id"]: r for r in read_output(output)}
+    assert records["a.docx"]["status"] == "ok"
+    assert records["a.docx"]["feedback"] == "## Feedback"
+    assert records["b.docx"]["error"] == "grade: provider down for b"
+    assert records["broken.docx"]["error"].startswith("parse: Error")
+
+    fail.clear()
+    calls.clear()
+    summary = run(submissions, rubric, output)
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (1, 1, 2)
+    assert [text.split()[1] for text in calls] == ["b"]
+    assert batch.load_completed_ids(str(output)) == {"a.docx", "b.docx", "c.docx"}
+
+
+def test_batch_resumes_after_truncated_line(submissions, graded, rubric, tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"id": "a.docx", "status": "ok"}) + "\n" + '{"id": "c.do', encoding="utf-8")
+    summary = run(submissions, rubric, output)
+    assert summary["skipped"] == 1
+    assert summary["succeeded"] == 2
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert lines[1] == '{"id": "c.do'
+    assert {json.loads(line)["id"] for line in lines[2:]} == {"b.docx", "c.docx", "broken.docx"}
+
+
+def test_store_failure_does_not_stop_grading(submissions, graded, rubric, tmp_path, monkeypatch):
+    class BrokenStore:
+        def add_many(self, records):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(batch, "get_results_store", BrokenStore)
+    output = tmp_path / "out.jsonl"
+    summary = asyncio.run(batch.grade_batch_async(submissions, rubric, str(output), concurrency=2,
+                                                  parse_workers=2))
+    assert summary["succeeded"] == 3
+    assert summary["unsaved"] == 3
+    assert summary["store_error"] == "store: disk full"
+
+
+def test_output_failure_cancels_parsing(submissions, graded, rubric, tmp_path, monkeypatch):
+    class FailingOutput:
+        def write(self, data):
+            raise OSError("read-only file system")
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(batch, "open_for_append", lambda path: FailingOutput())
+    # A queue of one would leave the parse stage blocked forever if the workers died alone
+    with pytest.raises(OSError, match="read-only"):
+        asyncio.run(asyncio.wait_for(batch.grade_batch_async(submissions, rubric, str(tmp_path / "out.jsonl"),
+                                                             concurrency=1, parse_workers=1,
+                                                             save_results=False), timeout=60))
+
+
+def test_parsed_texts_are_bounded_by_the_queue(tmp_path, rubric, monkeypatch):
+    folder = tmp_path / "many"
+    folder.mkdir()
+    for number in range(20):
+        (folder / f"{number:02}.docx").write_bytes(b"")
+    waiting = []
+    peak = []
+
+    def parse(path):
+        waiting.append(path)
+        return "Essay " + os.path.basename(path)
+
+    async def grade(text, rubric):
+        peak.append(len(waiting))
+        await asyncio.sleep(0.01)
+        waiting.pop()
+        return dict(GRADE)
+
+    monkeypatch.setattr(batch, "process_pool", lambda workers: ThreadPoolExecutor(workers))
+    monkeypatch.setattr(batch, "parse_file_core", parse)
+    monkeypatch.setattr(batch, "grade_and_feedback_core_async", grade)
+    summary = asyncio.run(batch.grade_batch_async(str(folder), rubric, str(tmp_path / "out.jsonl"), concurrency=1,
+                                                  parse_workers=2, save_results=False))
+    assert summary["succeeded"] == 20
+    # Queue of two, one text held by each blocked parser, one being graded
+    assert max(peak) <= 5
+
+
+def test_batch_against_stub_server(submissions, openai_stub, tmp_path):
+    # The stub serves from a thread in this process; forked parse workers used to deadlock on it
+    summary = run(submissions, "Clarity (50%): clear\nArgument (50%): sound", tmp_path / "out.jsonl")
+    assert (summary["succeeded"], summary["failed"]) == (3, 1)
+    ok = [r for r in read_output(tmp_path / "out.jsonl") if r["status"] == "ok"]
+    assert {r["grade"]["score"] for r in ok} == {"80/100"}
+    assert all(r["feedback"].startswith("## Feedback") for r in ok)
+
+
+class RecordingIndex:
+    def __init__(self, fail_on=()):
+        self.added = []
+        self.fail_on = fail_on
+
+    def add(self, doc_id, text):
+        if doc_id in self.fail_on:
+            raise OSError("index locked")
+        self.added.append(doc_id)
+
+
+def test_plagiarism_indexing_is_opt_in(submissions, graded, rubric, tmp_path, monkeypatch):
+    calls, fail = graded
+    fail.add("b")
+    index = RecordingIndex()
+    monkeypatch.setattr(plagiarism_index, "get_plagiarism_index", lambda: index)
+    run(submissions, rubric, tmp_path / "plain.jsonl")
+    assert index.added == []
+
+    run(submissions, rubric, tmp_path / "indexed.jsonl", index_plagiarism=True)
+    # Only submissions that were graded are indexed
+    assert sorted(index.added) == ["a.docx", "c.docx"]
+
+
+def test_semantic_indexing_is_opt_in(submissions, graded, rubric, tmp_path, monkeypatch):
+    index = RecordingIndex()
+    monkeypatch.setattr(semantic_index, "get_semantic_index", lambda: index)
+    run(submissions, rubric, tmp_path / "plain.jsonl", index_plagiarism=True)
+    assert index.added == []
+
+    run(submissions, rubric, tmp_path / "indexed.jsonl", index_semantic=True)
+    assert sorted(index.added) == ["a.docx", "b.docx", "c.docx"]
+
+
+def test_plagiarism_index_failure_is_a_per_item_error(submissions, graded, rubric, tmp_path, monkeypatch):
+    monkeypatch.setattr(plagiarism_index, "get_plagiarism_index", lambda: RecordingIndex(fail_on={"c.docx"}))
+    summary = run(submissions, rubric, tmp_path / "out.jsonl", index_plagiarism=True)
+    assert (summary["succeeded"], summary["failed"]) == (2, 2)
+    records = {r["id"]: r for r in read_output(tmp_path / "out.jsonl")}
+    assert records["c.docx"]["error"] == "index: index locked"
+    assert "c.docx" not in batch.load_completed_ids(str(tmp_path / "out.jsonl"))
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from benchmark import RssSampler, run_stage
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="samples RSS from /proc")
+
+
+def test_stage_peak_is_per_stage():
+    def allocate():
+        block = bytearray(300 * 1024 * 1024)
+        block[::4096] = b"x" * len(block[::4096])
+        # Held for several sampling intervals
+        time.sleep(0.1)
+        return "ok"
+
+    heavy = run_stage([allocate], 1, [])
+    light = run_stage([lambda: "ok"], 1, [])
+    assert heavy["peak_rss_mb"] - light["peak_rss_mb"] > 200
+    # The process-wide figure keeps the earlier stage's high-water mark
+    assert light["process_peak_rss_mb"] > 300
+
+
+def test_sampler_includes_child_processes():
+    code = "import time; b = bytearray(200 * 1024 * 1024); b[::4096] = b'x' * len(b[::4096]); time.sleep(0.3)"
+    with RssSampler() as idle:
+        pass
+    with RssSampler() as busy:
+        subprocess.run([sys.executable, "-c", code], check=True)
+    assert busy.peak_mb - idle.peak_mb > 150
@@ -0,0 +1,55 @@
+import time
+
+from cache import ResultCache, make_key
+from server import grade_text_core
+
+TEXT = "The treaty failed because its economic terms could not be met by any of the signatories."
+
+
+def test_make_key_is_stable_and_separates_parts():
+    key = make_key("grade", "openai:gpt", "rubric", TEXT)
+    assert key == make_key("grade", "openai:gpt", "rubric", TEXT)
+    assert key.startswith("grade:")
+    assert key != make_key("feedback", "openai:gpt", "rubric", TEXT)
+    assert key != make_key("grade", "openai:other", "rubric", TEXT)
+    # Parts are delimited, so moving text between them changes the key
+    assert make_key("grade", "ab", "c") != make_key("grade", "a", "bc")
+    assert make_key("parse", b"bytes") == make_key("parse", "bytes")
+
+
+def test_result_cache_expiry_and_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, max_bytes=30)
+    assert cache.get("grade:a") is None
+    cache.set("grade:a", {"score": "80/100"})
+    assert cache.get("grade:a") == {"score": "80/100"}
+    assert (cache.hits, cache.misses) == ({"grade": 1}, {"grade": 1})
+
+    cache.set("grade:b", {"score": "70/100"})
+    time.sleep(0.01)
+    cache.get("grade:a")
+    # Over the size cap, the least recently used entry goes first
+    assert cache.evict() == 1
+    assert cache.get("grade:b") is None
+    assert cache.get("grade:a") is not None
+
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("grade:a") is None
+
+
+def test_grade_is_cached_per_rubric_and_route(openai_stub, rubric, monkeypatch):
+    first = grade_text_core(TEXT, rubric)
+    assert "error" not in first
+    requests = openai_stub.counters["requests"]
+    assert grade_text_core(TEXT, rubric) == first
+    assert openai_stub.counters["requests"] == requests
+
+    grade_text_core(TEXT, rubric + "\nSources (10%): cites evidence")
+    assert openai_stub.counters["requests"] == requests + 1
+    monkeypatch.setenv("GRADER_GRADE_MODELS", "openai:gpt-4o-mini")
+    grade_text_core(TEXT, rubric)
+    assert openai_stub.counters["requests"] == requests + 2
+    # Bypassing the cache always asks the model
+    monkeypatch.delenv("GRADER_GRADE_MODELS")
+    grade_text_core(TEXT, rubric, use_cache=False)
+    assert openai_stub.counters["requests"] == requests + 3
@@ -0,0 +1,52 @@
+import numpy as np
+
+from cohort import cohort_similarity_core, collusion_groups, hashed_ngram_matrix, similar_pairs
+
+BASE = ("The treaty collapsed because reparations demanded more coal and steel than the mines could produce, "
+        "and each missed delivery gave the creditors a pretext to occupy the industrial districts.")
+TEXTS = [
+    BASE,
+    BASE.replace("collapsed", "failed"),
+    "Photosynthesis converts light into chemical energy stored in glucose inside chloroplasts.",
+    BASE + " The occupation then deepened the crisis it was meant to solve.",
+    "Volcanic islands form where magma rises through a hotspot beneath a moving oceanic plate.",
+]
+
+
+def test_blocked_pairs_match_the_dense_matrix():
+    matrix = hashed_ngram_matrix(TEXTS)
+    dense = (matrix @ matrix.T).toarray()
+    assert np.allclose(np.diag(dense), 1, atol=1e-5)
+    expected = {(i, j) for i in range(len(TEXTS)) for j in range(i + 1, len(TEXTS)) if dense[i, j] >= 0.3}
+    for block_size in (1, 2, 256):
+        rows, cols, scores = similar_pairs(matrix, threshold=0.3, block_size=block_size)
+        assert set(zip(rows.tolist(), cols.tolist())) == expected
+        assert np.allclose(scores, dense[rows, cols])
+    assert expected == {(0, 1), (0, 3), (1, 3)}
+
+
+def test_collusion_groups_join_connected_pairs():
+    groups = collusion_groups(6, np.array([0, 1, 4]), np.array([1, 3, 5]))
+    assert groups == [[0, 1, 3], [4, 5]]
+    assert collusion_groups(3, np.array([], dtype=int), np.array([], dtype=int)) == []
+
+
+def test_cohort_similarity_over_a_folder(tmp_path, make_docx):
+    (tmp_path / "cohort").mkdir()
+    for index, text in enumerate(TEXTS):
+        make_docx(f"cohort/{index}.docx", text)
+    (tmp_path / "cohort" / "broken.docx").write_bytes(b"not a docx")
+    result = cohort_similarity_core(str(tmp_path / "cohort"), threshold=0.3, parse_workers=2)
+    assert result["submissions"] == 5
+    assert result["failed"] == ["broken.docx"]
+    assert result["suspicious_pairs"] == 3
+    assert result["clusters"] == [["0.docx", "1.docx", "3.docx"]]
+    assert result["pairs"][0]["similarity"] >= result["pairs"][-1]["similarity"]
+
+
+def test_small_cohort_returns_the_same_keys(tmp_path, make_docx):
+    (tmp_path / "solo").mkdir()
+    make_docx("solo/0.docx", TEXTS[0])
+    result = cohort_similarity_core(str(tmp_path / "solo"), threshold=0.3, parse_workers=1)
+    assert result == {"submissions": 1, "failed": [], "threshold": 0.3, "suspicious_pairs": 0,
+                      "pairs": [], "clusters": []}
@@ -0,0 +1,39 @@
+from compaction import compact_text
+from server import compact_input_core
+
+
+def page(number: int, *body: str) -> str:
+    return "\n".join(["HIST 210 Final Essay", "", *body, "", f"Page {number} of 3"])
+
+
+PAGES = [
+    page(1, "The treaty failed for economic reasons.", "Reparations    exceeded   output.", "Mines fell behind."),
+    page(2, "Occupation deepened the crisis.", "Trade collapsed in the Ruhr.", "Inflation followed."),
+    page(3, "The terms were unworkable.", "References", "Keynes, J. M. (1919). The Economic Consequences."),
+]
+
+
+def test_running_headers_and_page_numbers_are_removed():
+    result = compact_text("\f".join(PAGES))
+    assert "HIST 210" not in result["text"]
+    assert "Page 2 of 3" not in result["text"]
+    assert "Reparations exceeded output." in result["text"]
+    assert "Keynes" in result["text"]
+    assert result["tokens_saved"] == result["tokens_before"] - result["tokens_after"] > 0
+
+
+def test_single_page_keeps_its_edges():
+    text = page(1, "The treaty failed.", "Mines fell behind.", "Trade collapsed.", "Inflation followed.")
+    assert compact_text(text)["text"].startswith("HIST 210 Final Essay")
+
+
+def test_references_are_trimmed_only_when_asked_and_near_the_end():
+    assert "Keynes" not in compact_text("\f".join(PAGES), trim_references=True)["text"]
+    early = "\f".join([page(1, "References", "Mines fell behind.", "Trade collapsed."), *PAGES[1:2]])
+    assert "Mines fell behind." in compact_text(early, trim_references=True)["text"]
+
+
+def test_compact_input_reports_savings():
+    result = compact_input_core("\f".join(PAGES), trim_references=True)
+    assert result["text"].endswith("The terms were unworkable.")
+    assert result["tokens_after"] < result["tokens_before"]
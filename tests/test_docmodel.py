@@ -0,0 +1,86 @@
+import docx
+import pymupdf
+
+from docmodel import HEADING, LIST_ITEM, PARAGRAPH, DocumentBuilder, StructuredDocument, build_structured
+from server import get_document_section_core, parse_structured_core, regrade_core
+
+
+def test_builder_round_trips_through_a_memory_mapped_file(tmp_path):
+    builder = DocumentBuilder()
+    builder.start_page(1)
+    builder.add(PARAGRAPH, "Preface before any heading.", 1)
+    builder.add(HEADING, "Causes", 1, level=1)
+    builder.add(PARAGRAPH, "Reparations were too high.", 1)
+    builder.start_page(2)
+    builder.add_table([["Year", "Output"], ["1921", "80"], ["", ""]], 2)
+    builder.add(HEADING, "Ünintended effects", 2, level=2)
+    builder.add(LIST_ITEM, "- Inflation", 2)
+    path = str(tmp_path / "doc.grdoc")
+    builder.build().save(path)
+
+    with StructuredDocument.load(path) as document:
+        assert [document.section_title(i) for i in range(len(document.sections))] == [None, "Causes", "Ünintended effects"]
+        assert document.section_text(1) == "Causes\n\nReparations were too high.\n\nYear | Output\n1921 | 80"
+        assert document.section_text(2) == "Ünintended effects\n\n- Inflation"
+        assert document.page_text(2) == "Year | Output\n1921 | 80\n\nÜnintended effects\n\n- Inflation"
+        assert document.table_rows(0) == [["Year", "Output"], ["1921", "80"]]
+        summary = document.summary()
+        assert summary["pages"] == 2
+        assert summary["elements"] == {"paragraph": 2, "heading": 2, "list_item": 1, "table": 1, "footnote": 0}
+        assert document.text.startswith("Preface before any heading.\n\nCauses")
+
+
+def make_structured_docx(path):
+    document = docx.Document()
+    document.add_heading("The Treaty", level=1)
+    document.add_paragraph("The treaty failed for economic reasons.")
+    document.add_paragraph("Reparations exceeded output", style="List Bullet")
+    table = document.add_table(rows=2, cols=2)
+    for row, values in zip(table.rows, (("Year", "Output"), ("1921", "80"))):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+    document.add_heading("Aftermath", level=2)
+    document.add_paragraph("Occupation deepened the crisis.")
+    document.save(path)
+    return str(path)
+
+
+def test_docx_headings_lists_and_tables(tmp_path):
+    with build_structured(make_structured_docx(tmp_path / "essay.docx")) as document:
+        summary = document.summary()
+        assert summary["elements"] == {"paragraph": 2, "heading": 2, "list_item": 1, "table": 1, "footnote": 0}
+        assert [(s["title"], s["level"]) for s in summary["sections"]] == [("The Treaty", 1), ("Aftermath", 2)]
+        assert document.table_rows(0) == [["Year", "Output"], ["1921", "80"]]
+
+
+def test_pdf_headings_by_font_size_without_running_headers(tmp_path):
+    path = str(tmp_path / "essay.pdf")
+    pdf = pymupdf.open()
+    for number, heading in enumerate(("Causes", "Effects"), 1):
+        page = pdf.new_page()
+        page.insert_text((72, 30), "HIST 210 Final Essay", fontsize=9)
+        page.insert_text((72, 100), heading, fontsize=18)
+        page.insert_textbox(pymupdf.Rect(72, 120, 540, 400),
+                            "The treaty failed because its economic terms could not be met. " * 4, fontsize=10)
+        page.insert_text((300, 820), f"Page {number} of 2", fontsize=9)
+    pdf.save(path)
+    pdf.close()
+
+    with build_structured(path) as document:
+        assert [document.section_title(i) for i in range(len(document.sections))] == ["Causes", "Effects"]
+        assert "HIST 210" not in document.text and "Page 1 of 2" not in document.text
+        assert document.page_text(2).startswith("Effects\n\nThe treaty failed")
+
+
+def test_sections_are_served_and_graded_from_the_store(openai_stub, rubric, tmp_path):
+    outline = parse_structured_core(make_structured_docx(tmp_path / "essay.docx"))
+    document_id = outline["document_id"]
+    assert outline["section_count"] == 2
+    section = get_document_section_core(document_id, section=1)
+    assert section == {"document_id": document_id, "section": 1, "title": "Aftermath",
+                       "text": "Aftermath\n\nOccupation deepened the crisis."}
+    assert get_document_section_core(document_id, page=1)["text"].startswith("The Treaty")
+    assert "does not exist" in get_document_section_core(document_id, section=5)["error"]
+    assert get_document_section_core(document_id)["error"] == "Either section or page is required"
+    # Regrading splits the document along its own sections
+    assert regrade_core(rubric=rubric, document_id=document_id)["sections"] == 2
@@ -0,0 +1,64 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from documents import DocumentStore
+from server import get_document_section_core, grade_submission_core, parse_document_core
+
+
+def test_put_is_content_addressed(tmp_path, make_docx):
+    store = DocumentStore(str(tmp_path / "store"))
+    path = make_docx("essay.docx", "The treaty failed.")
+    handle = store.put_path(path)
+    with open(path, "rb") as f:
+        assert handle == hashlib.sha256(f.read()).hexdigest()
+    assert store.put_path(path) == handle
+    assert store.file_path(handle).endswith(".docx")
+    # Nothing is left behind in the upload area
+    assert os.listdir(tmp_path / "store" / "tmp") == []
+
+
+def test_put_rejects_oversized_and_unsupported_uploads(tmp_path):
+    store = DocumentStore(str(tmp_path / "store"), max_mb=1)
+    with pytest.raises(ValueError, match="1 MB size limit"):
+        store.put(io.BytesIO(b"x" * (2 * 1024 * 1024)), ".pdf")
+    with pytest.raises(ValueError, match="Unsupported file format"):
+        store.put(io.BytesIO(b"text"), ".txt")
+    assert os.listdir(tmp_path / "store" / "tmp") == []
+    with pytest.raises(ValueError, match="Invalid document handle"):
+        store.read_text("../../etc/passwd")
+
+
+def test_extract_writes_text_once_and_summarizes(tmp_path, make_docx):
+    store = DocumentStore(str(tmp_path / "store"))
+    handle = store.put_path(make_docx("essay.docx", "First paragraph here.", "Second one."))
+    chunks = []
+    summary = store.extract(handle, on_chunk=chunks.append)
+    assert summary == {"document_id": handle, "words": 5, "characters": 33,
+                       "preview": "First paragraph here.\nSecond one."}
+    assert len(chunks) == 1
+    assert store.read_text(handle) == "First paragraph here.\nSecond one."
+    store.extract(handle, on_chunk=chunks.append)
+    assert len(chunks) == 1
+
+
+def test_prune_removes_unused_documents(tmp_path, make_docx):
+    store = DocumentStore(str(tmp_path / "store"))
+    handle = store.put_path(make_docx("essay.docx", "Old essay."))
+    store.extract(handle)
+    assert store.prune(max_age=3600) == 0
+    assert store.prune(max_age=-1) == 2
+    with pytest.raises(FileNotFoundError):
+        store.file_path(handle)
+
+
+def test_tools_pass_handles_instead_of_text(openai_stub, rubric, make_docx):
+    document = parse_document_core(make_docx("essay.docx", "The treaty failed because its terms were unworkable."))
+    assert "error" not in document
+    result = grade_submission_core("", rubric, check_plagiarism=False, document_id=document["document_id"])
+    assert result["grade_results"]["score"] == "80/100"
+    assert parse_document_core()["error"] == "Either file_path or document_id is required"
+    assert grade_submission_core("", rubric, document_id="0" * 64)["error"].startswith("Could not load document")
+    assert "error" in get_document_section_core("0" * 64, section=1)
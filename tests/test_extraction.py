@@ -0,0 +1,51 @@
+import pytest
+
+from benchmark import generate_docx, generate_pdf
+from extraction import PARALLEL_PAGE_THRESHOLD, extract_text, iter_document
+
+
+@pytest.fixture(scope="module")
+def long_pdf(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "long.pdf")
+    generate_pdf(path, PARALLEL_PAGE_THRESHOLD + 2)
+    return path
+
+
+def test_parallel_pdf_extraction_matches_serial(long_pdf):
+    chunks = []
+    parallel = extract_text(long_pdf, workers=2, on_chunk=chunks.append)
+    serial = extract_text(long_pdf, workers=1)
+    assert parallel["text"] == serial["text"]
+    assert parallel["pages"] == PARALLEL_PAGE_THRESHOLD + 2
+    assert [chunk["page"] for chunk in chunks] == list(range(1, parallel["pages"] + 1))
+    # Pages after the first are separated by a form feed, in order
+    pages = parallel["text"].split("\f")
+    assert len(pages) == parallel["pages"]
+    assert all(f"Page {n} of" in page for n, page in enumerate(pages, 1))
+    assert not parallel["truncated"]
+
+
+def test_page_limit_truncates(long_pdf):
+    result = extract_text(long_pdf, max_pages=3)
+    assert (result["pages"], result["truncated"]) == (3, True)
+    assert result["text"].count("\f") == 2
+
+
+def test_docx_chunks_join_to_the_paragraphs(tmp_path, make_docx):
+    path = make_docx("essay.docx", *(f"Paragraph {n}." for n in range(450)))
+    result = extract_text(path)
+    assert result["pages"] == 3
+    assert result["text"].split("\n") == [f"Paragraph {n}." for n in range(450)]
+
+    generated = str(tmp_path / "generated.docx")
+    generate_docx(generated, 2)
+    assert len(extract_text(generated)["text"].split("\n")) == 8
+
+
+def test_rejects_large_and_unsupported_files(long_pdf, tmp_path):
+    with pytest.raises(ValueError, match="size limit"):
+        iter_document(long_pdf, max_mb=0.001)
+    notes = tmp_path / "notes.txt"
+    notes.write_text("plain text")
+    with pytest.raises(ValueError, match="Unsupported file format"):
+        iter_document(str(notes))
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+import server
+from server import (grade_and_feedback_core, grade_and_feedback_core_async, grade_long_text_core,
+                    grade_submission_core, reduce_chunk_scores, validate_grade_result)
+
+
+def essay() -> str:
+    return f"Essay {uuid.uuid4().hex} argues that the treaty failed because its economic terms were unworkable."
+
+
+def test_combined_mode_grades_and_writes_feedback_in_one_call(openai_stub, rubric):
+    requests = openai_stub.counters["requests"]
+    result = grade_and_feedback_core(essay(), rubric)
+    assert openai_stub.counters["requests"] == requests + 1
+    assert result["feedback"].startswith("## Feedback")
+    assert result["breakdown"] == {"Clarity": "32/40", "Argument": "48/60"}
+    assert result["score"] == "80/100"
+
+
+def test_combined_mode_async(openai_stub, rubric):
+    result = asyncio.run(grade_and_feedback_core_async(essay(), rubric))
+    assert "feedback" in result and "error" not in result
+
+
+def test_async_cores_compact_off_the_event_loop(openai_stub, rubric, monkeypatch):
+    threads = []
+    compact = server.prompt_text
+
+    def prompt_text(text):
+        threads.append(threading.current_thread())
+        return compact(text)
+
+    monkeypatch.setattr(server, "prompt_text", prompt_text)
+    asyncio.run(grade_and_feedback_core_async(essay(), rubric))
+    asyncio.run(server.grade_text_core_async(essay(), rubric))
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_validate_grade_result_normalizes_and_rejects():
+    result = validate_grade_result({"grade": "B", "score": 80, "breakdown": {"Clarity": 32}, "summary": "Fine."})
+    assert result["score"] == "80" and result["breakdown"] == {"Clarity": "32"}
+    with pytest.raises(ValueError, match="missing feedback"):
+        validate_grade_result({"grade": "B", "score": "80", "breakdown": {}, "summary": ""}, require_feedback=True)
+    with pytest.raises(ValueError, match="breakdown must be an object"):
+        validate_grade_result({"grade": "B", "score": "80", "breakdown": [], "summary": ""})
+    with pytest.raises(ValueError, match="not a JSON object"):
+        validate_grade_result(["B"])
+
+
+def test_long_text_is_graded_in_chunks(openai_stub, rubric):
+    text = "\n\n".join(f"{essay()} Paragraph {n} adds evidence from the trade records of that year." for n in range(12))
+    requests = openai_stub.counters["requests"]
+    result = grade_long_text_core(text, rubric, chunk_tokens=100, concurrency=2)
+    assert result["chunks"] > 1
+    assert openai_stub.counters["requests"] == requests + result["chunks"]
+    assert result["breakdown"] == {"Clarity": "32/40", "Argument": "48/60"}
+    assert result["score"] == "80/100"
+    assert result["tokens"]["prompt_tokens"] > result["tokens"]["document"]
+
+
+def test_reduce_weights_chunks_by_length_and_clamps():
+    criteria = [{"name": "Clarity", "weight": 40}, {"name": "Argument", "weight": 60}]
+    chunks = [
+        {"Clarity": {"score": 40, "notes": "Clear."}, "Argument": {"score": 90}},
+        {"Clarity": {"score": 10}, "Argument": {"score": "n/a"}},
+    ]
+    result = reduce_chunk_scores(criteria, chunks, [3, 1])
+    # Clarity (40*3 + 10*1) / 4; Argument is clamped to 60 and the unreadable score is skipped
+    assert result["breakdown"] == {"Clarity": "32.5/40", "Argument": "60/60"}
+    assert result["score"] == "92.5/100"
+    assert result["summary"] == "Graded in 2 parts. Clarity: Clear."
+
+
+def test_submission_stages_run_concurrently(monkeypatch, rubric):
+    async def slow(result):
+        await asyncio.sleep(0.3)
+        return result
+
+    monkeypatch.setattr(server, "grade_text_core_async", lambda *args: slow({"grade": "B", "score": "80/100"}))
+    monkeypatch.setattr(server, "generate_feedback_core_async", lambda *args: slow("## Feedback"))
+    monkeypatch.setattr(server, "check_plagiarism_core", lambda text, use_cache: time.sleep(0.3) or {})
+    events = []
+    begin = time.perf_counter()
+    result = grade_submission_core(essay(), rubric, on_stage=lambda stage, **info: events.append((stage, info["status"])))
+    assert time.perf_counter() - begin < 0.8
+    assert result["grade_results"]["score"] == "80/100"
+    assert result["feedback"] == "## Feedback"
+    assert {name: info["status"] for name, info in result["stages"].items()} == \
+        {"plagiarism": "done", "grade": "done", "feedback": "done"}
+    for stage in ("plagiarism", "grade", "feedback"):
+        assert [status for name, status in events if name == stage] == ["queued", "running", "done"]
+
+
+def test_a_failed_or_slow_stage_does_not_hold_up_the_others(monkeypatch, rubric):
+    async def never(*args):
+        await asyncio.sleep(60)
+
+    async def broken(*args):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(server, "grade_text_core_async", never)
+    monkeypatch.setattr(server, "generate_feedback_core_async", broken)
+    result = grade_submission_core(essay(), rubric, check_plagiarism=False, timeouts={"grade": 0.1})
+    assert result["grade_results"] == {"error": "Grade timed out after 0.1s"}
+    assert result["feedback"] == "Error: Feedback failed: provider down"
+    assert result["stages"]["grade"]["status"] == "error"
+    assert result["plagiarism_results"] is None
+
+
+def test_combined_submission_splits_out_feedback(openai_stub, rubric):
+    result = grade_submission_core(essay(), rubric, check_plagiarism=False, combined=True)
+    assert list(result["stages"]) == ["grade_and_feedback"]
+    assert result["feedback"].startswith("## Feedback")
+    assert "feedback" not in result["grade_results"]
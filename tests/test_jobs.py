@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import stat
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+import jobs
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"))
+
+
+def stored_payload(queue, job_id):
+    with sqlite3.connect(queue.path) as conn:
+        return json.loads(conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+
+def age(queue, job_id, seconds):
+    with sqlite3.connect(queue.path) as conn:
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - seconds, job_id))
+
+
+def test_claim_takes_oldest_job_once(queue):
+    first = queue.submit("grade", {"text": "one"})
+    second = queue.submit("grade", {"text": "two"})
+    assert queue.claim("w1")[0] == first
+    assert queue.claim("w2")[0] == second
+    assert queue.claim("w3") is None
+    assert queue.get(first)["status"] == "running"
+    assert queue.get(first)["attempts"] == 1
+
+
+def test_credentials_are_sealed_and_claimed_only_by_the_pool(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    key = jobs.pool_key()
+    submitter = JobQueue(path, key)
+    # Another process holding the database open keeps the WAL file from being removed
+    other = sqlite3.connect(path)
+    other.execute("SELECT COUNT(*) FROM jobs").fetchone()
+    job_id = submitter.submit("grade", {"text": "essay"}, credentials={"OPENAI_API_KEY": "sk-secret", "PATH": "/evil"})
+    for suffix in ("", "-wal"):
+        with open(path + suffix, "rb") as f:
+            assert b"sk-secret" not in f.read()
+    other.close()
+    assert "credentials" not in stored_payload(submitter, job_id)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # Workers without the key (or with another pool's key) leave the job alone
+    assert JobQueue(path).claim("w1") is None
+    assert JobQueue(path, Fernet.generate_key()).claim("w1") is None
+    _, _, payload = JobQueue(path, key).claim("w2")
+    assert payload["credentials"] == {"OPENAI_API_KEY": "sk-secret"}
+    with pytest.raises(ValueError, match="need a queue opened with a key"):
+        JobQueue(path).submit("grade", {}, credentials={"OPENAI_API_KEY": "sk-secret"})
+
+
+def test_requeue_stale(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(path, jobs.pool_key())
+    plain = queue.submit("grade", {"text": "essay"})
+    keyed = queue.submit("grade", {"text": "essay"}, credentials={"OPENAI_API_KEY": "sk-secret"})
+    fresh = queue.submit("grade", {"text": "essay"})
+    orphan = JobQueue(path, Fernet.generate_key()).submit("grade", {"text": "essay"}, credentials={"OPENAI_API_KEY": "sk-old"})
+    for _ in range(3):
+        queue.claim("w1")
+    age(queue, plain, 600)
+    age(queue, keyed, 600)
+    age(queue, orphan, 600)
+    queue.heartbeat("w1")
+
+    assert queue.requeue_stale(stale_after=300) == 2
+    assert queue.get(plain)["status"] == "queued"
+    assert queue.get(keyed)["status"] == "queued"
+    assert queue.get(fresh)["status"] == "running"
+    # The pool that sealed it is gone, so no worker could ever run it
+    assert queue.get(orphan)["status"] == "failed"
+    assert "credentials" in queue.get(orphan)["error"]
+
+
+def test_requeue_fails_after_max_attempts(queue):
+    job_id = queue.submit("grade", {"text": "essay"})
+    for _ in range(jobs.MAX_ATTEMPTS):
+        queue.claim("w1")
+        age(queue, job_id, 600)
+        queue.requeue_stale(stale_after=300)
+    assert queue.get(job_id)["status"] == "failed"
+    assert queue.get(job_id)["error"] == "Worker stopped responding"
+
+
+def test_job_credentials_are_restored(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "worker-key")
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    with jobs.job_credentials({"OPENAI_API_KEY": "job-key", "GEMINI_API_KEY": "job-gemini", "PATH": "/evil"}):
+        assert os.environ["OPENAI_API_KEY"] == "job-key"
+        assert os.environ["GEMINI_API_KEY"] == "job-gemini"
+        assert os.environ["PATH"] != "/evil"
+    assert os.environ["OPENAI_API_KEY"] == "worker-key"
+    assert "GEMINI_API_KEY" not in os.environ
+
+
+def test_run_job_restores_credentials_on_failure(queue, monkeypatch):
+    import server
+
+    seen = []
+
+    def grade(*args, **kwargs):
+        seen.append(os.environ["OPENAI_API_KEY"])
+        raise RuntimeError("boom")
+
+    monkeypatch.setenv("OPENAI_API_KEY", "worker-key")
+    monkeypatch.setattr(server, "grade_submission_core", grade)
+    queue = JobQueue(queue.path, jobs.pool_key())
+    job_id = queue.submit("grade", {"text": "essay", "rubric": "Overall"}, credentials={"OPENAI_API_KEY": "job-key"})
+    with pytest.raises(RuntimeError):
+        jobs.run_job(queue, *queue.claim("w1"))
+    assert seen == ["job-key"]
+    assert os.environ["OPENAI_API_KEY"] == "worker-key"
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_run_job_grades_records_stages_and_saves(queue, openai_stub, rubric):
+    job_id = queue.submit("grade", {"text": f"Essay {time.time()} on the treaty and its economic terms.",
+                                    "rubric": rubric, "assignment": "essay1", "student": "ana",
+                                    "file_name": "ana.docx"})
+    jobs.run_job(queue, *queue.claim("w1"))
+    job = queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["stages"]["grade_and_feedback"]["status"] == "done"
+    assert job["result"]["grade_results"]["score"] == "80/100"
+    assert job["result"]["file_name"] == "ana.docx"
+
+    from results_store import get_results_store
+
+    assert get_results_store().query(student="ana", assignment="essay1")[0]["id"] == job["result"]["result_id"]
+
+    other = queue.submit("index", {})
+    jobs.run_job(queue, *queue.claim("w1"))
+    assert queue.get(other)["error"] == "Unknown job kind 'index'"
@@ -0,0 +1,152 @@
+import asyncio
+import gc
+import threading
+import weakref
+
+import pytest
+
+import llm_providers
+from llm_providers import AllProvidersFailed, Completion, OpenAIProvider, is_quota_failure
+
+
+def test_async_client_is_shared_per_loop_and_closed_when_replaced(monkeypatch):
+    monkeypatch.setenv("TEST_PROVIDER_KEY", "first")
+    provider = OpenAIProvider("test", "TEST_PROVIDER_KEY")
+    loops = []
+
+    async def use():
+        loops.append(weakref.ref(asyncio.get_running_loop()))
+        client = provider.async_client()
+        assert provider.async_client() is client
+        monkeypatch.setenv("TEST_PROVIDER_KEY", "second")
+        replacement = provider.async_client()
+        assert replacement is not client
+        await asyncio.sleep(0)
+        assert client.is_closed()
+        assert not replacement.is_closed()
+        monkeypatch.setenv("TEST_PROVIDER_KEY", "first")
+        return replacement
+
+    first = asyncio.run(use())
+    second = asyncio.run(use())
+    assert first is not second
+    gc.collect()
+    # Clients go away with their loop instead of piling up
+    assert all(ref() is None for ref in loops)
+    assert len(provider._async_clients) == 0
+
+
+def test_sync_client_closed_when_replaced(monkeypatch):
+    monkeypatch.setenv("TEST_PROVIDER_KEY", "first")
+    provider = OpenAIProvider("test", "TEST_PROVIDER_KEY")
+    client = provider.client()
+    assert provider.client() is client
+    monkeypatch.setenv("TEST_PROVIDER_KEY", "second")
+    assert provider.client() is not client
+    assert client.is_closed()
+
+
+def test_async_cores_keep_cache_io_off_the_loop(openai_stub, monkeypatch):
+    import server
+
+    threads = []
+    lookup, store = server.cache_lookup, server.cache_store
+
+    def recording_lookup(*args):
+        threads.append(threading.current_thread())
+        return lookup(*args)
+
+    def recording_store(*args):
+        threads.append(threading.current_thread())
+        return store(*args)
+
+    monkeypatch.setattr(server, "cache_lookup", recording_lookup)
+    monkeypatch.setattr(server, "cache_store", recording_store)
+
+    async def grade():
+        loop_thread = threading.current_thread()
+        result = await server.grade_text_core_async("An essay about rivers.", "Flow (100%): coherent")
+        return loop_thread, result
+
+    loop_thread, result = asyncio.run(grade())
+    assert result["score"] == "80/100"
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+
+class FakeProvider:
+    """Answers with its own name, or raises `error`; records the timeout of each call."""
+
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.timeouts = []
+
+    def available(self):
+        return True
+
+    def complete(self, model, messages, json_mode=False, timeout=None):
+        self.timeouts.append(timeout)
+        if self.error is not None:
+            raise self.error
+        return Completion(self.name, self.name, model, 10, 5)
+
+    async def acomplete(self, model, messages, json_mode=False, timeout=None):
+        return self.complete(model, messages, json_mode, timeout)
+
+
+@pytest.fixture
+def route(monkeypatch):
+    """Routes the "fallback_test" stage through fake providers, in the order given."""
+    monkeypatch.setattr(llm_providers, "_last_failure", {})
+
+    def make(*providers):
+        for provider in providers:
+            monkeypatch.setitem(llm_providers.PROVIDERS, provider.name, provider)
+        monkeypatch.setenv("GRADER_FALLBACK_TEST_MODELS", ",".join(f"{p.name}:{p.name}-model" for p in providers))
+        return providers
+
+    return make
+
+
+def test_falls_back_to_the_next_provider(route):
+    first, second = route(FakeProvider("fake_first", RuntimeError("down")), FakeProvider("fake_second"))
+    messages = [{"role": "user", "content": "Grade this."}]
+    completion = llm_providers.complete("fallback_test", messages)
+    assert (completion.text, completion.model) == ("fake_second", "fake_second-model")
+    # Only providers with a fallback get the latency SLO as a timeout
+    assert first.timeouts == [llm_providers.LATENCY_SLO] and second.timeouts == [None]
+    assert llm_providers.registry._counters[("grader_llm_fallbacks_total",
+                                             (("provider", "fake_first"), ("reason", "RuntimeError"),
+                                              ("stage", "fallback_test")))] >= 1
+    # A provider that just failed is tried last while it cools down, but cache keys keep the configured order
+    assert [name for name, _ in llm_providers.resolve_route("fallback_test")] == ["fake_second", "fake_first"]
+    assert llm_providers.describe_route("fallback_test") == "fake_first:fake_first-model>fake_second:fake_second-model"
+    assert asyncio.run(llm_providers.acomplete("fallback_test", messages)).text == "fake_second"
+
+
+def test_reports_every_failure(route):
+    import httpx
+    import openai
+
+    response = httpx.Response(429, request=httpx.Request("POST", "http://stub/v1"))
+    quota = openai.RateLimitError("quota", response=response, body={"code": "insufficient_quota"})
+    route(FakeProvider("fake_first", quota), FakeProvider("fake_second", quota))
+    with pytest.raises(AllProvidersFailed) as failed:
+        llm_providers.complete("fallback_test", [{"role": "user", "content": "Grade this."}])
+    assert [name for name, _ in failed.value.errors] == ["fake_first", "fake_second"]
+    assert is_quota_failure(failed.value)
+
+    route(FakeProvider("fake_first", ValueError("bad request")))
+    with pytest.raises(ValueError, match="bad request"):
+        llm_providers.complete("fallback_test", [{"role": "user", "content": "Grade this."}])
+
+
+def test_local_provider_serves_an_openai_compatible_endpoint(openai_stub, monkeypatch):
+    monkeypatch.setenv("LOCAL_LLM_BASE_URL", openai_stub.base_url)
+    monkeypatch.setenv("GRADER_LOCAL_TEST_MODELS", "local:llama")
+    completion = llm_providers.complete("local_test", [{"role": "user", "content": "Give feedback."}])
+    assert (completion.provider, completion.model) == ("local", "llama")
+    assert completion.text.startswith("## Feedback")
+    monkeypatch.delenv("LOCAL_LLM_BASE_URL")
+    assert not llm_providers.has_provider("local_test")
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+import telemetry
+from llm_providers import OpenAIProvider
+from llm_scheduler import RequestScheduler
+from stubs import StubOpenAI
+
+
+class ThrottlingStub(StubOpenAI):
+    """Answers the first `throttle` requests with 429 and a short retry-after-ms."""
+
+    def __init__(self, throttle: int, **kwargs):
+        super().__init__(latency_ms=1, jitter_ms=0, **kwargs)
+        self.throttle = throttle
+
+    def _respond(self, request, method):
+        with self._lock:
+            throttled = self.throttle > 0
+            self.throttle -= throttled
+        if not throttled:
+            return super()._respond(request, method)
+        request.rfile.read(int(request.headers.get("Content-Length") or 0))
+        self._send(request, 429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                   {"retry-after-ms": "50"})
+
+
+def counter(name, **labels):
+    return telemetry.registry._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    def make(stub):
+        monkeypatch.setenv("THROTTLE_TEST_KEY", "test")
+        monkeypatch.setenv("THROTTLE_TEST_BASE_URL", stub.base_url)
+        return OpenAIProvider("throttle_test", "THROTTLE_TEST_KEY", "THROTTLE_TEST_BASE_URL")
+    return make
+
+
+def completion(provider, scheduler):
+    async def request():
+        messages = [{"role": "user", "content": "Say hi"}]
+        return await scheduler.acall(lambda: provider.async_client().chat.completions.create(
+            model="stub", messages=messages), 100)
+
+    span = {}
+    async def traced():
+        token = telemetry._current_span.set(span)
+        try:
+            return await request()
+        finally:
+            telemetry._current_span.reset(token)
+
+    return asyncio.run(traced()), span
+
+
+def test_throttled_request_is_retried_and_counted_once(provider):
+    with ThrottlingStub(throttle=2) as stub:
+        scheduler = RequestScheduler(max_concurrency=4, max_retries=3)
+        retries_before = counter("grader_llm_retries_total", reason="429")
+        responses_before = counter("grader_upstream_responses_total", service="throttle_test", status="429")
+        response, span = completion(provider(stub), scheduler)
+
+    assert response.choices[0].message.content
+    assert scheduler.stats["retries"] == 2
+    assert scheduler.stats["throttled"] == 2
+    assert span["retries"] == 2
+    assert counter("grader_llm_retries_total", reason="429") - retries_before == 2
+    assert counter("grader_upstream_responses_total", service="throttle_test", status="429") - responses_before == 2
+    # Throttling halves the concurrency limit
+    assert scheduler.limit < 4
+
+
+def test_retries_give_up_after_max_retries(provider):
+    import openai
+
+    with ThrottlingStub(throttle=10) as stub:
+        scheduler = RequestScheduler(max_concurrency=4, max_retries=1)
+        with pytest.raises(openai.RateLimitError):
+            completion(provider(stub), scheduler)
+    assert scheduler.stats["retries"] == 1
+    assert scheduler.stats["failed"] == 1
+    assert scheduler.in_flight == 0
+
+
+def test_backoff_honours_retry_after_and_caps_it():
+    import httpx
+    import openai
+
+    def rate_limit(headers):
+        response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "http://stub/v1"))
+        return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+    scheduler = RequestScheduler()
+    assert scheduler._backoff(rate_limit({"retry-after-ms": "250"}), 0) == 0.25
+    assert scheduler._backoff(rate_limit({"retry-after": "2"}), 0) == 2.0
+    assert scheduler._backoff(rate_limit({"retry-after": "3600"}), 0) == 60.0
+    # Without a hint: full jitter up to 0.5 * 2^attempt
+    assert all(0 <= scheduler._backoff(rate_limit({}), 3) <= 4.0 for _ in range(50))
+
+
+def test_admission_respects_concurrency_and_token_budgets():
+    scheduler = RequestScheduler(requests_per_minute=6000, tokens_per_minute=1000, max_concurrency=2)
+    assert scheduler.try_acquire(400) == 0
+    assert scheduler.try_acquire(400) == 0
+    # Both slots are taken
+    assert scheduler.try_acquire(100) > 0
+    scheduler.release(400, used=100)
+    # The unused part of the estimate is returned, the rest waits for the bucket to refill
+    assert scheduler.token_budget == pytest.approx(500, abs=5)
+    assert scheduler.try_acquire(900) == pytest.approx((900 - scheduler.token_budget) / scheduler.token_rate, rel=0.05)
+    assert scheduler.try_acquire(400) == 0
+    assert scheduler.in_flight == 2
+
+
+def test_concurrency_limit_halves_on_throttling_and_grows_back():
+    scheduler = RequestScheduler(max_concurrency=8)
+    scheduler.try_acquire(10)
+    scheduler.release(10, used=0, throttled=True, delay=0.5, succeeded=False)
+    assert scheduler.limit == 4
+    assert scheduler.try_acquire(10) > 0.4
+    # Further throttling inside the cooldown doesn't halve it again
+    scheduler.in_flight += 1
+    scheduler.release(10, used=0, throttled=True, succeeded=False)
+    assert scheduler.limit == 4
+    for _ in range(4):
+        scheduler.in_flight += 1
+        scheduler.release(10, used=10)
+    assert 4.9 < scheduler.limit < 5
+    assert scheduler.snapshot()["throttled"] == 2
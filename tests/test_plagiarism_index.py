@@ -0,0 +1,48 @@
+import uuid
+
+from plagiarism_index import PlagiarismIndex, overlapping_passages
+from server import check_local_plagiarism_core
+
+ORIGINAL = ("The collapse of the treaty is usually blamed on politics, but the trade records tell another story. "
+            "Reparations demanded more coal and steel than the mines and mills could produce in any year, "
+            "and every missed delivery gave the creditors a reason to occupy the industrial districts. ")
+COPIED = ORIGINAL.replace("usually blamed on politics", "often blamed on diplomacy")
+UNRELATED = ("Photosynthesis converts light into chemical energy stored in glucose, releasing oxygen as a by-product "
+             "of splitting water molecules inside the chloroplasts of green plant cells during daylight hours.")
+
+
+def test_index_finds_near_duplicates_with_passages(tmp_path):
+    index = PlagiarismIndex(str(tmp_path / "index.sqlite"))
+    index.add("original", ORIGINAL)
+    index.add("unrelated", UNRELATED)
+    matches = index.query(COPIED)
+    assert [m["submission_id"] for m in matches] == ["original"]
+    assert matches[0]["similarity"] > 0.5
+    passage = matches[0]["passages"][0]["text"]
+    assert passage.startswith("but the trade records") and COPIED.index(passage) > 0
+
+    assert index.query(COPIED, exclude_id="original") == []
+    # Adding an id again replaces the document rather than duplicating it
+    index.add("original", UNRELATED)
+    assert index.size() == 2
+    assert index.query(COPIED) == []
+
+
+def test_overlapping_passages_orders_longest_first():
+    text = "alpha beta gamma delta epsilon zeta. one two three four five six seven eight nine ten"
+    other = "one two three four five six seven eight nine ten and alpha beta gamma delta epsilon"
+    passages = overlapping_passages(text, other)
+    assert [p["text"] for p in passages] == ["one two three four five six seven eight nine ten",
+                                             "alpha beta gamma delta epsilon"]
+
+
+def test_local_check_indexes_each_submission():
+    first_id, second_id = uuid.uuid4().hex, uuid.uuid4().hex
+    first = check_local_plagiarism_core(ORIGINAL + first_id, submission_id=first_id)
+    assert first["submission_id"] == first_id
+    second = check_local_plagiarism_core(COPIED + second_id, submission_id=second_id)
+    assert first_id in [m["submission_id"] for m in second["matches"]]
+    assert second["corpus_size"] == first["corpus_size"] + 1
+    # A check that doesn't add leaves the corpus as it was
+    check_local_plagiarism_core(UNRELATED, add_to_index=False)
+    assert check_local_plagiarism_core(UNRELATED, add_to_index=False)["corpus_size"] == second["corpus_size"]
@@ -0,0 +1,72 @@
+import json
+import os
+
+import pytest
+
+import provider_batch
+
+RUBRIC = "Thesis (30%): clear claim\nEvidence (70%): sources support the claim"
+
+
+@pytest.fixture
+def source(tmp_path, make_docx):
+    folder = tmp_path / "essays"
+    folder.mkdir()
+    for name in ("a", "b", "c"):
+        make_docx(f"essays/{name}.docx", f"Essay {name} argues that the treaty failed for economic reasons.")
+    (folder / "broken.docx").write_bytes(b"not a docx")
+    return str(folder)
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return {record["id"]: record for record in map(json.loads, f)}
+
+
+def test_prepare_submit_ingest(source, openai_stub, tmp_path):
+    openai_stub.processing_seconds = 60
+    requests_path = str(tmp_path / "requests.jsonl")
+    prepared = provider_batch.prepare_batch(source, RUBRIC, requests_path, parse_workers=2)
+    assert (prepared["requests"], prepared["failed"], prepared["cached"]) == (3, 1, 0)
+    with open(requests_path, encoding="utf-8") as f:
+        assert [json.loads(line)["custom_id"] for line in f] == ["s0", "s1", "s3"]
+
+    manifest_path = prepared["manifest_path"]
+    submitted = provider_batch.submit_batch(manifest_path)
+    assert submitted["status"] == "in_progress"
+    # Submitting again does not start a second batch
+    assert provider_batch.submit_batch(manifest_path)["batch_id"] == submitted["batch_id"]
+    with pytest.raises(RuntimeError, match="still in_progress"):
+        provider_batch.ingest_batch(manifest_path, str(tmp_path / "out.jsonl"), save_results=False)
+
+    openai_stub.processing_seconds = 0
+    status = provider_batch.batch_status(manifest_path, wait=True, poll_interval=0.01)
+    assert status["status"] == "completed"
+    assert status["request_counts"]["completed"] == 3
+
+    output = str(tmp_path / "out.jsonl")
+    summary = provider_batch.ingest_batch(manifest_path, output, save_results=False)
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (3, 1, 0)
+    records = read_output(output)
+    assert records["a.docx"]["grade"]["breakdown"] == {"Thesis": "24/30", "Evidence": "56/70"}
+    assert records["a.docx"]["feedback"].startswith("## Feedback")
+    assert records["broken.docx"]["error"].startswith("parse: Error")
+    assert os.path.exists(str(tmp_path / "requests.output.jsonl"))
+
+    # Ingesting again adds nothing, and a new batch for the same rubric is answered from the cache
+    assert provider_batch.ingest_batch(manifest_path, output, save_results=False)["skipped"] == 3
+    again = provider_batch.prepare_batch(source, RUBRIC, str(tmp_path / "again.jsonl"), parse_workers=2)
+    assert (again["requests"], again["cached"]) == (0, 3)
+
+
+def test_failed_requests_become_error_records(source, openai_stub, tmp_path):
+    openai_stub.failure_rate = 1.0
+    try:
+        summary = provider_batch.grade_provider_batch(
+            source, "Thesis (50%): claim\nEvidence (50%): support", str(tmp_path / "out.jsonl"),
+            poll_interval=0.01, save_results=False, parse_workers=2)
+    finally:
+        openai_stub.failure_rate = 0.0
+    assert (summary["succeeded"], summary["failed"]) == (0, 4)
+    records = read_output(tmp_path / "out.jsonl")
+    assert records["a.docx"]["error"] == "grade: The request could not be processed."
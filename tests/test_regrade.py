@@ -0,0 +1,50 @@
+import uuid
+
+from server import regrade_core
+
+RUBRIC = "Thesis (40%): states a clear claim\nEvidence (60%): supports the claim with sources"
+SECTIONS = ("INTRODUCTION", "ANALYSIS", "CONCLUSION")
+
+
+def essay(marker: str, conclusion: str = "The treaty therefore failed for economic rather than political reasons.") -> str:
+    paragraphs = {
+        "INTRODUCTION": f"Essay {marker} examines why the treaty collapsed within a decade of being signed. " * 3,
+        "ANALYSIS": "Trade records show reparations exceeded what the economy could produce in those years. " * 3,
+        "CONCLUSION": (conclusion + " ") * 3,
+    }
+    return "\n\n".join(f"{heading}\n\n{paragraphs[heading].strip()}" for heading in SECTIONS)
+
+
+def test_regrade_only_asks_about_changed_criteria_and_sections(openai_stub):
+    marker = uuid.uuid4().hex
+    text = essay(marker)
+    first = regrade_core(text, RUBRIC, chunk_tokens=80)
+    sections = first["sections"]
+    assert sections >= 2
+    assert first["score"] == "80/100"
+    assert first["incremental"]["llm_calls"] == sections
+    assert first["incremental"]["evaluations_made"] == 2 * sections
+
+    again = regrade_core(text, RUBRIC, chunk_tokens=80)
+    assert again["incremental"]["llm_calls"] == 0
+    assert again["incremental"]["evaluations_reused"] == 2 * sections
+    assert again["breakdown"] == first["breakdown"]
+
+    reworded = regrade_core(text, RUBRIC.replace("with sources", "with primary sources"), chunk_tokens=80)
+    assert reworded["incremental"]["regraded_criteria"] == ["Evidence"]
+    assert reworded["incremental"]["evaluations_made"] == sections
+    assert reworded["incremental"]["evaluations_reused"] == sections
+
+    # Reweighting rescales the stored scores without asking again
+    reweighted = regrade_core(text, RUBRIC.replace("40%", "50%").replace("60%", "50%"), chunk_tokens=80)
+    assert reweighted["incremental"]["llm_calls"] == 0
+    assert reweighted["breakdown"] == {"Thesis": "40/50", "Evidence": "40/50"}
+
+    edited = regrade_core(essay(marker, "The treaty failed because its terms were unworkable."),
+                          RUBRIC, chunk_tokens=80)
+    assert edited["incremental"]["regraded_sections"] == [edited["sections"]]
+    assert edited["incremental"]["evaluations_made"] == 2
+
+
+def test_regrade_reports_empty_text():
+    assert regrade_core("   ", RUBRIC) == {"error": "Nothing to grade: the text is empty"}
@@ -0,0 +1,95 @@
+import csv
+import io
+import sys
+import uuid
+
+import pymupdf
+import pytest
+
+from results_store import ResultsStore, result_record
+from server import query_results_core, save_result_core
+
+DAY = 24 * 3600
+START = 1_700_000_000
+
+
+def grade(score, thesis, evidence, letter):
+    return {"grade": letter, "score": f"{score}/100", "summary": "Fine.",
+            "breakdown": {"Thesis": f"{thesis}/40", "Evidence": f"{evidence}/60"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    store.add_many([
+        result_record(grade(90, 36, 54, "A"), "## Great", "essay1", "ana", "r1", graded_at=START),
+        result_record(grade(70, 28, 42, "C"), "Error: timed out", "essay1", "ben", "r1", graded_at=START + DAY),
+        result_record(grade(50, 20, 30, "F"), None, "essay1", "cy", "r1", graded_at=START + 2 * DAY),
+        result_record(grade(80, 32, 48, "B"), None, "essay2", "ana", "r2", graded_at=START + 3 * DAY),
+    ])
+    return store
+
+
+def test_result_record_flattens_a_grade():
+    record = result_record({"grade": "B", "score": "40/50", "breakdown": {}}, "Error: failed", student="ana",
+                           plagiarism={"https://example.com": 85, "note": "n/a"})
+    assert (record["score"], record["max_score"], record["percent"]) == (40, 50, 80)
+    assert record["feedback"] is None
+    assert record["plagiarism_max"] == 85
+
+
+def test_queries_filter_by_assignment_student_and_time(store):
+    assert [r["student"] for r in store.query(assignment="essay1")] == ["cy", "ben", "ana"]
+    assert [r["assignment"] for r in store.query(student="ana")] == ["essay2", "essay1"]
+    assert len(store.query(since=START + DAY, until=START + 3 * DAY)) == 2
+    assert [r["student"] for r in store.query(limit=1, offset=1)] == ["cy"]
+    assert store.query(rubric_id="r2")[0]["breakdown"] == {"Thesis": "32/40", "Evidence": "48/60"}
+
+
+def test_stats_and_distribution(store):
+    stats = store.stats(assignment="essay1")
+    assert (stats["count"], stats["students"], stats["mean_percent"]) == (3, 3, 70)
+    assert stats["percentiles"] == {"p10": 50, "p25": 50, "p50": 70, "p75": 90, "p90": 90}
+    assert stats["criteria"]["Thesis"] == {"count": 3, "mean_score": 28, "max_score": 40, "mean_percent": 70}
+    assert store.stats(assignment="nothing") == {"count": 0, "students": 0}
+
+    distribution = store.distribution(bins=4)
+    assert distribution["count"] == 4
+    assert distribution["grades"] == {"A": 1, "B": 1, "C": 1, "F": 1}
+    assert [b["count"] for b in distribution["histogram"]] == [0, 0, 2, 2]
+
+
+def test_exports(store, tmp_path):
+    buffer = io.BytesIO()
+    assert store.export(buffer, "csv", assignment="essay1")["rows"] == 3
+    rows = list(csv.DictReader(io.StringIO(buffer.getvalue().decode("utf-8"))))
+    assert [row["student"] for row in rows] == ["ana", "ben", "cy"]
+
+    import pyarrow.parquet as pq
+
+    result = store.export(str(tmp_path / "results.parquet"))
+    assert (result["rows"], result["format"]) == (4, "parquet")
+    assert pq.read_table(result["output_path"]).column("percent").to_pylist() == [90, 70, 50, 80]
+
+    assert store.export(str(tmp_path / "reports.pdf"), student="ana")["rows"] == 2
+    with pymupdf.open(str(tmp_path / "reports.pdf")) as pdf:
+        assert pdf.page_count == 2
+        assert "Great" in pdf[0].get_text()
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        store.export(str(tmp_path / "results.xlsx"))
+
+
+def test_parquet_export_names_the_extra(store, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ValueError, match='install the "parquet" extra'):
+        store.export(str(tmp_path / "results.parquet"))
+
+
+def test_save_result_tool_round_trip():
+    student = uuid.uuid4().hex
+    assert save_result_core({"error": "Grading failed"}, "essay", student) == {
+        "error": "Only successful grading results can be saved"}
+    saved = save_result_core(grade(80, 32, 48, "B"), "essay", student, feedback="## Feedback")
+    results = query_results_core(student=student)["results"]
+    assert [r["id"] for r in results] == [saved["result_id"]]
+    assert results[0]["feedback"] == "## Feedback"
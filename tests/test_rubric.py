@@ -0,0 +1,99 @@
+import pytest
+
+from rubric import RubricRegistry, check_breakdown, compile_rubric
+from server import grade_text_core, grading_messages, register_rubric_core
+
+RUBRIC = "Clarity (40%): clear writing\nArgument (60%): strong reasoning"
+
+
+def graded(breakdown, score="70/100", grade="C-"):
+    return {"grade": grade, "score": score, "breakdown": breakdown, "summary": "ok"}
+
+
+def test_full_match_recomputes_score_and_grade():
+    result = check_breakdown(graded({"Clarity": "36/40", "Argument": "30/30"}), compile_rubric(RUBRIC))
+    assert result["breakdown"] == {"Clarity": "36/40", "Argument": "60/60"}
+    assert result["score"] == "96/100"
+    assert result["grade"] == "A"
+    assert result["score_check"] == {"model_score": "70/100", "model_grade": "C-"}
+    assert "breakdown_mismatch" not in result
+
+
+def test_agreeing_breakdown_has_no_score_check():
+    result = check_breakdown(graded({"Clarity": "30/40", "Argument": "45/60"}, "75/100", "C"),
+                             compile_rubric(RUBRIC))
+    assert result["score"] == "75/100"
+    assert "score_check" not in result
+
+
+@pytest.mark.parametrize("rubric, breakdown, mismatch", [
+    # Free-text answer against a weighted rubric
+    (RUBRIC, {"Overall": "85/100"},
+     {"unmatched": ["Overall"], "missing": ["Clarity", "Argument"], "duplicated": []}),
+    # Paraphrased criterion names
+    ("Content (50%): ideas\nStyle (50%): prose", {"Quality of content": "40/50", "Style": "45/50"},
+     {"unmatched": ["Quality of content"], "missing": ["Content"], "duplicated": []}),
+    # Only some criteria scored
+    (RUBRIC, {"Clarity": "30/40"},
+     {"unmatched": [], "missing": ["Argument"], "duplicated": []}),
+    # Two entries landing on the same criterion
+    (RUBRIC, {"Clarity": "30/40", "Clarity of writing": "35/40", "Argument": "50/60"},
+     {"unmatched": [], "missing": [], "duplicated": ["Clarity"]}),
+    # Unreadable score
+    (RUBRIC, {"Clarity": "good", "Argument": "50/60"},
+     {"unmatched": ["Clarity"], "missing": ["Clarity"], "duplicated": []}),
+])
+def test_mismatch_keeps_model_score(rubric, breakdown, mismatch):
+    result = check_breakdown(graded(dict(breakdown)), compile_rubric(rubric))
+    assert result["score"] == "70/100"
+    assert result["grade"] == "C-"
+    assert result["breakdown"] == breakdown
+    assert result["breakdown_mismatch"] == mismatch
+    assert "score_check" not in result
+
+
+@pytest.mark.parametrize("rubric, expected", [
+    ("Content (40%): ideas\nStyle (60%): prose", {"Content": 40, "Style": 60}),
+    ("Analysis - 30 points: depth\nEvidence - 70 points: sources", {"Analysis": 30, "Evidence": 70}),
+    ("Content: 40 points\nStyle: 60 points", {"Content": 40, "Style": 60}),
+    ("Content: 40 points / Style: 60 points", {"Content": 40, "Style": 60}),
+    ("Content: 40 pts - ideas\nStyle: (60) prose", {"Content": 40, "Style": 60}),
+    ("Content (4)\nStyle (6)", {"Content": 4, "Style": 6}),
+    ("Content (40%): ideas\nStyle (60%): prose\nTotal: 100 points", {"Content": 40, "Style": 60}),
+    ("Content (4)\nStyle (6)\nSum: 10", {"Content": 4, "Style": 6}),
+    ("Content: 10 pts\nStyle: 20 pts\nTotal: 60", {"Content": 20, "Style": 40}),
+    ("Content (30%): ideas\nStyle: prose\nGrammar: mechanics", {"Content": 30, "Style": 35, "Grammar": 35}),
+    ("Content (50%): ideas\nStyle (50%): prose\nGrammar: mechanics",
+     {"Content": 100 / 3, "Style": 100 / 3, "Grammar": 100 / 3}),
+    ("Summary: a short essay\nwith sources", {"Summary": 100}),
+    ("Grade this essay fairly.", {"Overall": 100}),
+])
+def test_parse_criteria_weights(rubric, expected):
+    compiled = compile_rubric(rubric)
+    weights = {c["name"]: c["weight"] for c in compiled["criteria"]}
+    assert weights == pytest.approx(expected)
+    assert compiled["max_score"] == pytest.approx(sum(expected.values()))
+
+
+def test_compiled_rubric_ignores_layout_and_gives_a_stable_prefix():
+    compiled = compile_rubric("Thesis (40%): clear claim\nEvidence (60%): sources")
+    assert compile_rubric("  Thesis (40%): clear claim\n\n  Evidence (60%): sources  \n") == compiled
+    assert compile_rubric("Thesis (50%): clear claim\nEvidence (50%): sources")["id"] != compiled["id"]
+    first = grading_messages("First essay.", compiled)[-1]["content"]
+    second = grading_messages("A different essay.", compiled)[-1]["content"]
+    # Everything before the submission is byte-identical, so providers can cache the prefix
+    prefix = first[:first.index("First essay.")]
+    assert second.startswith(prefix) and compiled["rendered"] in prefix
+
+
+def test_registered_rubric_is_used_by_id(openai_stub, tmp_path):
+    registered = register_rubric_core("Thesis (40%): clear claim\nEvidence (60%): sources")
+    result = grade_text_core("An essay about the treaty.", rubric_id=registered["rubric_id"])
+    assert result["breakdown"] == {"Thesis": "32/40", "Evidence": "48/60"}
+    assert "Unknown rubric id" in grade_text_core("An essay.", rubric_id="missing")["error"]
+
+    # A fresh registry reads compiled rubrics back from SQLite
+    registry = RubricRegistry(str(tmp_path / "rubrics.sqlite"))
+    compiled = registry.register("Overall quality")
+    assert RubricRegistry(registry.path).get(compiled["id"]) == compiled
+    assert registry.get("missing") is None
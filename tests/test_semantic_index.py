@@ -0,0 +1,51 @@
+import logging
+
+import semantic_index
+from semantic_index import HashingEmbedder, SemanticIndex, get_embedder
+
+ORIGINAL = ("The industrial revolution transformed rural economies as factories drew workers into growing "
+            "cities, where wages were low, housing was crowded and child labour was common across the textile "
+            "mills of northern England during the early nineteenth century.")
+REWORDED = ("Rural economies were transformed by the industrial revolution as growing cities drew workers into "
+            "factories; across the textile mills of northern England in the early nineteenth century child labour "
+            "was common, housing crowded and wages low.")
+UNRELATED = ("Photosynthesis converts light energy into chemical energy stored in glucose, releasing oxygen as a "
+             "by-product, and takes place in the chloroplasts of plant cells that contain the pigment chlorophyll "
+             "which absorbs mostly blue and red light.")
+
+
+def test_query_finds_reworded_paragraph(tmp_path):
+    index = SemanticIndex(HashingEmbedder(), str(tmp_path))
+    index.add("original", ORIGINAL)
+    index.add("unrelated", UNRELATED)
+    result = index.query(REWORDED, exclude_id="reworded")
+    assert [m["submission_id"] for m in result["matches"]] == ["original"]
+    assert result["matches"][0]["coverage"] == 1.0
+    # Adding a submission again replaces its paragraphs
+    index.add("original", UNRELATED)
+    assert index.query(REWORDED)["matches"] == []
+    assert index.size() == 2
+
+
+def test_unavailable_model_falls_back_with_warning(monkeypatch, caplog):
+    class Unloadable:
+        def __init__(self, model_name):
+            raise ValueError("Could not load model")
+
+    monkeypatch.setattr(semantic_index, "FastEmbedEmbedder", Unloadable)
+    with caplog.at_level(logging.WARNING, logger="grader.semantic"):
+        embedder = get_embedder("BAAI/bge-small-en-v1.5")
+    assert isinstance(embedder, HashingEmbedder)
+    assert "falling back to lexical hashing" in caplog.text
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="grader.semantic"):
+        get_embedder("hashing")
+    assert caplog.text == ""
+
+
+def test_tool_output_names_the_backend():
+    from server import check_semantic_similarity_core
+
+    result = check_semantic_similarity_core(ORIGINAL, submission_id="tool-check")
+    assert (result["kind"], result["backend"], result["model"]) == ("lexical", "hashing", "hashing-512")
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import startup
+
+HEAVY = ("pymupdf", "openai", "docx", "plagiarism_index", "requests", "fuzzywuzzy", "tiktoken", "numpy",
+         "google.generativeai", "fastembed")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["server", "batch", "jobs"])
+def test_importing_does_not_load_heavy_dependencies(module):
+    check = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    completed = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, cwd=ROOT,
+                               env={**os.environ, "GRADER_PREWARM": "", "GRADER_METRICS_PORT": "0"})
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip() == ""
+
+
+def test_prewarm_loads_modules_and_the_tokenizer():
+    timings = startup.prewarm(("json", "not_a_module_anywhere"), background=False)
+    assert set(timings) == {"json", "tokenizer"}
+    thread = startup.prewarm(("json",))
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+
+
+def test_import_profile_reports_the_slowest_packages():
+    profile = startup.import_profile("chunking", top=3)
+    assert profile["module"] == "chunking"
+    assert 0 < profile["import_seconds"] <= profile["process_seconds"]
+    assert len(profile["packages"]) <= 3
+    with pytest.raises(RuntimeError, match="No module named"):
+        startup.import_profile("not_a_module_anywhere")
@@ -0,0 +1,58 @@
+import asyncio
+import urllib.error
+import urllib.request
+
+import pytest
+
+import telemetry
+from telemetry import MetricsRegistry, annotate, serve_metrics, traced
+
+
+def test_render_uses_the_prometheus_text_format():
+    registry = MetricsRegistry(buckets=(0.1, 1))
+    registry.count("grader_tokens_total", 12, stage="grade", kind="prompt")
+    registry.observe("grader_stage_seconds", 0.5, stage="grade", outcome="ok")
+    lines = registry.render().splitlines()
+    assert "# TYPE grader_tokens_total counter" in lines
+    assert 'grader_tokens_total{kind="prompt",stage="grade"} 12' in lines
+    assert 'grader_stage_seconds_bucket{outcome="ok",stage="grade",le="0.1"} 0' in lines
+    assert 'grader_stage_seconds_bucket{outcome="ok",stage="grade",le="1"} 1' in lines
+    assert 'grader_stage_seconds_count{outcome="ok",stage="grade"} 1' in lines
+
+
+def test_traced_records_spans_and_error_results(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(telemetry, "registry", registry)
+
+    @traced("demo", is_error=lambda result: "error" in result)
+    def work(fail):
+        annotate(prompt_tokens=7)
+        return {"error": "bad"} if fail else {}
+
+    @traced("demo_async")
+    async def boom():
+        raise KeyError("missing")
+
+    work(False)
+    work(True)
+    with pytest.raises(KeyError):
+        asyncio.run(boom())
+    assert registry._counters[("grader_tokens_total", (("kind", "prompt"), ("stage", "demo")))] == 14
+    assert registry._counters[("grader_stage_errors_total", (("error_class", "ReportedError"), ("stage", "demo")))] == 1
+    assert registry._counters[("grader_stage_errors_total", (("error_class", "KeyError"), ("stage", "demo_async")))] == 1
+    assert registry._histograms[("grader_stage_seconds", (("outcome", "ok"), ("stage", "demo")))]["count"] == 1
+
+
+def test_metrics_endpoint():
+    telemetry.count_cache_lookup("endpoint_test", True)
+    server = serve_metrics(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            body = response.read().decode("utf-8")
+        assert 'grader_cache_requests_total{namespace="endpoint_test",result="hit"} 1' in body
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
@@ -0,0 +1,82 @@
+import pytest
+import requests
+
+import telemetry
+import web_search
+from server import check_plagiarism_core
+from stubs import StubGoogleSearch
+
+SENTENCES = [f"Sentence {n} explains how the reparations schedule strained industrial production further." for n in range(10)]
+
+
+def search_retries():
+    return sum(telemetry.registry._counters.get(("grader_retries_total", (("service", "google_search"), ("status", status))), 0)
+               for status in ("429", "500"))
+
+
+@pytest.fixture
+def google(monkeypatch):
+    """Starts a search stub with the given options and points web_search at it without rate limits or delays."""
+    stubs = []
+
+    def start(**kwargs):
+        stub = StubGoogleSearch(latency_ms=1, jitter_ms=0, **kwargs).start()
+        stubs.append(stub)
+        monkeypatch.setattr(web_search, "SEARCH_URL", stub.search_url)
+        monkeypatch.setattr(web_search, "rate_limiter", web_search.RateLimiter(6000, burst=100))
+        monkeypatch.setattr(web_search, "_retry_delay", lambda response, attempt: 0)
+        monkeypatch.setenv("GOOGLE_API_KEY", "test")
+        monkeypatch.setenv("GOOGLE_CX", "test-cx")
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.stop()
+
+
+def test_sample_passages_spread_across_the_text():
+    passages = web_search.sample_passages(" ".join(SENTENCES), count=5)
+    assert [p.split()[1] for p in passages] == ["0", "2", "4", "6", "8"]
+    assert web_search.sample_passages("too short", count=5) == ["too short"]
+    long_sentence = " ".join(["word"] * 50) + "."
+    assert len(web_search.sample_passages(long_sentence)[0].split()) == web_search.MAX_QUERY_WORDS
+
+
+def test_retry_delay_prefers_retry_after():
+    class Response:
+        headers = {"Retry-After": "2.5"}
+
+    assert web_search._retry_delay(Response(), 0) == 2.5
+    assert 4 <= web_search._retry_delay(None, 3) <= 8
+    assert web_search._retry_delay(None, 10) <= 30
+
+
+def test_plagiarism_check_searches_passages_concurrently(google):
+    stub = google()
+    result = check_plagiarism_core(" ".join(SENTENCES), use_cache=False)
+    assert stub.counters["requests"] == 5
+    assert len(result) == 15
+    assert max(result.values()) == 100
+
+
+def test_failed_searches_are_retried_then_reported(google, monkeypatch):
+    stub = google(error_rate=1.0)
+    monkeypatch.setattr(web_search, "SEARCH_MAX_RETRIES", 2)
+    retries = search_retries()
+    with pytest.raises(requests.HTTPError):
+        web_search.search("a query", "test", "test-cx")
+    assert stub.counters["requests"] == 3
+    assert search_retries() - retries == 2
+
+    spans = []
+    finish = telemetry._finish_span
+    monkeypatch.setattr(telemetry, "_finish_span", lambda stage, span, *args: (spans.append(span), finish(stage, span, *args)))
+    result = check_plagiarism_core(" ".join(SENTENCES), use_cache=False)
+    assert result["error"].startswith("Plagiarism check failed")
+    # Searches run on pool threads, yet their retries land on the plagiarism span
+    assert spans[-1]["retries"] == 5 * 2
+
+
+def test_plagiarism_check_needs_configuration(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    assert "GOOGLE_API_KEY" in check_plagiarism_core("Some text to check.")["error"]
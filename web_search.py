@@ -0,0 +1,123 @@
+import os
+import random
+import re
+import threading
+import time
+
+from telemetry import count_response, count_retry
+
+# Point GOOGLE_SEARCH_URL at a local stand-in server to test without using quota
+SEARCH_URL = os.getenv("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+SEARCH_TIMEOUT = float(os.getenv("GOOGLE_SEARCH_TIMEOUT", "10"))
+# Custom Search allows 100 queries per minute per project by default
+SEARCH_QUERIES_PER_MINUTE = float(os.getenv("GOOGLE_SEARCH_QPM", "100"))
+SEARCH_MAX_RETRIES = int(os.getenv("GOOGLE_SEARCH_MAX_RETRIES", "4"))
+SEARCH_POOL_SIZE = 10
+
+# Google ignores query terms beyond the 32nd word
+MAX_QUERY_WORDS = 32
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+class RateLimiter:
+    """Thread-safe token bucket shared by every search issued from this process."""
+
+    def __init__(self, per_minute: float, burst: int = 5):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+rate_limiter = RateLimiter(SEARCH_QUERIES_PER_MINUTE)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Returns a process-wide session so concurrent searches reuse pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is only loaded once a plagiarism check runs
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=SEARCH_POOL_SIZE, pool_maxsize=SEARCH_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+def _retry_delay(response, attempt: int) -> float:
+    """Honours Retry-After when present, otherwise exponential backoff with jitter."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+
+def search(query: str, api_key: str, cse_id: str) -> dict:
+    """Runs one Custom Search query, retrying 429 and 5xx responses with backoff."""
+    import requests
+
+    params = {"key": api_key, "cx": cse_id, "q": query}
+    for attempt in range(SEARCH_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = None
+        try:
+            response = get_session().get(SEARCH_URL, params=params, timeout=SEARCH_TIMEOUT)
+            count_response("google_search", response.status_code)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response.json()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == SEARCH_MAX_RETRIES:
+                raise
+            failure = type(e).__name__
+        else:
+            failure = str(response.status_code)
+        if attempt < SEARCH_MAX_RETRIES:
+            count_retry("google_search", failure)
+            time.sleep(_retry_delay(response, attempt))
+    response.raise_for_status()
+    return response.json()
+
+def sample_passages(text: str, count: int = 5) -> list:
+    """Picks up to `count` distinctive sentences spread evenly across the document.
+
+    The text is divided into `count` segments and the sentence with the most long,
+    non-repeated words is taken from each, so queries cover the whole submission
+    rather than just its opening.
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.split(" ".join(text.split())) if len(s.split()) >= 8]
+    if not sentences:
+        words = text.split()
+        return [" ".join(words[:MAX_QUERY_WORDS])] if words else []
+
+    def distinctiveness(sentence):
+        words = [w.lower().strip(".,;:!?\"'()") for w in sentence.split()]
+        return len({w for w in words if len(w) > 6}) + 0.1 * len(set(words))
+
+    count = min(count, len(sentences))
+    segment = len(sentences) / count
+    passages = []
+    for i in range(count):
+        candidates = sentences[int(i * segment):int((i + 1) * segment)] or sentences[-1:]
+        best = max(candidates, key=distinctiveness)
+        passages.append(" ".join(best.split()[:MAX_QUERY_WORDS]))
+    return passages